@@ -0,0 +1,53 @@
+"""add bill_tax_summary table with per-HSN/per-rate tax breakup
+
+Revision ID: 7c3e91a4b2d0
+Revises: 2d6ad5d788bc
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3e91a4b2d0'
+down_revision = '2d6ad5d788bc'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'bill_tax_summary',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('bill_id', sa.Integer(), sa.ForeignKey('bill.id'), nullable=False),
+        sa.Column('hsn_code', sa.String(length=10), nullable=False),
+        sa.Column('gst_rate', sa.Numeric(precision=5, scale=2), nullable=False),
+        sa.Column('unit', sa.String(length=20), nullable=True),
+        sa.Column('quantity', sa.Numeric(precision=14, scale=3), nullable=False, server_default='0'),
+        sa.Column('taxable_amount', sa.Numeric(precision=14, scale=2), nullable=False, server_default='0'),
+        sa.Column('cgst_amount', sa.Numeric(precision=14, scale=2), nullable=False, server_default='0'),
+        sa.Column('sgst_amount', sa.Numeric(precision=14, scale=2), nullable=False, server_default='0'),
+        sa.Column('igst_amount', sa.Numeric(precision=14, scale=2), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.UniqueConstraint('bill_id', 'hsn_code', 'gst_rate', 'unit', name='uix_bill_tax_summary_line')
+    )
+    op.create_index('ix_bill_tax_summary_bill_id', 'bill_tax_summary', ['bill_id'])
+    
+    # Backfill the breakup for existing bills from their items
+    op.execute("""
+        INSERT INTO bill_tax_summary
+            (bill_id, hsn_code, gst_rate, unit, quantity, taxable_amount,
+             cgst_amount, sgst_amount, igst_amount, created_at, updated_at)
+        SELECT bill_id, hsn_code, gst_rate, unit,
+               SUM(quantity), SUM(amount), SUM(cgst_amount), SUM(sgst_amount), SUM(igst_amount),
+               CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+        FROM bill_item
+        GROUP BY bill_id, hsn_code, gst_rate, unit
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_bill_tax_summary_bill_id', table_name='bill_tax_summary')
+    op.drop_table('bill_tax_summary')
@@ -0,0 +1,61 @@
+"""add tax_daily_aggregate table for GST summary reports
+
+Revision ID: 4f8a2d61c9e3
+Revises: 7c3e91a4b2d0
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f8a2d61c9e3'
+down_revision = '7c3e91a4b2d0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_bill_bill_date', 'bill', ['bill_date'])
+    
+    op.create_table(
+        'tax_daily_aggregate',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('bill_date', sa.Date(), nullable=False),
+        sa.Column('hsn_code', sa.String(length=10), nullable=False),
+        sa.Column('gst_rate', sa.Numeric(precision=5, scale=2), nullable=False),
+        sa.Column('unit', sa.String(length=20), nullable=True),
+        sa.Column('state_code', sa.String(length=2), nullable=True),
+        sa.Column('is_b2b', sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column('quantity', sa.Numeric(precision=16, scale=3), nullable=False, server_default='0'),
+        sa.Column('taxable_amount', sa.Numeric(precision=16, scale=2), nullable=False, server_default='0'),
+        sa.Column('cgst_amount', sa.Numeric(precision=16, scale=2), nullable=False, server_default='0'),
+        sa.Column('sgst_amount', sa.Numeric(precision=16, scale=2), nullable=False, server_default='0'),
+        sa.Column('igst_amount', sa.Numeric(precision=16, scale=2), nullable=False, server_default='0'),
+        sa.UniqueConstraint('bill_date', 'hsn_code', 'gst_rate', 'unit', 'state_code', 'is_b2b',
+                            name='uix_tax_daily_aggregate_key')
+    )
+    
+    # Backfill from the stored per-bill tax breakup (cancelled bills are excluded)
+    op.execute("""
+        INSERT INTO tax_daily_aggregate
+            (bill_date, hsn_code, gst_rate, unit, state_code, is_b2b,
+             quantity, taxable_amount, cgst_amount, sgst_amount, igst_amount)
+        SELECT b.bill_date, s.hsn_code, s.gst_rate, s.unit,
+               COALESCE(NULLIF(c.state_code, ''), (SELECT state_code FROM company_config LIMIT 1)),
+               CASE WHEN c.gst_number IS NOT NULL AND c.gst_number != '' THEN TRUE ELSE FALSE END,
+               SUM(s.quantity), SUM(s.taxable_amount), SUM(s.cgst_amount), SUM(s.sgst_amount), SUM(s.igst_amount)
+        FROM bill_tax_summary s
+        JOIN bill b ON b.id = s.bill_id
+        JOIN customer c ON c.id = b.customer_id
+        WHERE b.status != 'Cancelled'
+        GROUP BY b.bill_date, s.hsn_code, s.gst_rate, s.unit,
+                 COALESCE(NULLIF(c.state_code, ''), (SELECT state_code FROM company_config LIMIT 1)),
+                 CASE WHEN c.gst_number IS NOT NULL AND c.gst_number != '' THEN TRUE ELSE FALSE END
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('tax_daily_aggregate')
+    op.drop_index('ix_bill_bill_date', table_name='bill')
@@ -0,0 +1,62 @@
+"""add job table and customer dedupe indexes for bulk imports
+
+Revision ID: 9b1e6f3c7a28
+Revises: 4f8a2d61c9e3
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b1e6f3c7a28'
+down_revision = '4f8a2d61c9e3'
+branch_labels = None
+depends_on = None
+
+GSTIN_KEY_WHERE = "gst_number IS NOT NULL AND gst_number <> ''"
+PHONE_KEY_WHERE = ("is_guest = false AND (gst_number IS NULL OR gst_number = '') "
+                   "AND phone IS NOT NULL AND phone <> ''")
+
+
+def upgrade() -> None:
+    op.create_table(
+        'job',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('kind', sa.String(length=50), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='queued'),
+        sa.Column('params', sa.JSON(), nullable=True),
+        sa.Column('progress_current', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('progress_total', sa.Integer(), nullable=True),
+        sa.Column('result', sa.JSON(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_by', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+    )
+    
+    # The unique indexes cannot be built over duplicate customers; stop with a clear
+    # message instead of an opaque integrity error so they can be merged first
+    conn = op.get_bind()
+    for column, where in (('gst_number', GSTIN_KEY_WHERE), ('phone', PHONE_KEY_WHERE)):
+        duplicates = conn.execute(sa.text(
+            f"SELECT {column}, COUNT(*) FROM customer WHERE {where} GROUP BY {column} HAVING COUNT(*) > 1"
+        )).fetchall()
+        if duplicates:
+            sample = ', '.join(str(row[0]) for row in duplicates[:10])
+            raise RuntimeError(f"{len(duplicates)} {column} value(s) are shared by several customers "
+                               f"(e.g. {sample}); merge or correct them before upgrading")
+    
+    op.create_index('uix_customer_gst_number', 'customer', ['gst_number'], unique=True,
+                    postgresql_where=sa.text(GSTIN_KEY_WHERE), sqlite_where=sa.text(GSTIN_KEY_WHERE))
+    op.create_index('uix_customer_phone', 'customer', ['phone'], unique=True,
+                    postgresql_where=sa.text(PHONE_KEY_WHERE), sqlite_where=sa.text(PHONE_KEY_WHERE))
+
+
+def downgrade() -> None:
+    op.drop_index('uix_customer_phone', table_name='customer')
+    op.drop_index('uix_customer_gst_number', table_name='customer')
+    op.drop_table('job')
@@ -0,0 +1,39 @@
+"""add queue columns to job for workers, retries and result expiry
+
+Revision ID: 2d7c4e9a5b16
+Revises: 9b1e6f3c7a28
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d7c4e9a5b16'
+down_revision = '9b1e6f3c7a28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('job', sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('job', sa.Column('max_attempts', sa.Integer(), nullable=False, server_default='1'))
+    op.add_column('job', sa.Column('run_after', sa.DateTime(), nullable=True))
+    op.add_column('job', sa.Column('locked_by', sa.String(length=100), nullable=True))
+    op.add_column('job', sa.Column('expires_at', sa.DateTime(), nullable=True))
+    
+    # Jobs from before the queue existed already ran once
+    op.execute("UPDATE job SET attempts = 1 WHERE status <> 'queued'")
+    op.execute("UPDATE job SET run_after = created_at")
+    
+    op.create_index('ix_job_status_run_after', 'job', ['status', 'run_after'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_job_status_run_after', table_name='job')
+    op.drop_column('job', 'expires_at')
+    op.drop_column('job', 'locked_by')
+    op.drop_column('job', 'run_after')
+    op.drop_column('job', 'max_attempts')
+    op.drop_column('job', 'attempts')
@@ -0,0 +1,49 @@
+"""add sync_change table, the change feed of the mobile sync API
+
+Revision ID: 6e2b8f4d1a73
+Revises: 2d7c4e9a5b16
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e2b8f4d1a73'
+down_revision = '2d7c4e9a5b16'
+branch_labels = None
+depends_on = None
+
+# (entity, table), parents first
+SYNC_TABLES = (
+    ('company', 'company_config'),
+    ('customer', 'customer'),
+    ('product', 'product'),
+    ('bill', 'bill'),
+    ('bill_item', 'bill_item'),
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        'sync_change',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), primary_key=True),
+        sa.Column('entity', sa.String(length=20), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('operation', sa.String(length=10), nullable=False),
+        sa.Column('changed_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_sync_change_entity', 'sync_change', ['entity', 'entity_id'])
+    
+    # Start the feed with every existing record, so a device syncing from 0 gets everything
+    for entity, table in SYNC_TABLES:
+        op.execute(f"""
+            INSERT INTO sync_change (entity, entity_id, operation, changed_at)
+            SELECT '{entity}', id, 'upsert', CURRENT_TIMESTAMP FROM {table} ORDER BY id
+        """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sync_change_entity', table_name='sync_change')
+    op.drop_table('sync_change')
@@ -0,0 +1,53 @@
+"""add device and device_number_block tables and offline bill columns
+
+Revision ID: 8a4c2e6f0b95
+Revises: 6e2b8f4d1a73
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4c2e6f0b95'
+down_revision = '6e2b8f4d1a73'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'device',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('device_uid', sa.String(length=64), nullable=False, unique=True),
+        sa.Column('name', sa.String(length=100), nullable=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('last_seen_at', sa.DateTime(), nullable=True),
+    )
+    op.create_table(
+        'device_number_block',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('device_id', sa.Integer(), sa.ForeignKey('device.id'), nullable=False),
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('start_number', sa.Integer(), nullable=False),
+        sa.Column('end_number', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_device_number_block_device_id', 'device_number_block', ['device_id'])
+    
+    op.add_column('bill', sa.Column('device_id', sa.Integer(), nullable=True))
+    op.add_column('bill', sa.Column('client_ref', sa.String(length=64), nullable=True))
+    op.create_foreign_key('fk_bill_device_id', 'bill', 'device', ['device_id'], ['id'])
+    op.create_unique_constraint('uix_bill_device_client_ref', 'bill', ['device_id', 'client_ref'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uix_bill_device_client_ref', 'bill', type_='unique')
+    op.drop_constraint('fk_bill_device_id', 'bill', type_='foreignkey')
+    op.drop_column('bill', 'client_ref')
+    op.drop_column('bill', 'device_id')
+    op.drop_index('ix_device_number_block_device_id', table_name='device_number_block')
+    op.drop_table('device_number_block')
+    op.drop_table('device')
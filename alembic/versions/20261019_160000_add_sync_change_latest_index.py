@@ -0,0 +1,23 @@
+"""add an (entity, id) index on sync_change for the catalogue version of the product APIs
+
+Revision ID: 3f9a1c7e5d28
+Revises: 8a4c2e6f0b95
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c7e5d28'
+down_revision = '8a4c2e6f0b95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_sync_change_entity_latest', 'sync_change', ['entity', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sync_change_entity_latest', table_name='sync_change')
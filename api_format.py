@@ -0,0 +1,132 @@
+"""
+Wire formats of the JSON API.
+
+The app's JSON provider encodes with orjson when it is installed (the
+standard library otherwise), always compact and unsorted, with one encoding
+of the values the models return: Decimal amounts as numbers and dates,
+datetimes and times as ISO 8601 strings (Flask's default sends Decimals as
+strings and dates as HTTP dates).
+
+API endpoints built with ``api_response`` also speak MessagePack: a client
+sending ``Accept: application/msgpack`` gets the same payload in it, which
+is smaller and faster to decode on a phone. Browsers keep getting JSON.
+orjson and msgpack are both optional.
+"""
+
+import gzip
+import json
+from datetime import date, time
+from decimal import Decimal
+from flask import request, current_app
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+
+# Responses smaller than this are sent uncompressed
+GZIP_MIN_BYTES = 1024
+
+
+def encode_value(value):
+    """Encode a value JSON and MessagePack have no type for"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    return DefaultJSONProvider.default(value)
+
+
+def dumps_json(obj):
+    """Compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=encode_value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=encode_value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def dumps_msgpack(obj):
+    """MessagePack bytes, with the same value encoding as dumps_json"""
+    return msgpack.packb(obj, default=encode_value, use_bin_type=True, datetime=False)
+
+
+class APIJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider using dumps_json (and orjson to parse request bodies)"""
+
+    sort_keys = False
+    ensure_ascii = False
+    default = staticmethod(encode_value)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Caller-specific options (indent, separators) need the standard library
+            kwargs.setdefault('default', encode_value)
+            kwargs.setdefault('ensure_ascii', False)
+            return json.dumps(obj, **kwargs)
+        return dumps_json(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        # Compact even in debug mode, encoded to bytes once
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_json(obj), mimetype=self.mimetype)
+
+
+def negotiate(accept):
+    """
+    The response mimetype for an Accept header: a MessagePack type when the
+    client prefers it over JSON and msgpack is installed, JSON otherwise.
+
+    Args:
+        accept (MIMEAccept or str): Parsed or raw Accept header
+    """
+    if msgpack is None or not accept:
+        return JSON_MIMETYPE
+    if isinstance(accept, str):
+        accept = parse_accept_header(accept, MIMEAccept)
+    json_quality = accept.quality(JSON_MIMETYPE)
+    best = max(MSGPACK_MIMETYPES, key=accept.quality)
+    return best if accept.quality(best) > json_quality else JSON_MIMETYPE
+
+
+def encode_payload(payload, accept):
+    """(body, mimetype) of a payload in the format negotiated for an Accept header"""
+    mimetype = negotiate(accept)
+    if mimetype == JSON_MIMETYPE:
+        return dumps_json(payload), mimetype
+    return dumps_msgpack(payload), mimetype
+
+
+def api_response(payload, status=200, compress=False):
+    """
+    An API response in JSON or MessagePack, as the request's Accept header asks.
+
+    Args:
+        payload: The response data
+        status (int): HTTP status
+        compress (bool): Gzip the body when the client accepts it and it is
+            at least GZIP_MIN_BYTES (for large sync payloads)
+    """
+    body, mimetype = encode_payload(payload, request.accept_mimetypes)
+    response = current_app.response_class(body, status=status, mimetype=mimetype)
+    response.vary.add('Accept')
+    if compress:
+        if len(body) >= GZIP_MIN_BYTES and 'gzip' in request.accept_encodings:
+            response.set_data(gzip.compress(body, compresslevel=6))
+            response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+    return response
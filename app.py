@@ -13,6 +13,10 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
 from extensions import db
+from db_pool import pool_settings, engine_options, instrument_engine
+from sql_profiler import init_sql_profiler
+from metrics import init_metrics, register_lru_cache
+from api_format import APIJSONProvider
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -21,6 +25,8 @@ logging.basicConfig(level=logging.DEBUG)
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+# orjson-backed JSON with ISO dates and numeric Decimals (see api_format.py)
+app.json = APIJSONProvider(app)
 
 # Enable debug mode
 app.config['DEBUG'] = True
@@ -28,10 +34,14 @@ app.config['PROPAGATE_EXCEPTIONS'] = True  # Propagate exceptions to see detaile
 
 # Configure the database
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+# Pool sizing per deployment profile (DB_POOL_PROFILE, see db_pool.py)
+app.config["DB_POOL_SETTINGS"] = pool_settings()
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"],
+                                                         app.config["DB_POOL_SETTINGS"]["profile"])
+
+# Per-request SQL profiling: /admin/perf, the 'perf' log and X-DB-* headers in debug mode
+app.config['SQL_PROFILER_ENABLED'] = os.environ.get('SQL_PROFILER_ENABLED', '1') != '0'
+app.config['SQL_SLOW_QUERY_MS'] = int(os.environ.get('SQL_SLOW_QUERY_MS', 100))
 
 # Configure upload folder
 app.config['UPLOAD_FOLDER'] = 'uploads'
@@ -40,6 +50,18 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 # Create upload directory if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Background jobs: 'thread' runs queued jobs inside the web process, 'worker'
+# leaves them to `python db_manage.py worker` processes
+app.config['JOB_QUEUE_MODE'] = os.environ.get('JOB_QUEUE_MODE', 'thread')
+app.config['JOB_RESULT_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], 'job_results')
+app.config['JOB_RESULT_TTL'] = int(os.environ.get('JOB_RESULT_TTL', 24 * 3600))  # seconds
+app.config['JOB_RETRY_DELAY'] = 30  # seconds, doubled on each retry
+app.config['JOB_STALE_AFTER'] = 30 * 60  # seconds without progress before a running job is requeued
+app.config['JOB_MAINTENANCE_INTERVAL'] = 5 * 60  # seconds between job cleanups in 'thread' mode
+app.config['EXPORT_SYNC_LIMIT'] = 1000  # larger bill exports run as background jobs
+app.config['SYNC_SNAPSHOT_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], 'sync_snapshots')
+app.config['SYNC_SNAPSHOT_BILL_DAYS'] = int(os.environ.get('SYNC_SNAPSHOT_BILL_DAYS', 90))  # bills sent to new devices
+
 # Configure WTF CSRF protection
 app.config['WTF_CSRF_TIME_LIMIT'] = None  # No time limit for CSRF tokens
 app.config['WTF_CSRF_SSL_STRICT'] = False  # Allow non-HTTPS in development
@@ -65,18 +87,33 @@ def load_user(user_id):
     return User.query.get(int(user_id))
 
 # Register template filters
-from utils import number_to_words, format_currency
+from utils import number_to_words, amount_in_words, format_currency
 app.jinja_env.filters['number_to_words'] = number_to_words
+app.jinja_env.filters['amount_in_words'] = amount_in_words
 app.jinja_env.filters['format_currency'] = format_currency
 
+# Prometheus metrics (see metrics.py), including the formatter caches' hit ratios
+init_metrics(app)
+from utils import format_indian_number
+register_lru_cache('format_indian_number', format_indian_number)
+register_lru_cache('number_to_words', number_to_words)
+register_lru_cache('amount_in_words', amount_in_words)
+
 with app.app_context():
     # Import models to ensure tables are created
     import models  # noqa: F401
+    instrument_engine(db.engine)
+    init_sql_profiler(app, db.engine)
     db.create_all()
 
 # Import routes
 import routes  # noqa: F401
 import field_routes  # noqa: F401
+import report_routes  # noqa: F401
+import import_routes  # noqa: F401
+import job_routes  # noqa: F401
+import monitoring_routes  # noqa: F401
+import sync_routes  # noqa: F401
 
 # Initialize default fields
 from field_utils import initialize_default_fields
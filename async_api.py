@@ -0,0 +1,340 @@
+"""
+Async API tier for the bill form's product lookups.
+
+The product typeahead on the bill form sends a search per keystroke from
+every user creating bills. Behind sync gunicorn workers each of those
+requests holds a whole worker while it waits on the database. This module
+is an ASGI application serving the same read-only endpoints with
+SQLAlchemy's asyncio engine (asyncpg on PostgreSQL, aiosqlite on SQLite),
+so a single worker keeps many lookups in flight:
+
+    GET /api/products/search?term=&category=
+    GET /api/products/recent
+    GET /api/products/<id>
+    GET /csrf-token
+
+The handlers run the same statements as the Flask routes (query_profiles)
+over the same models, and authenticate with the Flask session cookie (or
+the Flask-Login remember cookie), so pages served by Flask call them
+unchanged. Product responses carry the same ETag and Last-Modified
+validators as the Flask routes (http_cache.py), and a client whose copy is
+current gets a 304. Deploy it next to the Flask workers and route those
+paths to it at the reverse proxy:
+
+    uvicorn async_api:asgi_app --host 0.0.0.0 --port 5001 --workers 4
+
+Any other path is handed to the Flask app (through asgiref, if installed),
+so the tier can also be run on its own in development. Flask requests served
+that way run one at a time in asgiref's worker thread; production traffic
+for the rest of the app should go to gunicorn.
+
+The async engine uses ASYNC_DATABASE_URL if set, otherwise DATABASE_URL
+with its driver swapped for the async one; ASYNC_DB_POOL_SIZE and
+ASYNC_DB_MAX_OVERFLOW size its connection pool.
+"""
+
+import os
+import re
+import hashlib
+from urllib.parse import parse_qs
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.http import dump_cookie, parse_cookie, parse_etags, parse_date, quote_etag, http_date
+from flask_login.utils import decode_cookie
+from app import app as flask_app
+from api_format import encode_payload, negotiate
+from http_cache import (response_validators, validators_match, product_version_query, product_version_from_row,
+                        catalogue_version_query, catalogue_version_from_row)
+from models import User
+from query_profiles import (product_search_query, product_custom_field_search_query, recent_products_query,
+                            product_detail_query, searchable_fields_query, product_api_payload)
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:
+    WsgiToAsgi = None
+
+# Sync driver backend -> async driver
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_database_url(database_url):
+    """
+    Work out the async-driver URL for the application database.
+
+    Args:
+        database_url (str): The application's DATABASE_URL
+
+    Returns:
+        URL: ASYNC_DATABASE_URL if set, otherwise database_url with an async driver
+
+    Raises:
+        ValueError: If the database has no supported async driver
+    """
+    if os.environ.get('ASYNC_DATABASE_URL'):
+        return make_url(os.environ['ASYNC_DATABASE_URL'])
+    if database_url.startswith('postgres://'):
+        database_url = 'postgresql://' + database_url[len('postgres://'):]
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver for '{backend}' databases; set ASYNC_DATABASE_URL")
+    query = dict(url.query)
+    if backend == 'postgresql' and 'sslmode' in query:
+        # asyncpg takes libpq's sslmode values as 'ssl'
+        query['ssl'] = query.pop('sslmode')
+    return url.set(drivername=ASYNC_DRIVERS[backend], query=query)
+
+
+class APIRequest:
+    """The parts of an ASGI HTTP request the API handlers use"""
+
+    def __init__(self, scope, session_interface):
+        self.scope = scope
+        self.method = scope['method']
+        self.args = {key: values[0] for key, values in
+                     parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+        self.accept = self.header(b'accept')
+        self.cookies = parse_cookie(self.header(b'cookie', '; '))
+        self.session = session_interface.load(self.cookies)
+        self.session_modified = False
+
+    def header(self, name, separator=', '):
+        """The values of a request header joined into one string ('' if absent)"""
+        return separator.join(value.decode('latin-1') for key, value in self.scope.get('headers', ())
+                              if key == name)
+
+
+class FlaskSession:
+    """
+    Reads and writes the Flask session cookie the way Flask's default
+    SecureCookieSessionInterface does, with the app's own key and settings.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.interface = app.session_interface
+        self.serializer = self.interface.get_signing_serializer(app)
+        self.cookie_name = app.config['SESSION_COOKIE_NAME']
+        self.max_age = int(app.permanent_session_lifetime.total_seconds())
+
+    def load(self, cookies):
+        """The session stored in the request cookies (empty if missing or tampered with)"""
+        value = cookies.get(self.cookie_name)
+        if not value or self.serializer is None:
+            return self.interface.session_class()
+        try:
+            return self.interface.session_class(self.serializer.loads(value, max_age=self.max_age))
+        except BadSignature:
+            return self.interface.session_class()
+
+    def cookie_header(self, session):
+        """Set-Cookie header value saving session"""
+        # Every Flask request marks the session permanent (routes.make_session_permanent)
+        session.permanent = True
+        app = self.app
+        return dump_cookie(
+            self.cookie_name, self.serializer.dumps(dict(session)),
+            expires=self.interface.get_expiration_time(app, session),
+            domain=self.interface.get_cookie_domain(app),
+            path=self.interface.get_cookie_path(app),
+            secure=self.interface.get_cookie_secure(app),
+            httponly=self.interface.get_cookie_httponly(app),
+            samesite=self.interface.get_cookie_samesite(app),
+            partitioned=self.interface.get_cookie_partitioned(app),
+        )
+
+
+class AsyncAPI:
+    """
+    ASGI application serving the product lookup endpoints asynchronously and
+    passing every other request to the Flask app.
+
+    Args:
+        app (Flask): The Flask application whose config, session and routes are shared
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.engine = None
+        self.sessions = FlaskSession(app)
+        self.csrf_serializer = URLSafeTimedSerializer(app.config.get('WTF_CSRF_SECRET_KEY') or app.secret_key,
+                                                      salt='wtf-csrf-token')
+        self.fallback = WsgiToAsgi(app) if WsgiToAsgi is not None else None
+        # (path pattern, handler, login required, version of the response or None)
+        self.routes = (
+            (re.compile(r'/api/products/search'), self.search_products, True, self.catalogue_version),
+            (re.compile(r'/api/products/recent'), self.recent_products, True, self.catalogue_version),
+            (re.compile(r'/api/products/(?P<product_id>\d+)'), self.get_product, False, self.product_version),
+            (re.compile(r'/csrf-token'), self.csrf_token, False, None),
+        )
+
+    def get_engine(self):
+        """The async engine, created on first use inside the running event loop"""
+        if self.engine is None:
+            self.engine = create_async_engine(
+                async_database_url(self.app.config['SQLALCHEMY_DATABASE_URI']),
+                pool_size=int(os.environ.get('ASYNC_DB_POOL_SIZE', 10)),
+                max_overflow=int(os.environ.get('ASYNC_DB_MAX_OVERFLOW', 10)),
+                pool_recycle=300,
+                pool_pre_ping=True,
+            )
+        return self.engine
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            for pattern, handler, login, version in self.routes:
+                match = pattern.fullmatch(scope['path'])
+                if match:
+                    await self.dispatch(scope, send, handler, login, version, match.groupdict())
+                    return
+        if self.fallback is None:
+            await self.send_json(scope, send, 404, {'error': 'Not found'})
+            return
+        await self.fallback(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.engine is not None:
+                    await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def dispatch(self, scope, send, handler, login, version, params):
+        """
+        Authenticate and run a handler, turning its result or error into a JSON
+        response. Handlers with a version function get validators, and are not
+        run when the client's copy is current (a 304 is sent instead).
+        """
+        request = APIRequest(scope, self.sessions)
+        cache_headers = []
+        try:
+            if login and not await self.current_user_id(request):
+                status, payload = 401, {'error': 'Authentication required'}
+            else:
+                validator = await version(**params) if version is not None else None
+                if validator is not None:
+                    etag, last_modified = response_validators(*validator, negotiate(request.accept))
+                    cache_headers = [(b'etag', quote_etag(etag, weak=True).encode('latin-1')),
+                                     (b'cache-control', b'private, no-cache')]
+                    if last_modified:
+                        cache_headers.append((b'last-modified', http_date(last_modified).encode('latin-1')))
+                    if validators_match(etag, last_modified, parse_etags(request.header(b'if-none-match') or None),
+                                        parse_date(request.header(b'if-modified-since') or None)):
+                        await self.send_not_modified(send, cache_headers)
+                        return
+                status, payload = await handler(request, **params)
+        except Exception as e:
+            self.app.logger.exception(f"Error in async API {scope['path']}")
+            status, payload = 500, {
+                'error': 'An error occurred while processing the request',
+                'details': str(e) if self.app.debug else 'Enable debug mode for more details',
+            }
+        headers = cache_headers if status == 200 else []
+        if request.session_modified:
+            headers.append((b'set-cookie', self.sessions.cookie_header(request.session).encode('latin-1')))
+        await self.send_json(scope, send, status, payload, headers)
+
+    async def send_not_modified(self, send, headers):
+        await send({'type': 'http.response.start', 'status': 304,
+                    'headers': [(b'vary', b'Cookie, Accept'), *headers]})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def send_json(self, scope, send, status, payload, headers=()):
+        """Send a payload as JSON, or MessagePack when the Accept header asks for it (api_format.py)"""
+        accept = ', '.join(value.decode('latin-1') for name, value in scope.get('headers', ()) if name == b'accept')
+        body, mimetype = encode_payload(payload, accept)
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', mimetype.encode('latin-1')),
+                (b'content-length', str(len(body)).encode('latin-1')),
+                (b'vary', b'Cookie, Accept'),
+                *headers,
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body if scope['method'] != 'HEAD' else b''})
+
+    async def current_user_id(self, request):
+        """
+        Id of the logged-in user, from the session or the remember-me cookie,
+        or None if there is none or the account has been deactivated.
+        """
+        user_id = request.session.get('_user_id')
+        if user_id is None:
+            remember = request.cookies.get(self.app.config.get('REMEMBER_COOKIE_NAME', 'remember_token'))
+            if remember and request.session.get('_remember') != 'clear':
+                user_id = decode_cookie(remember, key=self.app.secret_key)
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        async with self.get_engine().connect() as conn:
+            is_active = (await conn.execute(select(User.is_active).where(User.id == user_id))).scalar()
+        return user_id if is_active else None
+
+    async def catalogue_version(self):
+        """http_cache.catalogue_version on the async engine"""
+        async with self.get_engine().connect() as conn:
+            return catalogue_version_from_row((await conn.execute(catalogue_version_query())).one())
+
+    async def product_version(self, product_id):
+        """http_cache.product_version on the async engine (None for an unknown product)"""
+        async with self.get_engine().connect() as conn:
+            row = (await conn.execute(product_version_query(int(product_id)))).first()
+        return product_version_from_row(int(product_id), row)
+
+    async def search_products(self, request):
+        """Async twin of routes.search_products_api"""
+        term = request.args.get('term', '').strip()
+        category = request.args.get('category', '')
+        async with self.get_engine().connect() as conn:
+            products = (await conn.execute(product_search_query(term, category))).all()
+            searchable_fields = (await conn.execute(searchable_fields_query('product'))).all()
+            if term and searchable_fields:
+                found_ids = {p.id for p in products}
+                products += (await conn.execute(product_custom_field_search_query(
+                    term, [field.id for field in searchable_fields], found_ids))).all()
+        return 200, {'products': [product_api_payload(p, searchable_fields) for p in products]}
+
+    async def recent_products(self, request):
+        """Async twin of routes.recent_products_api"""
+        async with self.get_engine().connect() as conn:
+            products = (await conn.execute(recent_products_query())).all()
+            searchable_fields = (await conn.execute(searchable_fields_query('product'))).all()
+        return 200, {'products': [product_api_payload(p, searchable_fields) for p in products]}
+
+    async def get_product(self, request, product_id):
+        """Async twin of routes.get_product_api"""
+        async with self.get_engine().connect() as conn:
+            row = (await conn.execute(product_detail_query(int(product_id)))).first()
+        if row is None:
+            return 404, {'error': 'Product not found'}
+        return 200, {'product': product_api_payload(row)}
+
+    async def csrf_token(self, request):
+        """
+        Async twin of routes.csrf_token: signs the session's CSRF secret the
+        way Flask-WTF does, so the token validates on Flask's form posts.
+        """
+        field_name = self.app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token')
+        if field_name not in request.session:
+            request.session[field_name] = hashlib.sha1(os.urandom(64)).hexdigest()
+            request.session_modified = True
+        return 200, {'csrf_token': self.csrf_serializer.dumps(request.session[field_name])}
+
+
+asgi_app = AsyncAPI(flask_app)
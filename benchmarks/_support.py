@@ -0,0 +1,133 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Benchmarks run against the database in DATABASE_URL, or a throwaway SQLite
+file when it is not set, so they can be run on a laptop without PostgreSQL.
+"""
+
+import os
+import sys
+import time
+import logging
+import statistics
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+
+# Make the application importable when run as `python benchmarks/<script>.py`
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+if not os.environ.get("DATABASE_URL"):
+    _db_file = os.path.join(tempfile.mkdtemp(prefix="gst_bench_"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{_db_file}"
+os.environ.setdefault("SESSION_SECRET", "benchmark")
+
+# Static paths (the invoice PDF fonts) are relative to the repository root;
+# paths given on the command line are relative to INVOCATION_DIR
+INVOCATION_DIR = os.getcwd()
+os.chdir(ROOT)
+
+from app import app, db  # noqa: E402
+
+# app.py enables DEBUG logging globally; keep benchmark output readable
+logging.getLogger().setLevel(logging.WARNING)
+
+
+def timed(fn, repeat=5, warmup=1):
+    """
+    Run fn repeatedly and return timing statistics in milliseconds.
+
+    Returns:
+        dict: {'min': ms, 'median': ms, 'max': ms, 'runs': repeat}
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'max': max(samples),
+        'runs': repeat,
+    }
+
+
+class QueryCounter:
+    """Context manager counting SQL statements executed on the engine"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+        return False
+
+
+def seed_basic_data(customers=50, products=100, bills=500, items_per_bill=3):
+    """
+    Populate a small synthetic data set if the bill table is empty.
+
+    Bills are spread over the last year across the generated customers so
+    list views and filters have realistic cardinality.
+    """
+    from models import Company, Customer, Product, Category, Bill
+
+    if Bill.query.count() >= bills:
+        return
+
+    if not Company.query.first():
+        db.session.add(Company(name="Bench Co", address="1 Bench Road",
+                               gst_number="29AABCB1234A1ZE", state_code="29"))
+
+    categories = [Category(category_name=f"Category {i}") for i in range(10)]
+    db.session.add_all(categories)
+    db.session.flush()
+
+    customer_rows = [Customer(name=f"Customer {i}", state_code="29" if i % 3 else "27",
+                              is_guest=(i % 10 == 0))
+                     for i in range(customers)]
+    product_rows = [Product(name=f"Product {i}", price=Decimal("100.00") + i, hsn_code=f"{6100 + i % 50}",
+                            gst_rate=Decimal("18"), cgst_rate=Decimal("9"), sgst_rate=Decimal("9"),
+                            category_id=categories[i % len(categories)].id)
+                    for i in range(products)]
+    db.session.add_all(customer_rows + product_rows)
+    db.session.flush()
+
+    from bill_utils import reconcile_bill_items, apply_bill_totals
+
+    today = date.today()
+    for n in range(bills):
+        customer = customer_rows[n % customers]
+        bill = Bill(bill_number=f"BENCH-{n:07d}", customer_id=customer.id,
+                    bill_date=today - timedelta(days=n % 365), status="Draft")
+        lines = []
+        for k in range(items_per_bill):
+            product = product_rows[(n + k) % products]
+            lines.append({'product_id': product.id, 'product_name': product.name,
+                          'description': '', 'hsn_code': product.hsn_code, 'unit': 'Nos',
+                          'quantity': Decimal("2"), 'rate': product.price, 'gst_rate': product.gst_rate})
+        reconcile_bill_items(bill, lines, "29", customer.state_code)
+        apply_bill_totals(bill)
+        db.session.add(bill)
+    db.session.commit()
+
+
+def print_result(label, result, queries=None):
+    """Print a single benchmark line"""
+    extra = f"  queries={queries}" if queries is not None else ""
+    print(f"{label:<45} min={result['min']:8.2f}ms  median={result['median']:8.2f}ms{extra}")
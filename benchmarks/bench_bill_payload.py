@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Benchmark validating a bill: BillForm (a nested WTForms form per line, each
+with a product SelectField over the catalogue) versus the compiled JSON
+payload validator in bill_payload.py.
+
+Only validation is timed; both produce the same header values and lines
+for bill_utils.
+
+Usage:
+    python benchmarks/bench_bill_payload.py
+"""
+
+from datetime import date
+from decimal import Decimal
+
+from _support import app, timed, print_result
+from werkzeug.datastructures import MultiDict
+from forms import BillForm
+from bill_utils import line_from_form, header_from_form
+from bill_payload import validate_bill_payload
+
+LINE_COUNTS = (10, 100, 500)
+CATALOGUE_SIZE = 2000
+
+
+def sample_lines(count):
+    return [{'product_id': n % CATALOGUE_SIZE + 1, 'product_name': f"Product {n}", 'description': '',
+             'hsn_code': '7318', 'unit': 'Nos', 'quantity': str(n % 7 + 1),
+             'rate': f"{100 + n}.50", 'gst_rate': '18'} for n in range(count)]
+
+
+def form_data(lines):
+    data = MultiDict({'customer_id': '1', 'bill_date': date.today().isoformat(), 'status': 'Draft',
+                      'discount_type': 'none', 'discount_value': '0', 'notes': ''})
+    for index, line in enumerate(lines):
+        for name, value in line.items():
+            data[f"items-{index}-{name}"] = str(value)
+    return data
+
+
+def json_payload(lines):
+    return {'customer_id': 1, 'bill_date': date.today().isoformat(), 'status': 'Draft',
+            'items': {name: [line[name] for line in lines] for name in lines[0]}}
+
+
+def main():
+    customer_choices = [(n, f"Customer {n}") for n in range(1, 501)]
+    product_choices = [(0, 'Select Product')] + [(n, f"Product {n} - ₹{Decimal(n)}")
+                                                 for n in range(1, CATALOGUE_SIZE + 1)]
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    for count in LINE_COUNTS:
+        lines = sample_lines(count)
+        data = form_data(lines)
+        payload = json_payload(lines)
+
+        def wtforms_path():
+            form = BillForm(formdata=data)
+            form.customer_id.choices = customer_choices
+            for item_form in form.items:
+                item_form.product_id.choices = product_choices
+            assert form.validate(), form.errors
+            return header_from_form(form), [line_from_form(item_form) for item_form in form.items]
+
+        def payload_path():
+            return validate_bill_payload(payload)
+
+        with app.test_request_context():
+            print_result(f"BillForm validate ({count} lines)", timed(wtforms_path))
+            print_result(f"bill payload validate ({count} lines)", timed(payload_path, repeat=20))
+
+
+if __name__ == "__main__":
+    main()
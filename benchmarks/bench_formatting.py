@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Micro-benchmarks for amount formatting: amount in words and Indian-grouped
+currency, comparing the previous per-call implementations with the
+precomputed tables and LRU caches in utils.py.
+
+Each case formats a batch of bill-like amounts. "cold" clears the caches
+before every run; "warm" repeats a working set of 1000 amounts (smaller than
+the cache), which is the common case of bill views and PDFs being re-rendered.
+
+Usage:
+    python benchmarks/bench_formatting.py
+"""
+
+import random
+from decimal import Decimal
+
+from _support import timed, print_result
+import utils
+
+BATCH = 10000
+
+
+def legacy_number_to_words(amount):
+    """The per-call implementation number_to_words used before the lookup tables"""
+    if amount is None or amount == 0:
+        return "Zero"
+    amount = int(float(amount))
+    ones = ["", "One", "Two", "Three", "Four", "Five", "Six", "Seven", "Eight", "Nine"]
+    teens = ["Ten", "Eleven", "Twelve", "Thirteen", "Fourteen", "Fifteen", "Sixteen", "Seventeen",
+             "Eighteen", "Nineteen"]
+    tens = ["", "", "Twenty", "Thirty", "Forty", "Fifty", "Sixty", "Seventy", "Eighty", "Ninety"]
+
+    def convert_hundreds(num):
+        result = ""
+        if num >= 100:
+            result += ones[num // 100] + " Hundred "
+            num %= 100
+        if num >= 20:
+            result += tens[num // 10] + " "
+            num %= 10
+        elif num >= 10:
+            result += teens[num - 10] + " "
+            num = 0
+        if num > 0:
+            result += ones[num] + " "
+        return result.strip()
+
+    result = ""
+    for divisor, name in ((10000000, "Crore"), (100000, "Lakh"), (1000, "Thousand")):
+        if amount >= divisor:
+            result += convert_hundreds(amount // divisor) + f" {name} "
+            amount %= divisor
+    if amount > 0:
+        result += convert_hundreds(amount)
+    return result.strip()
+
+
+def legacy_format_currency(amount):
+    """The float-based, Western-grouped formatter used before"""
+    if amount is None:
+        return "₹0.00"
+    return f"₹{float(amount):,.2f}"
+
+
+def clear_caches():
+    utils.number_to_words.cache_clear()
+    utils.amount_in_words.cache_clear()
+    utils.format_indian_number.cache_clear()
+
+
+def run_batch(fn, amounts, cold=False):
+    def run():
+        if cold:
+            clear_caches()
+        for amount in amounts:
+            fn(amount)
+    return run
+
+
+def main():
+    random.seed(42)
+    amounts = [Decimal(random.randrange(100, 5000000000)) / 100 for _ in range(BATCH)]
+    working_set = amounts[:1000] * (BATCH // 1000)
+
+    cases = [
+        ("number_to_words legacy", run_batch(legacy_number_to_words, amounts)),
+        ("number_to_words tables (cold cache)", run_batch(utils.number_to_words, amounts, cold=True)),
+        ("number_to_words tables (warm cache)", run_batch(utils.number_to_words, working_set)),
+        ("amount_in_words with paise (cold cache)", run_batch(utils.amount_in_words, amounts, cold=True)),
+        ("amount_in_words with paise (warm cache)", run_batch(utils.amount_in_words, working_set)),
+        ("format_currency legacy float", run_batch(legacy_format_currency, amounts)),
+        ("format_currency Indian (cold cache)", run_batch(utils.format_currency, amounts, cold=True)),
+        ("format_currency Indian (warm cache)", run_batch(utils.format_currency, working_set)),
+    ]
+
+    print(f"{BATCH} amounts per run, cache size {utils.FORMAT_CACHE_SIZE}")
+    for label, fn in cases:
+        print_result(label, timed(fn))
+
+    clear_caches()
+    run_batch(utils.amount_in_words, working_set)()
+    print(f"amount_in_words cache over the warm working set: {utils.amount_in_words.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Benchmark GSTIN validation: the previous per-call regex check against the
+precompiled, checksum-verifying validator in gstin.py and its bulk API.
+
+The input mimics a customer import: 100k GSTINs drawn from 20k distinct
+values, with a share of malformed and wrong-check-digit entries.
+
+Usage:
+    python benchmarks/bench_gstin.py
+"""
+
+import re
+import random
+
+from _support import timed, print_result
+from gstin import checksum_char, is_valid_gstin, validate_gstins
+
+ROWS = 100000
+DISTINCT = 20000
+
+
+def legacy_validate_gst_number(gst_number):
+    """The previous utils.validate_gst_number: format only, pattern rebuilt per call"""
+    if not gst_number or len(gst_number) != 15:
+        return False
+    pattern = r'^[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z]{1}[1-9A-Z]{1}[Z]{1}[0-9A-Z]{1}$'
+    return bool(re.match(pattern, gst_number))
+
+
+def sample_gstins():
+    random.seed(7)
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    distinct = []
+    for n in range(DISTINCT):
+        body = (f"{random.randint(1, 37):02d}" + ''.join(random.choices(letters, k=5)) +
+                f"{random.randint(0, 9999):04d}" + random.choice(letters) + '1Z')
+        gstin = body + checksum_char(body)
+        if n % 10 == 0:
+            gstin = body + ('0' if gstin[-1] != '0' else '1')  # wrong check digit
+        elif n % 25 == 0:
+            gstin = gstin.lower()[:14]  # malformed
+        distinct.append(gstin)
+    return [random.choice(distinct) for _ in range(ROWS)]
+
+
+def main():
+    gstins = sample_gstins()
+    print(f"{ROWS} GSTINs, {DISTINCT} distinct")
+    print_result("legacy regex per call (no checksum)",
+                 timed(lambda: [legacy_validate_gst_number(g) for g in gstins], repeat=3))
+    print_result("is_valid_gstin per call",
+                 timed(lambda: [is_valid_gstin(g) for g in gstins], repeat=3))
+    print_result("validate_gstins bulk",
+                 timed(lambda: validate_gstins(gstins), repeat=3))
+
+    results = validate_gstins(gstins)
+    print(f"valid={sum(r.valid for r in results)}  invalid={sum(not r.valid for r in results)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Benchmark GSTR-1 generation for a single return period.
+
+Seeds one month with the requested number of invoices (70% B2B across a few
+thousand registered customers, 30% B2C), then times the validation pass and
+the streaming writer, reporting throughput, output size and peak Python
+memory. Seeding uses bulk core inserts so 500k invoices take a few minutes
+on SQLite rather than hours.
+
+Usage:
+    python benchmarks/bench_gstr1.py [--invoices 500000] [--customers 5000]
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import tracemalloc
+from datetime import date, datetime
+from decimal import Decimal
+
+from _support import app, db
+from sqlalchemy import insert
+from models import Company, Customer, Bill, BillTaxSummary
+from gstr1 import validate_gstr1, write_gstr1
+from gstin import checksum_char
+from tax_reports import rebuild_tax_aggregates
+
+PERIOD = '032025'
+PERIOD_START = date(2025, 3, 1)
+INSERT_CHUNK = 10000
+LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def synthetic_gstin(n, state_code):
+    """Build a valid GSTIN whose PAN part is derived from n"""
+    letters = ''
+    for _ in range(5):
+        n, r = divmod(n, 26)
+        letters = LETTERS[r] + letters
+    gstin = f"{state_code}{letters}{n % 10000:04d}A1Z"
+    return gstin + checksum_char(gstin)
+
+
+def seed_period(invoices, customers):
+    """Insert customers, bills and their tax breakup for PERIOD"""
+    if not Company.query.first():
+        db.session.add(Company(name="Bench Co", address="1 Bench Road",
+                               gst_number="29AABCB1234A1ZE", state_code="29"))
+        db.session.commit()
+
+    now = datetime.utcnow()
+    first_customer = db.session.execute(db.select(db.func.coalesce(db.func.max(Customer.id), 0))).scalar() + 1
+    customer_rows = []
+    for i in range(customers):
+        state = '29' if i % 4 else '27'
+        customer_rows.append({'name': f"GSTR1 Customer {i}", 'state_code': state,
+                              'gst_number': synthetic_gstin(i, state), 'is_guest': False,
+                              'created_at': now, 'updated_at': now})
+    # One unregistered customer per state for the B2C share
+    customer_rows += [{'name': 'Walk-in 29', 'state_code': '29', 'gst_number': None, 'is_guest': True,
+                       'created_at': now, 'updated_at': now},
+                      {'name': 'Walk-in 33', 'state_code': '33', 'gst_number': None, 'is_guest': True,
+                       'created_at': now, 'updated_at': now}]
+    db.session.execute(insert(Customer), customer_rows)
+    b2c_ids = (first_customer + customers, first_customer + customers + 1)
+
+    first_bill = db.session.execute(db.select(db.func.coalesce(db.func.max(Bill.id), 0))).scalar() + 1
+    rates = (Decimal('5'), Decimal('12'), Decimal('18'), Decimal('28'))
+    for chunk_start in range(0, invoices, INSERT_CHUNK):
+        bills, summaries = [], []
+        for n in range(chunk_start, min(chunk_start + INSERT_CHUNK, invoices)):
+            bill_id = first_bill + n
+            if n % 10 < 7:
+                customer_id = first_customer + n % customers
+                intra = (n % customers) % 4 != 0
+            else:
+                customer_id = b2c_ids[n % 2]
+                intra = n % 2 == 0
+            subtotal = Decimal('0')
+            tax = Decimal('0')
+            for k in range(2):
+                rate = rates[(n + k) % len(rates)]
+                taxable = Decimal(100 + (n + k) % 900)
+                gst = (taxable * rate / 100).quantize(Decimal('0.01'))
+                half = (gst / 2).quantize(Decimal('0.01'))
+                summaries.append({'bill_id': bill_id, 'hsn_code': f"{6100 + (n + k) % 50}", 'gst_rate': rate,
+                                  'unit': 'Nos', 'quantity': Decimal('2'), 'taxable_amount': taxable,
+                                  'cgst_amount': half if intra else 0, 'sgst_amount': half if intra else 0,
+                                  'igst_amount': 0 if intra else gst, 'created_at': now, 'updated_at': now})
+                subtotal += taxable
+                tax += half * 2 if intra else gst
+            bills.append({'id': bill_id, 'bill_number': f"G1-{n:07d}", 'customer_id': customer_id,
+                          'bill_date': PERIOD_START.replace(day=1 + n % 31), 'subtotal': subtotal,
+                          'discount_amount': 0, 'cgst_amount': 0, 'sgst_amount': 0, 'igst_amount': 0,
+                          'total_amount': subtotal + tax, 'status': 'Sent',
+                          'created_at': now, 'updated_at': now})
+        db.session.execute(insert(Bill), bills)
+        db.session.execute(insert(BillTaxSummary), summaries)
+        db.session.commit()
+
+    rebuild_tax_aggregates(PERIOD_START, date(2025, 3, 31))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--invoices", type=int, default=500000)
+    parser.add_argument("--customers", type=int, default=5000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        if not Bill.query.filter(Bill.bill_number.like('G1-%')).first():
+            start = time.perf_counter()
+            seed_period(args.invoices, args.customers)
+            print(f"Seeded {args.invoices} invoices in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        errors = validate_gstr1(PERIOD)
+        print(f"{'validate_gstr1':<20} {(time.perf_counter() - start) * 1000:10.1f}ms  errors={len(errors)}")
+
+        path = os.path.join(tempfile.mkdtemp(prefix="gstr1_"), f"GSTR1_{PERIOD}.json")
+        start = time.perf_counter()
+        with open(path, 'w', encoding='utf-8') as f:
+            stats = write_gstr1(f, PERIOD)
+        elapsed = time.perf_counter() - start
+        print(f"{'write_gstr1':<20} {elapsed * 1000:10.1f}ms  "
+              f"{stats['b2b_invoices'] / elapsed:,.0f} B2B invoices/s  "
+              f"size={os.path.getsize(path) / 1024 / 1024:.1f}MiB")
+
+        # Separate run for memory: tracemalloc slows allocation-heavy code several times over
+        tracemalloc.start()
+        with open(path, 'w', encoding='utf-8') as f:
+            write_gstr1(f, PERIOD)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{'write_gstr1 memory':<20} peak={peak / 1024 / 1024:.1f}MiB")
+        print(f"{'':<20} {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Benchmark the bills/products list views: full ORM objects with per-row lazy
+loads versus the row-tuple query profiles in query_profiles.py.
+
+Usage:
+    python benchmarks/bench_list_views.py
+"""
+
+from _support import app, db, timed, QueryCounter, seed_basic_data, print_result
+from models import Bill, Customer, Product
+from query_profiles import bill_list_query, bill_list_summary, product_list_query, paginate_rows
+
+PAGE_SIZES = (100, 500)
+
+
+def legacy_bills_page(per_page):
+    query = Bill.query.join(Customer)
+    query.count()
+    query.with_entities(db.func.sum(Bill.total_amount)).scalar()
+    page = query.order_by(Bill.created_at.desc()).paginate(page=1, per_page=per_page,
+                                                           max_per_page=per_page, error_out=False)
+    return [(b.bill_number, b.customer.name, b.customer.is_guest, b.total_amount) for b in page.items]
+
+
+def profiled_bills_page(per_page):
+    total, _ = bill_list_summary()
+    page = paginate_rows(bill_list_query(), page=1, per_page=per_page, total=total)
+    return [(b.bill_number, b.customer_name, b.customer_is_guest, b.total_amount) for b in page.items]
+
+
+def legacy_products_page(per_page):
+    page = Product.query.order_by(Product.created_at.desc()).paginate(page=1, per_page=per_page,
+                                                                      max_per_page=per_page, error_out=False)
+    return [(p.name, p.category.category_name if p.category else None) for p in page.items]
+
+
+def profiled_products_page(per_page):
+    page = paginate_rows(product_list_query(), page=1, per_page=per_page)
+    return [(p.name, p.category_name) for p in page.items]
+
+
+def run_case(label, fn, per_page):
+    def once():
+        # Start each run with an empty identity map, as a fresh request would
+        db.session.expunge_all()
+        fn(per_page)
+
+    with QueryCounter(db.engine) as counter:
+        once()
+    print_result(f"{label} (per_page={per_page})", timed(once), counter.count)
+
+
+def main():
+    with app.app_context():
+        seed_basic_data(customers=200, products=600, bills=600)
+        for per_page in PAGE_SIZES:
+            run_case("bills: ORM + lazy customer", legacy_bills_page, per_page)
+            run_case("bills: row tuples", profiled_bills_page, per_page)
+            run_case("products: ORM + lazy category", legacy_products_page, per_page)
+            run_case("products: row tuples", profiled_products_page, per_page)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Hydrating the products of a bill being edited: one /api/products/<id>
+request per product, as the bill editor used to, against one
+/api/products/batch request (GET, and POST for long id lists).
+
+The batch endpoint must run the same number of queries whatever the
+number of ids (GET adds the catalogue version query of http_cache.py);
+the script fails if it does not.
+
+Usage:
+    python benchmarks/bench_product_batch.py
+"""
+
+from _support import app, db, timed, QueryCounter, seed_basic_data, print_result
+from run_benchmarks import bench_client
+from models import Product
+
+PRODUCT_COUNTS = (10, 80, 400)
+
+
+def per_product(client, ids):
+    def run():
+        for product_id in ids:
+            assert client.get(f'/api/products/{product_id}').status_code == 200
+    return run
+
+
+def batch_get(client, ids):
+    url = f"/api/products/batch?ids={','.join(map(str, ids))}"
+
+    def run():
+        response = client.get(url)
+        assert response.status_code == 200 and len(response.json['products']) == len(ids)
+    return run
+
+
+def batch_post(client, ids):
+    def run():
+        response = client.post('/api/products/batch', json={'ids': ids})
+        assert response.status_code == 200 and len(response.json['products']) == len(ids)
+    return run
+
+
+def run_case(label, fn, engine):
+    with QueryCounter(engine) as counter:
+        fn()
+    print_result(label, timed(fn), counter.count)
+    return counter.count
+
+
+def main():
+    with app.app_context():
+        seed_basic_data(customers=50, products=max(PRODUCT_COUNTS), bills=10)
+        ids = list(db.session.execute(db.select(Product.id).order_by(Product.id)).scalars())
+        client = bench_client()
+        engine = db.engine
+
+    # method -> query counts seen across the sizes
+    batch_queries = {'GET': set(), 'POST': set()}
+    for count in PRODUCT_COUNTS:
+        sample = ids[:count]
+        run_case(f"{count} products: one request each", per_product(client, sample), engine)
+        batch_queries['GET'].add(run_case(f"{count} products: batch GET", batch_get(client, sample), engine))
+        batch_queries['POST'].add(run_case(f"{count} products: batch POST", batch_post(client, sample), engine))
+
+    for method, counts in batch_queries.items():
+        if len(counts) != 1:
+            raise SystemExit(f"Batch {method} query count depends on the number of ids: {sorted(counts)}")
+        print(f"Batch {method} ran {counts.pop()} queries for every size")
+
+
+if __name__ == "__main__":
+    main()
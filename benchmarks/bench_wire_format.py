@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+Payload size and serialization time of the API wire formats (api_format.py):
+Flask's default JSON provider, the orjson-backed provider the app uses, and
+MessagePack, each also gzip-compressed.
+
+Payloads are built from the seeded database the way the endpoints build
+them: a product search page (product_api_payload) and sync pages of
+products and bills (sync_feed.changes_since, with Decimal and date values
+converted by mobile_value) plus a page of raw bill rows with Decimal and
+date columns, the worst case for Flask's default provider.
+
+Usage:
+    python benchmarks/bench_wire_format.py [--bills 2000]
+"""
+
+import argparse
+import gzip
+
+from _support import app, db, timed, seed_basic_data
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import select
+import api_format
+from models import Bill
+from query_profiles import product_search_query, searchable_fields_query, product_api_payload
+from sync_feed import changes_since
+
+
+def build_payloads():
+    products = db.session.execute(product_search_query('', '')).all()
+    fields = db.session.execute(searchable_fields_query('product')).all()
+    bills = db.session.execute(select(Bill.id, Bill.bill_number, Bill.customer_id, Bill.bill_date,
+                                      Bill.due_date, Bill.status, Bill.subtotal, Bill.cgst_amount,
+                                      Bill.sgst_amount, Bill.igst_amount, Bill.total_amount,
+                                      Bill.created_at).limit(2000)).all()
+    return [
+        ("product search page", {'products': [product_api_payload(p, fields) for p in products]}),
+        ("sync page (5000 changes)", changes_since(0, 5000)),
+        ("bill rows with Decimal/date", {'bills': [row._asdict() for row in bills]}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bills', type=int, default=2000, help='Bills to seed (default: 2000)')
+    args = parser.parse_args()
+
+    flask_default = DefaultJSONProvider(app)
+    encoders = [
+        ("flask default json", lambda payload: flask_default.dumps(payload).encode('utf-8')),
+        (f"orjson provider{'' if api_format.orjson else ' (orjson missing: stdlib)'}", api_format.dumps_json),
+    ]
+    if api_format.msgpack is not None:
+        encoders.append(("msgpack", api_format.dumps_msgpack))
+    else:
+        print("msgpack is not installed; skipping MessagePack")
+
+    with app.app_context():
+        seed_basic_data(customers=200, products=1000, bills=args.bills)
+        payloads = build_payloads()
+
+    print(f"{'payload / encoder':<50} {'median':>10} {'bytes':>10} {'gzip':>10}")
+    for payload_label, payload in payloads:
+        for encoder_label, encode in encoders:
+            body = encode(payload)
+            result = timed(lambda: encode(payload), repeat=10)
+            print(f"{payload_label + ' / ' + encoder_label:<50} {result['median']:8.2f}ms "
+                  f"{len(body):>10} {len(gzip.compress(body, compresslevel=6)):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+"""
+Load test the product lookup endpoints behind the bill form typeahead.
+
+Logs in once, then keeps CONCURRENCY keep-alive connections busy for
+DURATION seconds with the typeahead's traffic mix (mostly searches for
+short prefixes, plus recent products and single product lookups) and
+reports throughput and latency percentiles. Point it at the Flask app and
+at the async tier (async_api.py) with the same worker count to compare:
+
+    gunicorn -w 1 -b 127.0.0.1:5000 main:app
+    uvicorn async_api:asgi_app --port 5001 --workers 1
+    python benchmarks/load_test_api.py http://127.0.0.1:5000 http://127.0.0.1:5001
+
+Usage:
+    python benchmarks/load_test_api.py URL [URL ...] [--concurrency N] [--duration S]
+        [--username U] [--password P] [--json results.json]
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from urllib.parse import urlsplit, quote
+
+SEARCH_TERMS = ('pro', 'product 1', 'cat', '61', '610', 'product 2', 'p', 'serial', 'xyz')
+
+
+class Connection:
+    """Minimal HTTP/1.1 keep-alive client over asyncio streams"""
+
+    def __init__(self, host, port, cookies):
+        self.host, self.port = host, port
+        self.cookies = cookies
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b'', headers=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", f"Content-Length: {len(body)}"]
+        if self.cookies:
+            lines.append('Cookie: ' + '; '.join(f"{k}={v}" for k, v in self.cookies.items()))
+        lines.extend(f"{k}: {v}" for k, v in (headers or {}).items())
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by server')
+        status = int(status_line.split()[1])
+        response_headers = []
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers.append((name.strip().lower(), value.strip()))
+        header_map = dict(response_headers)
+        if header_map.get('transfer-encoding') == 'chunked':
+            data = b''
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                data += chunk[:-2]
+        else:
+            data = await self.reader.readexactly(int(header_map.get('content-length', 0)))
+        for name, value in response_headers:
+            if name == 'set-cookie':
+                key, _, rest = value.partition('=')
+                self.cookies[key] = rest.split(';', 1)[0]
+        if header_map.get('connection', '').lower() == 'close':
+            self.close()
+        return status, header_map, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def submit_login(conn, username, password):
+    """Log a connection in through the Flask login form; returns the final HTTP status, or None on success"""
+    status, _, page = await conn.request('GET', '/login')
+    match = re.search(rb'name="csrf_token"[^>]*value="([^"]+)"', page)
+    form = f"username={quote(username)}&password={quote(password)}"
+    if match:
+        form += f"&csrf_token={quote(match.group(1).decode())}"
+    status, headers, _ = await conn.request('POST', '/login', form.encode(),
+                                            {'Content-Type': 'application/x-www-form-urlencoded'})
+    if status != 302 or headers.get('location', '').endswith('/login'):
+        return status
+    return None
+
+
+async def login(base_url, username, password):
+    """Log in through the Flask login form and return the session cookies"""
+    parts = urlsplit(base_url)
+    conn = Connection(parts.hostname, parts.port or 80, {})
+    status = await submit_login(conn, username, password)
+    conn.close()
+    if status is not None:
+        raise SystemExit(f"Login to {base_url} failed (HTTP {status})")
+    return conn.cookies
+
+
+def next_request(rng, product_ids):
+    """Pick the next path of the typeahead traffic mix"""
+    roll = rng.random()
+    if roll < 0.8:
+        term = rng.choice(SEARCH_TERMS)
+        return f"/api/products/search?term={quote(term)}&category="
+    if roll < 0.9:
+        return '/api/products/recent'
+    return f"/api/products/{rng.choice(product_ids)}"
+
+
+async def run_client(parts, cookies, deadline, product_ids, latencies, errors, seed):
+    rng = random.Random(seed)
+    conn = Connection(parts.hostname, parts.port or 80, dict(cookies))
+    while time.perf_counter() < deadline:
+        path = next_request(rng, product_ids)
+        start = time.perf_counter()
+        try:
+            status, _, _ = await conn.request('GET', path)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError):
+            conn.close()
+            errors.append('connection')
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+        if status != 200:
+            errors.append(status)
+    conn.close()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def load_test(base_url, concurrency, duration, username, password):
+    """
+    Run the load against one server.
+
+    Returns:
+        dict: url, requests, errors, rps and latency statistics in ms
+    """
+    parts = urlsplit(base_url)
+    cookies = await login(base_url, username, password)
+
+    probe = Connection(parts.hostname, parts.port or 80, dict(cookies))
+    status, _, body = await probe.request('GET', '/api/products/recent')
+    probe.close()
+    if status != 200:
+        raise SystemExit(f"{base_url}/api/products/recent returned HTTP {status}")
+    product_ids = [p['id'] for p in json.loads(body)['products']] or [1]
+
+    latencies, errors = [], []
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(run_client(parts, cookies, deadline, product_ids, latencies, errors, seed)
+                           for seed in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        'url': base_url,
+        'concurrency': concurrency,
+        'duration': round(elapsed, 2),
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / elapsed, 1),
+        'mean_ms': round(statistics.mean(latencies), 2) if latencies else None,
+        'p50_ms': round(percentile(latencies, 50), 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the product lookup API')
+    parser.add_argument('urls', nargs='+', help='Base URLs of the servers to compare')
+    parser.add_argument('--concurrency', type=int, default=50, help='Concurrent connections (default: 50)')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per server (default: 20)')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin123')
+    parser.add_argument('--json', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = []
+    for url in args.urls:
+        result = asyncio.run(load_test(url.rstrip('/'), args.concurrency, args.duration,
+                                       args.username, args.password))
+        results.append(result)
+        print(f"{url:<30} {result['rps']:>8} req/s  p50={result['p50_ms']}ms  p95={result['p95_ms']}ms  "
+              f"p99={result['p99_ms']}ms  requests={result['requests']}  errors={result['errors']}")
+
+    if len(results) > 1 and results[0]['rps']:
+        for result in results[1:]:
+            print(f"{result['url']}: {result['rps'] / results[0]['rps']:.1f}x the throughput of {results[0]['url']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+"""
+Load test a server with simulated cashiers, ramping concurrency until it
+saturates, to find how many concurrent cashiers one node supports.
+
+Each cashier logs in with its own session and then makes sales in a loop,
+as the bill form does:
+
+    csrf      GET  /csrf-token
+    search    GET  /api/products/search (1-3 typeahead searches)
+    create    POST /bills/create (1-5 lines from the search results)
+    pdf       GET  /bills/<id>/pdf
+    export    GET  /bills/export/excel or /pdf for today's bills (--export-ratio of sales)
+
+Concurrency is stepped up (1, 2, 4, ... or --stages) for --stage-duration
+seconds per stage. The ramp stops at saturation: when a stage completes
+fewer than --min-gain more sales per second than the best stage so far,
+its error rate passes --max-error-rate, or its create p95 passes
+--max-p95. Every stage reports p50/p95/p99 latency and errors per step.
+
+Run it against a server with data in it (db_manage.py seed) and the
+production worker setup, from another machine or core:
+
+    gunicorn -w 4 -b 127.0.0.1:5000 main:app
+    python benchmarks/load_test_cashiers.py http://127.0.0.1:5000 --max-concurrency 64
+
+Usage:
+    python benchmarks/load_test_cashiers.py URL [--stages 1,5,10,20] [--max-concurrency N]
+        [--stage-duration S] [--think-time S] [--export-ratio R] [--min-gain R]
+        [--max-error-rate R] [--max-p95 MS] [--username U] [--password P] [--json results.json]
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from datetime import date
+from collections import defaultdict
+from urllib.parse import urlsplit, quote, urlencode
+
+from load_test_api import Connection, submit_login, percentile
+
+STEPS = ('login', 'csrf', 'search', 'create', 'pdf', 'export')
+SEARCH_TERMS = ('pro', 'bolt', 'steel', 'tea', 'cable', 'p', 'premium', 'shoe', 'pump', '73', 'milk')
+QUANTITIES = ('1', '1', '2', '3', '5', '10')
+FORM_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
+NETWORK_ERRORS = (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError)
+
+
+class StageStats:
+    """Latencies and errors per step of one ramp stage"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+        self.sales = 0
+
+    def record(self, step, started, error=None):
+        self.latencies[step].append((time.perf_counter() - started) * 1000)
+        if error is not None:
+            self.errors[step][str(error)] += 1
+
+    def summary(self, concurrency, elapsed):
+        steps = {}
+        requests = errors = 0
+        for step in STEPS:
+            samples = self.latencies.get(step)
+            if not samples:
+                continue
+            step_errors = sum(self.errors[step].values())
+            requests += len(samples)
+            errors += step_errors
+            steps[step] = {
+                'requests': len(samples),
+                'errors': step_errors,
+                'error_kinds': dict(self.errors[step]),
+                'p50_ms': round(percentile(samples, 50), 1),
+                'p95_ms': round(percentile(samples, 95), 1),
+                'p99_ms': round(percentile(samples, 99), 1),
+            }
+        return {
+            'concurrency': concurrency,
+            'duration': round(elapsed, 2),
+            'sales': self.sales,
+            'sales_per_second': round(self.sales / elapsed, 2),
+            'requests_per_second': round(requests / elapsed, 1),
+            'requests': requests,
+            'errors': errors,
+            'error_rate': round(errors / requests, 4) if requests else 0.0,
+            'steps': steps,
+        }
+
+
+async def load_catalogue(parts, username, password):
+    """Log in once and collect the customer ids of the bill form and some products"""
+    conn = Connection(parts.hostname, parts.port or 80, {})
+    status = await submit_login(conn, username, password)
+    if status is not None:
+        raise SystemExit(f"Login failed (HTTP {status})")
+    status, _, page = await conn.request('GET', '/bills/create')
+    select = re.search(rb'<select[^>]*name="customer_id"[^>]*>(.*?)</select>', page, re.S)
+    customer_ids = [int(value) for value in re.findall(rb'<option[^>]*value="(\d+)"', select.group(1))] \
+        if status == 200 and select else []
+    status, _, body = await conn.request('GET', '/api/products/recent')
+    products = json.loads(body)['products'] if status == 200 else []
+    conn.close()
+    if not customer_ids or not products:
+        raise SystemExit('The server needs customers and products (try `python db_manage.py seed`)')
+    return customer_ids, products
+
+
+def bill_form(rng, token, customer_id, products):
+    """The POST body of the bill form for a sale of 1-5 products"""
+    fields = [('csrf_token', token), ('customer_id', customer_id), ('bill_date', date.today().isoformat()),
+              ('status', 'Paid'), ('discount_type', 'none'), ('discount_value', '0'), ('notes', '')]
+    for index, product in enumerate(rng.sample(products, min(len(products), rng.randint(1, 5)))):
+        prefix = f"items-{index}-"
+        fields += [(prefix + 'product_id', product['id']), (prefix + 'product_name', product['name']),
+                   (prefix + 'description', product.get('description') or ''),
+                   (prefix + 'hsn_code', product['hsn_code']), (prefix + 'quantity', rng.choice(QUANTITIES)),
+                   (prefix + 'unit', product.get('unit') or 'Nos'), (prefix + 'rate', product['price']),
+                   (prefix + 'gst_rate', product['gst_rate'])]
+    return urlencode(fields).encode()
+
+
+async def timed_get(conn, stats, step, path, ok=(200,)):
+    started = time.perf_counter()
+    try:
+        status, headers, body = await conn.request('GET', path)
+    except NETWORK_ERRORS:
+        conn.close()
+        stats.record(step, started, 'connection')
+        return None, None, None
+    stats.record(step, started, None if status in ok else status)
+    return status, headers, body
+
+
+async def make_sale(conn, rng, stats, customer_ids, catalogue, export_ratio, think_time):
+    """One sale through the bill form; returns False when the session has to log in again"""
+    status, _, body = await timed_get(conn, stats, 'csrf', '/csrf-token')
+    if status != 200:
+        return status is not None
+    token = json.loads(body)['csrf_token']
+
+    found = []
+    for _ in range(rng.randint(1, 3)):
+        if think_time:
+            await asyncio.sleep(rng.uniform(0, think_time))
+        term = quote(rng.choice(SEARCH_TERMS))
+        status, _, body = await timed_get(conn, stats, 'search', f"/api/products/search?term={term}&category=")
+        if status == 200:
+            found += json.loads(body)['products']
+        elif status in (302, 401):
+            return False
+
+    started = time.perf_counter()
+    try:
+        status, headers, _ = await conn.request('POST', '/bills/create',
+                                                bill_form(rng, token, rng.choice(customer_ids), found or catalogue),
+                                                FORM_HEADERS)
+    except NETWORK_ERRORS:
+        conn.close()
+        stats.record('create', started, 'connection')
+        return True
+    created = re.search(r'/bills/(\d+)$', headers.get('location', '')) if status == 302 else None
+    # A 200 is the form re-rendered with validation errors
+    stats.record('create', started, None if created else status)
+    if not created:
+        return status != 302
+    stats.sales += 1
+
+    await timed_get(conn, stats, 'pdf', f"/bills/{created.group(1)}/pdf")
+    if rng.random() < export_ratio:
+        today = date.today().isoformat()
+        kind = rng.choice(('excel', 'pdf'))
+        # A large export is queued as a background job (a redirect to the job page)
+        await timed_get(conn, stats, 'export', f"/bills/export/{kind}?start_date={today}&end_date={today}",
+                        ok=(200, 302))
+    if think_time:
+        await asyncio.sleep(rng.uniform(0, think_time))
+    return True
+
+
+async def run_cashier(parts, seed, deadline, stats, username, password, customer_ids, catalogue, options):
+    rng = random.Random(seed)
+    conn = Connection(parts.hostname, parts.port or 80, {})
+    logged_in = False
+    while time.perf_counter() < deadline:
+        if not logged_in:
+            conn.cookies.clear()
+            started = time.perf_counter()
+            try:
+                status = await submit_login(conn, username, password)
+            except NETWORK_ERRORS:
+                conn.close()
+                status = 'connection'
+            stats.record('login', started, status)
+            logged_in = status is None
+            if not logged_in:
+                await asyncio.sleep(0.5)
+            continue
+        logged_in = await make_sale(conn, rng, stats, customer_ids, catalogue, options.export_ratio,
+                                    options.think_time)
+    conn.close()
+
+
+async def run_stage(parts, concurrency, options, customer_ids, catalogue, stage):
+    stats = StageStats()
+    started = time.perf_counter()
+    deadline = started + options.stage_duration
+    await asyncio.gather(*(run_cashier(parts, stage * 10000 + n, deadline, stats, options.username,
+                                       options.password, customer_ids, catalogue, options)
+                           for n in range(concurrency)))
+    return stats.summary(concurrency, time.perf_counter() - started)
+
+
+def stage_levels(options):
+    if options.stages:
+        return [int(level) for level in options.stages.split(',')]
+    levels, level = [], 1
+    while level <= options.max_concurrency:
+        levels.append(level)
+        level *= 2
+    return levels
+
+
+def saturation_reason(result, best, options):
+    """Why a stage counts as saturated, or None"""
+    if result['error_rate'] > options.max_error_rate:
+        return f"error rate {result['error_rate']:.1%}"
+    create_p95 = result['steps'].get('create', {}).get('p95_ms')
+    if options.max_p95 and create_p95 and create_p95 > options.max_p95:
+        return f"create p95 {create_p95}ms"
+    if best and result['sales_per_second'] < best['sales_per_second'] * (1 + options.min_gain):
+        return f"throughput gain under {options.min_gain:.0%}"
+    return None
+
+
+def print_stage(result):
+    print(f"\n{result['concurrency']} cashier(s): {result['sales_per_second']} sales/s, "
+          f"{result['requests_per_second']} req/s, {result['errors']} error(s) ({result['error_rate']:.2%})")
+    for step, row in result['steps'].items():
+        kinds = ', '.join(f"{kind}: {count}" for kind, count in row['error_kinds'].items())
+        print(f"  {step:<8} {row['requests']:>7}  p50={row['p50_ms']:>8}ms  p95={row['p95_ms']:>8}ms  "
+              f"p99={row['p99_ms']:>8}ms  errors={row['errors']}{f' ({kinds})' if kinds else ''}")
+
+
+async def ramp(base_url, options):
+    parts = urlsplit(base_url)
+    customer_ids, catalogue = await load_catalogue(parts, options.username, options.password)
+
+    stages, best, reason = [], None, None
+    for index, concurrency in enumerate(stage_levels(options)):
+        result = await run_stage(parts, concurrency, options, customer_ids, catalogue, index)
+        stages.append(result)
+        print_stage(result)
+        reason = saturation_reason(result, best, options)
+        if reason:
+            break
+        best = result
+    return {'url': base_url, 'stages': stages, 'saturation_reason': reason,
+            'max_cashiers': best['concurrency'] if best else None,
+            'max_sales_per_second': best['sales_per_second'] if best else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ramp simulated cashiers against a server until it saturates')
+    parser.add_argument('url', help='Base URL of the server')
+    parser.add_argument('--stages', help='Comma-separated concurrency levels (default: doubling from 1)')
+    parser.add_argument('--max-concurrency', type=int, default=64, help='Highest doubling level (default: 64)')
+    parser.add_argument('--stage-duration', type=float, default=30, help='Seconds per stage (default: 30)')
+    parser.add_argument('--think-time', type=float, default=0,
+                        help='Up to this many seconds of pause between a cashier\'s steps (default: 0)')
+    parser.add_argument('--export-ratio', type=float, default=0.02, help='Share of sales followed by an export')
+    parser.add_argument('--min-gain', type=float, default=0.1,
+                        help='Smallest throughput gain over the best stage to keep ramping (default: 0.1)')
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help='Saturated above this error rate')
+    parser.add_argument('--max-p95', type=float, help='Saturated when the create step p95 passes this (ms)')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin123')
+    parser.add_argument('--json', help='Also write the results to this JSON file')
+    options = parser.parse_args()
+
+    result = asyncio.run(ramp(options.url.rstrip('/'), options))
+    if result['max_cashiers']:
+        print(f"\n{result['url']} supports about {result['max_cashiers']} concurrent cashier(s) "
+              f"({result['max_sales_per_second']} sales/s)"
+              + (f"; saturated next: {result['saturation_reason']}" if result['saturation_reason'] else
+                 '; not saturated at the highest stage'))
+    else:
+        print(f"\n{result['url']} saturated at the first stage: {result['saturation_reason']}")
+
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
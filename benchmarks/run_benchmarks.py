@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+"""
+Benchmark suite: times the hot paths of the app against a synthetic data
+set and stores the results as JSON, so runs from different commits can be
+compared.
+
+Cases:
+    gst.*                 calculate_gst / calculate_item_total (per 10,000 calls)
+    bills.create          POST /bills/create and POST /api/bills with a 5-line bill
+    products.search       GET /api/products/search
+    bills.list            GET /bills (first and a deep page, with a search)
+    export.excel/pdf      GET /bills/export/excel and /bills/export/pdf
+    invoice.pdf           generate_invoice_pdf for a short and a long bill
+    fields.migrate_json   migrate_field_data_to_json
+
+Every case reports min/median/max milliseconds and the SQL statements of
+one run. The data set is generated with seed_data.py (as by `db_manage.py
+seed`) into the database in DATABASE_URL (a throwaway SQLite file when it
+is not set); for PostgreSQL use an empty scratch database.
+
+Usage:
+    python benchmarks/run_benchmarks.py --bills 5000 --output results/$(git rev-parse --short HEAD).json
+    python benchmarks/run_benchmarks.py --only gst,invoice --repeat 10
+    python benchmarks/run_benchmarks.py --output new.json --compare old.json --fail-on-regression
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from _support import app, db, timed, QueryCounter, print_result, ROOT, INVOCATION_DIR
+from seed_data import seed_database
+import sqlalchemy
+from sqlalchemy import select, func
+from models import User, Bill, BillItem, Customer, Product, Company
+from gst_calculator import calculate_gst, calculate_item_total
+from pdf_generator import generate_invoice_pdf
+
+GST_CALLS = 10000
+
+# name -> function(ctx) returning {label: (timing, queries)}
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark case"""
+    def decorator(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return decorator
+
+
+class BenchContext:
+    """What the cases share: a logged-in test client, sample ids and the run settings"""
+
+    def __init__(self, client, repeat):
+        self.client = client
+        self.repeat = repeat
+
+    def measure(self, fn, repeat=None):
+        """Time fn and count the statements of one (extra) run"""
+        db.session.expunge_all()
+        with QueryCounter(db.engine) as counter:
+            fn()
+        result = timed(fn, repeat=repeat or self.repeat)
+        return result, counter.count
+
+    def get(self, url):
+        def request():
+            response = self.client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {url} returned {response.status_code}")
+            return response
+        return request
+
+
+@benchmark('gst')
+def bench_gst(ctx):
+    amounts = [Decimal(n % 5000) + Decimal('0.45') for n in range(GST_CALLS)]
+    rates = (Decimal('5'), Decimal('12'), Decimal('18'), Decimal('28'))
+
+    def gst_intra():
+        for n, amount in enumerate(amounts):
+            calculate_gst(amount, rates[n % 4], '29', '29')
+
+    def gst_inter():
+        for n, amount in enumerate(amounts):
+            calculate_gst(amount, rates[n % 4], '29', '27')
+
+    def item_total():
+        for n, amount in enumerate(amounts):
+            calculate_item_total(n % 12 + 1, amount, rates[n % 4], '29', '27' if n % 3 else '29')
+
+    return {
+        'gst.calculate_gst.intra_state': (timed(gst_intra, repeat=ctx.repeat), 0),
+        'gst.calculate_gst.inter_state': (timed(gst_inter, repeat=ctx.repeat), 0),
+        'gst.calculate_item_total': (timed(item_total, repeat=ctx.repeat), 0),
+    }
+
+
+@benchmark('bills.create')
+def bench_create_bill(ctx):
+    customer_id = db.session.execute(select(func.min(Customer.id))).scalar()
+    products = db.session.execute(select(Product.id, Product.name, Product.hsn_code, Product.price,
+                                         Product.gst_rate, Product.unit).limit(5)).all()
+    today = datetime.now().date().isoformat()
+    form = {'customer_id': str(customer_id), 'bill_date': today, 'due_date': today, 'status': 'Draft',
+            'discount_type': 'none', 'discount_value': '0', 'notes': 'benchmark'}
+    for n, product in enumerate(products):
+        form.update({
+            f'items-{n}-product_id': str(product.id), f'items-{n}-product_name': product.name,
+            f'items-{n}-description': '', f'items-{n}-hsn_code': product.hsn_code,
+            f'items-{n}-unit': product.unit or 'Nos', f'items-{n}-quantity': str(n + 1),
+            f'items-{n}-rate': str(product.price), f'items-{n}-gst_rate': str(product.gst_rate),
+        })
+
+    payload = {'customer_id': customer_id, 'bill_date': today, 'due_date': today, 'status': 'Draft',
+               'notes': 'benchmark', 'items': {
+                   'product_id': [p.id for p in products], 'product_name': [p.name for p in products],
+                   'hsn_code': [p.hsn_code for p in products], 'unit': [p.unit or 'Nos' for p in products],
+                   'quantity': [str(n + 1) for n in range(len(products))],
+                   'rate': [str(p.price) for p in products], 'gst_rate': [str(p.gst_rate) for p in products]}}
+
+    def create():
+        response = ctx.client.post('/bills/create', data=form)
+        if response.status_code != 302:
+            raise RuntimeError(f"POST /bills/create returned {response.status_code}")
+
+    def create_json():
+        response = ctx.client.post('/api/bills', json=payload)
+        if response.status_code != 201:
+            raise RuntimeError(f"POST /api/bills returned {response.status_code}")
+
+    return {'bills.create (5 lines)': ctx.measure(create),
+            'bills.create_json (5 lines)': ctx.measure(create_json)}
+
+
+@benchmark('products.search')
+def bench_product_search(ctx):
+    return {
+        'products.search term=steel': ctx.measure(ctx.get('/api/products/search?term=steel')),
+        'products.search term=SN-1 (custom field)': ctx.measure(ctx.get('/api/products/search?term=SN-1')),
+        'products.search no term': ctx.measure(ctx.get('/api/products/search')),
+    }
+
+
+@benchmark('bills.list')
+def bench_bills_list(ctx):
+    total = db.session.execute(select(func.count(Bill.id))).scalar()
+    deep_page = max(total // 20 // 2, 1)
+    return {
+        'bills.list page=1': ctx.measure(ctx.get('/bills')),
+        f'bills.list page={deep_page}': ctx.measure(ctx.get(f'/bills?page={deep_page}')),
+        'bills.list search=Traders status=Paid': ctx.measure(ctx.get('/bills?search=Traders&status=Paid')),
+    }
+
+
+@benchmark('export')
+def bench_exports(ctx):
+    # Keep exports in the request, whatever the data set size
+    app.config['EXPORT_SYNC_LIMIT'] = 10 ** 9
+    repeat = max(ctx.repeat // 2, 1)
+    return {
+        'export.excel (all bills)': ctx.measure(ctx.get('/bills/export/excel'), repeat=repeat),
+        'export.pdf (all bills)': ctx.measure(ctx.get('/bills/export/pdf'), repeat=repeat),
+    }
+
+
+@benchmark('invoice')
+def bench_invoice_pdf(ctx):
+    line_counts = (select(BillItem.bill_id, func.count(BillItem.id).label('lines'))
+                   .group_by(BillItem.bill_id).subquery())
+    results = {}
+    for label, order in (('short', line_counts.c.lines.asc()), ('long', line_counts.c.lines.desc())):
+        bill_id, lines = db.session.execute(select(line_counts.c.bill_id, line_counts.c.lines)
+                                            .order_by(order).limit(1)).one()
+        output_path = os.path.join(tempfile.mkdtemp(prefix='gst_bench_pdf_'), 'invoice.pdf')
+
+        def render():
+            # Load the bill afresh each run, as the download route does
+            db.session.expunge_all()
+            generate_invoice_pdf(db.session.get(Bill, bill_id), Company.query.first(), output_path)
+
+        results[f'invoice.pdf {label} ({lines} lines)'] = ctx.measure(render)
+    return results
+
+
+@benchmark('fields.migrate_json')
+def bench_migrate_field_data(ctx):
+    from field_utils import migrate_field_data_to_json
+
+    def migrate():
+        if not migrate_field_data_to_json():
+            raise RuntimeError('migrate_field_data_to_json failed')
+
+    return {'fields.migrate_json (all products)': ctx.measure(migrate, repeat=max(ctx.repeat // 2, 1))}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_client():
+    """A test client logged in as a benchmark admin, with CSRF checks off"""
+    app.config['WTF_CSRF_ENABLED'] = False
+    user = User.query.filter_by(username='bench_admin').first()
+    if not user:
+        user = User(username='bench_admin', email='bench_admin@example.com', role='admin')
+        user.set_password('bench_admin')
+        db.session.add(user)
+        db.session.commit()
+    client = app.test_client()
+    response = client.post('/login', data={'username': 'bench_admin', 'password': 'bench_admin'})
+    if response.status_code != 302:
+        raise RuntimeError('Could not log in as bench_admin')
+    return client
+
+
+def compare(current, baseline, threshold):
+    """
+    Print each case's median against a baseline run.
+
+    Returns:
+        list: Labels of the cases slower than the baseline by more than threshold percent
+    """
+    regressions = []
+    print(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'} "
+          f"({baseline['meta'].get('timestamp')}):")
+    for label, result in current['results'].items():
+        before = baseline['results'].get(label)
+        if before is None:
+            print(f"{label:<45} new")
+            continue
+        change = (result['median'] - before['median']) / before['median'] * 100 if before['median'] else 0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(label)
+        elif change < -threshold:
+            flag = '  faster'
+        print(f"{label:<45} {before['median']:9.2f}ms -> {result['median']:9.2f}ms  {change:+6.1f}%"
+              f"  queries {before.get('queries')} -> {result.get('queries')}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--customers', type=int, default=500)
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--bills', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per case')
+    parser.add_argument('--only', help=f"Comma separated cases ({', '.join(BENCHMARKS)})")
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Slowdown (percent of the median) reported as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit 1 when a case regressed')
+    args = parser.parse_args(argv)
+
+    output = os.path.join(INVOCATION_DIR, args.output) if args.output else None
+    baseline = os.path.join(INVOCATION_DIR, args.compare) if args.compare else None
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown cases: {', '.join(unknown)}")
+
+    # Keep temp files of the app (uploads, job results) out of the repository
+    app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp(prefix='gst_bench_uploads_')
+
+    with app.app_context():
+        dataset = {'customers': db.session.execute(select(func.count(Customer.id))).scalar(),
+                   'bills': db.session.execute(select(func.count(Bill.id))).scalar()}
+        if dataset['bills'] < args.bills:
+            started = time.perf_counter()
+            print(f"Generating {args.customers} customers, {args.products} products, {args.bills} bills...")
+            seed_database(args.customers, args.products, args.bills - dataset['bills'], seed=args.seed,
+                          with_field_data=True)
+            print(f"Generated in {time.perf_counter() - started:.1f}s")
+        dataset = {
+            'customers': db.session.execute(select(func.count(Customer.id))).scalar(),
+            'products': db.session.execute(select(func.count(Product.id))).scalar(),
+            'bills': db.session.execute(select(func.count(Bill.id))).scalar(),
+            'bill_items': db.session.execute(select(func.count(BillItem.id))).scalar(),
+        }
+
+        ctx = BenchContext(bench_client(), args.repeat)
+        results = {}
+        for name in names:
+            for label, (result, queries) in BENCHMARKS[name](ctx).items():
+                print_result(label, result, queries)
+                results[label] = dict(result, queries=queries)
+
+        run = {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'sqlalchemy': sqlalchemy.__version__,
+                'dialect': db.engine.dialect.name,
+                'platform': platform.platform(),
+                'repeat': args.repeat,
+                'dataset': dataset,
+            },
+            'results': results,
+        }
+
+    if output:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(run, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(run, json.load(f), args.threshold)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
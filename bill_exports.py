@@ -0,0 +1,314 @@
+"""
+Bill list exports (Excel and PDF) and batch invoice PDF rendering.
+
+The writers are shared by the export routes, which stream small exports
+straight back to the browser, and by the background job handlers used for
+large ones (see jobs.py). All of them take the same filters as the bills
+listing: search, start_date, end_date and status as request strings.
+"""
+
+import os
+import time
+import zipfile
+from datetime import datetime
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment
+from openpyxl.utils import get_column_letter
+from reportlab.lib.pagesizes import A4
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib.enums import TA_CENTER
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
+from extensions import db
+from models import Bill, Customer, Company
+from query_profiles import (BILL_LIST_COLUMNS, bill_list_query, bill_list_summary, apply_bill_filters,
+                            parse_filter_date)
+from pdf_generator import generate_invoice_pdf
+from jobs import job_handler, update_progress, job_result_path
+from metrics import observe_export
+
+EXPORT_FILTERS = ('search', 'start_date', 'end_date', 'status')
+
+EXCEL_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Rows between progress updates / bills per query when rendering invoices
+EXPORT_CHUNK_SIZE = 1000
+INVOICE_CHUNK_SIZE = 50
+
+
+def export_filters(args):
+    """Pick the bill list filters out of request args"""
+    return {name: args.get(name, '') for name in EXPORT_FILTERS}
+
+
+def _filter_values(filters):
+    return (filters.get('search', ''), parse_filter_date(filters.get('start_date')),
+            parse_filter_date(filters.get('end_date')), filters.get('status', ''))
+
+
+def export_bill_ids(filters, order_by=(Bill.created_at.desc(),)):
+    """Ids of the filtered bills, in export order"""
+    stmt = apply_bill_filters(select(Bill.id).join(Customer, Bill.customer_id == Customer.id),
+                              *_filter_values(filters)).order_by(*order_by, Bill.id)
+    return db.session.execute(stmt).scalars().all()
+
+
+def iter_bill_rows(filters):
+    """
+    Yield the bill list rows for an export, newest first, EXPORT_CHUNK_SIZE
+    bills per query.
+
+    Rows are fetched by id in separate short queries rather than from one
+    streamed cursor, so the caller may commit (e.g. job progress) between
+    rows.
+    """
+    bill_ids = export_bill_ids(filters)
+    for start in range(0, len(bill_ids), EXPORT_CHUNK_SIZE):
+        chunk = bill_ids[start:start + EXPORT_CHUNK_SIZE]
+        rows = {row.id: row for row in db.session.execute(
+            select(*BILL_LIST_COLUMNS).join(Customer, Bill.customer_id == Customer.id).where(Bill.id.in_(chunk)))}
+        for bill_id in chunk:
+            if bill_id in rows:
+                yield rows[bill_id]
+
+
+def count_export_bills(filters):
+    """Number of bills an export with these filters would contain"""
+    return bill_list_summary(*_filter_values(filters))[0]
+
+
+def export_filename(prefix, extension, filters):
+    """File name such as bills_export_2024-04-01_to_2024-06-30_20240701_101500.xlsx"""
+    start_date, end_date = filters.get('start_date'), filters.get('end_date')
+    date_range = ""
+    if start_date and end_date:
+        date_range = f"_{start_date}_to_{end_date}"
+    elif start_date:
+        date_range = f"_from_{start_date}"
+    elif end_date:
+        date_range = f"_until_{end_date}"
+    return f"{prefix}{date_range}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+
+def write_bills_excel(output, filters, progress=None):
+    """
+    Write the filtered bills to an Excel workbook.
+
+    The workbook is built in write-only mode from chunked queries, so memory
+    stays flat however many bills are exported.
+
+    Args:
+        output: Path or binary file object
+        filters (dict): Bill list filters
+        progress (callable): Called with the number of rows written so far
+
+    Returns:
+        int: Number of bills written
+    """
+    started = time.perf_counter()
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Bills Export")
+
+    # Header row
+    headers = ['Bill Number', 'Customer Name', 'Bill Date', 'Due Date', 'Status',
+               'Subtotal', 'CGST', 'SGST', 'IGST', 'Total Amount']
+    for col in range(1, len(headers) + 1):
+        ws.column_dimensions[get_column_letter(col)].width = 15
+
+    header_font = Font(bold=True, color='FFFFFF')
+    header_fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
+    header_alignment = Alignment(horizontal='center', vertical='center')
+    header_cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = header_alignment
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    # Data rows
+    count = 0
+    for bill in iter_bill_rows(filters):
+        ws.append([
+            bill.bill_number,
+            bill.customer_name,
+            bill.bill_date.strftime('%d/%m/%Y'),
+            bill.due_date.strftime('%d/%m/%Y') if bill.due_date else '',
+            bill.status,
+            float(bill.subtotal),
+            float(bill.cgst_amount),
+            float(bill.sgst_amount),
+            float(bill.igst_amount),
+            float(bill.total_amount),
+        ])
+        count += 1
+        if progress and count % EXPORT_CHUNK_SIZE == 0:
+            progress(count)
+
+    wb.save(output)
+    observe_export('excel', count, time.perf_counter() - started)
+    return count
+
+
+def write_bills_pdf(output, filters, progress=None):
+    """
+    Write the filtered bills to a PDF report.
+
+    Args:
+        output: Path or binary file object
+        filters (dict): Bill list filters
+        progress (callable): Called with the number of rows laid out so far
+
+    Returns:
+        int: Number of bills written
+    """
+    started = time.perf_counter()
+    bills = db.session.execute(bill_list_query(*_filter_values(filters))).all()
+    company = Company.query.first()
+
+    doc = SimpleDocTemplate(output, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
+
+    # Container for the 'Flowable' objects
+    elements = []
+
+    # Define styles
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        spaceAfter=30,
+        alignment=TA_CENTER
+    )
+
+    # Title
+    start_date, end_date = filters.get('start_date'), filters.get('end_date')
+    title = "Bills Export Report"
+    if start_date and end_date:
+        title += f" ({start_date} to {end_date})"
+    elif start_date:
+        title += f" (from {start_date})"
+    elif end_date:
+        title += f" (until {end_date})"
+
+    elements.append(Paragraph(title, title_style))
+    elements.append(Spacer(1, 12))
+
+    # Company info
+    if company:
+        elements.append(Paragraph(f"<b>{company.name}</b>", styles['Normal']))
+        elements.append(Paragraph(f"GST No: {company.gst_number}", styles['Normal']))
+        elements.append(Spacer(1, 12))
+
+    # Summary
+    total_amount = sum(float(bill.total_amount) for bill in bills)
+    elements.append(Paragraph(f"<b>Total Bills:</b> {len(bills)}", styles['Normal']))
+    elements.append(Paragraph(f"<b>Total Amount:</b> ₹{total_amount:,.2f}", styles['Normal']))
+    elements.append(Spacer(1, 20))
+
+    # Table data
+    data = [['Bill Number', 'Customer', 'Date', 'Status', 'Amount']]
+    for count, bill in enumerate(bills, 1):
+        data.append([
+            bill.bill_number,
+            bill.customer_name,
+            bill.bill_date.strftime('%d/%m/%Y'),
+            bill.status,
+            f"₹{float(bill.total_amount):,.2f}"
+        ])
+        if progress and count % EXPORT_CHUNK_SIZE == 0:
+            progress(count)
+
+    table = Table(data, colWidths=[100, 150, 80, 80, 100])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('FONTSIZE', (0, 1), (-1, -1), 8),
+        ('ALIGN', (4, 1), (4, -1), 'RIGHT'),  # Right align amount column
+    ]))
+    elements.append(table)
+
+    doc.build(elements)
+    observe_export('pdf', len(bills), time.perf_counter() - started)
+    return len(bills)
+
+
+def write_invoice_zip(output, filters, company, progress=None):
+    """
+    Render the invoice PDF of every filtered bill into a ZIP archive.
+
+    Bills are loaded INVOICE_CHUNK_SIZE at a time with their customer and
+    items, and each PDF is added to the archive as soon as it is rendered.
+
+    Args:
+        output: Path or binary file object for the ZIP
+        filters (dict): Bill list filters
+        company (Company): Company printed on the invoices
+        progress (callable): Called with the number of invoices rendered so far
+
+    Returns:
+        int: Number of invoices written
+    """
+    started = time.perf_counter()
+    bill_ids = export_bill_ids(filters, order_by=(Bill.bill_date,))
+
+    count = 0
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for start in range(0, len(bill_ids), INVOICE_CHUNK_SIZE):
+            chunk = bill_ids[start:start + INVOICE_CHUNK_SIZE]
+            bills = Bill.query.options(joinedload(Bill.customer), selectinload(Bill.items),
+                                       selectinload(Bill.tax_summary)) \
+                .filter(Bill.id.in_(chunk)).order_by(Bill.bill_date, Bill.id).all()
+            for bill in bills:
+                path = generate_invoice_pdf(bill, company)
+                try:
+                    archive.write(path, f"Invoice_{bill.bill_number.replace('/', '-')}.pdf")
+                finally:
+                    os.remove(path)
+                count += 1
+            if progress:
+                progress(count)
+    observe_export('invoices', count, time.perf_counter() - started)
+    return count
+
+
+def _progress_callback(job):
+    return lambda current: update_progress(job, current)
+
+
+@job_handler('bills_excel_export', label='Bills Excel export', max_attempts=3)
+def run_bills_excel_export(job, filters):
+    update_progress(job, 0, count_export_bills(filters))
+    filename = export_filename('bills_export', 'xlsx', filters)
+    count = write_bills_excel(job_result_path(job, 'export.xlsx'), filters, progress=_progress_callback(job))
+    return {'bills': count, 'file': 'export.xlsx', 'download_name': filename, 'mimetype': EXCEL_MIMETYPE}
+
+
+@job_handler('bills_pdf_export', label='Bills PDF export', max_attempts=3)
+def run_bills_pdf_export(job, filters):
+    update_progress(job, 0, count_export_bills(filters))
+    filename = export_filename('bills_export', 'pdf', filters)
+    count = write_bills_pdf(job_result_path(job, 'export.pdf'), filters, progress=_progress_callback(job))
+    return {'bills': count, 'file': 'export.pdf', 'download_name': filename, 'mimetype': 'application/pdf'}
+
+
+@job_handler('invoice_pdf_batch', label='Invoice PDFs', max_attempts=3)
+def run_invoice_pdf_batch(job, filters):
+    company = Company.query.first()
+    if company is None:
+        raise ValueError('Company details are not configured')
+    update_progress(job, 0, count_export_bills(filters))
+    filename = export_filename('invoices', 'zip', filters)
+    count = write_invoice_zip(job_result_path(job, 'invoices.zip'), filters, company,
+                              progress=_progress_callback(job))
+    return {'invoices': count, 'file': 'invoices.zip', 'download_name': filename, 'mimetype': 'application/zip'}
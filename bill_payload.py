@@ -0,0 +1,378 @@
+"""
+JSON bill payloads with the line items as parallel arrays.
+
+A large invoice submitted through BillForm builds a nested WTForms form
+per line, each with a product SelectField listing the whole catalogue.
+The JSON API takes the same bill as one object instead:
+
+    {
+        "customer_id": 12,
+        "bill_date": "2026-10-19",
+        "due_date": "2026-11-18",          (optional)
+        "status": "Draft",                 (optional)
+        "discount_type": "percentage",     (optional: none, percentage, amount)
+        "discount_value": "5",             (optional)
+        "notes": "...",                    (optional)
+        "items": {
+            "product_id":   [101, 102],
+            "product_name": ["Steel Bolt", "Brass Hinge"],
+            "hsn_code":     ["7318", "8302"],
+            "quantity":     ["10", 4],
+            "rate":         ["12.50", "80"],
+            "gst_rate":     [18, 18],
+            "unit":         ["Nos", "Nos"],          (optional)
+            "description":  ["", "Antique finish"],  (optional)
+            "item_id":      [55, null]               (optional, when editing)
+        }
+    }
+
+The schema below is compiled once into per-field parser functions; a
+payload is validated column by column without building any form objects,
+and produces the same header values and normalized lines as the forms, so
+it goes through the same create and edit code (bill_utils).
+"""
+
+from collections import namedtuple
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from itertools import repeat
+from sqlalchemy import select
+from extensions import db
+from models import Customer, Product
+
+# Most lines accepted in one bill
+MAX_BILL_LINES = 5000
+# Errors reported per payload; validation stops after this many
+MAX_ERRORS = 50
+
+BILL_STATUSES = ('Draft', 'Sent', 'Paid', 'Cancelled')
+DISCOUNT_TYPES = ('none', 'percentage', 'amount')
+
+# kind: a parser name from PARSERS or a tuple of allowed values
+FieldRule = namedtuple('FieldRule', ['name', 'kind', 'required', 'default', 'max_length'])
+
+HEADER_SCHEMA = (
+    FieldRule('customer_id', 'id', True, None, None),
+    FieldRule('bill_date', 'date', True, None, None),
+    FieldRule('due_date', 'date', False, None, None),
+    FieldRule('status', BILL_STATUSES, False, None, None),
+    FieldRule('discount_type', DISCOUNT_TYPES, False, 'none', None),
+    FieldRule('discount_value', 'amount', False, Decimal('0'), None),
+    FieldRule('notes', 'text', False, None, None),
+)
+
+# Keys match bill_utils.normalize_line
+LINE_SCHEMA = (
+    FieldRule('item_id', 'id', False, None, None),
+    FieldRule('product_id', 'id', True, None, None),
+    FieldRule('product_name', 'text', True, None, 200),
+    FieldRule('description', 'text', False, '', None),
+    FieldRule('hsn_code', 'text', True, None, 10),
+    FieldRule('quantity', 'quantity', True, None, None),
+    FieldRule('unit', 'text', False, 'Nos', 20),
+    FieldRule('rate', 'amount', False, Decimal('0'), None),
+    FieldRule('gst_rate', 'percent', False, Decimal('18'), None),
+)
+
+
+class BillPayloadError(ValueError):
+    """A bill payload failed validation; ``errors`` maps field paths to messages"""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid bill field(s)")
+        self.errors = errors
+
+
+def _parse_id(value):
+    if type(value) is int:
+        number = value
+    elif isinstance(value, str) and value.isdigit():
+        number = int(value)
+    else:
+        raise ValueError('must be an id')
+    if number <= 0:
+        raise ValueError('must be an id')
+    return number
+
+
+def _parse_decimal(value):
+    if isinstance(value, str):
+        try:
+            number = Decimal(value.strip())
+        except InvalidOperation:
+            raise ValueError('must be a number')
+    elif type(value) is int:
+        number = Decimal(value)
+    elif type(value) is float:
+        number = Decimal(repr(value))
+    else:
+        raise ValueError('must be a number')
+    if not number.is_finite():
+        raise ValueError('must be a number')
+    return number
+
+
+def _parse_amount(value):
+    number = _parse_decimal(value)
+    if number < 0:
+        raise ValueError('must not be negative')
+    return number
+
+
+def _parse_quantity(value):
+    number = _parse_decimal(value)
+    if number <= 0:
+        raise ValueError('must be greater than 0')
+    return number
+
+
+def _parse_percent(value):
+    number = _parse_decimal(value)
+    if not 0 <= number <= 100:
+        raise ValueError('must be between 0 and 100')
+    return number
+
+
+def _parse_date(value):
+    if not isinstance(value, str):
+        raise ValueError('must be a date (YYYY-MM-DD)')
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError('must be a date (YYYY-MM-DD)')
+
+
+def _parse_text(value):
+    if not isinstance(value, str):
+        raise ValueError('must be text')
+    return value.strip()
+
+
+PARSERS = {
+    'id': _parse_id,
+    'amount': _parse_amount,
+    'quantity': _parse_quantity,
+    'percent': _parse_percent,
+    'date': _parse_date,
+    'text': _parse_text,
+}
+
+
+# (lowest allowed, lowest is allowed, highest allowed) of the number kinds
+_NUMBER_BOUNDS = {
+    'amount': (Decimal('0'), True, None),
+    'quantity': (Decimal('0'), False, None),
+    'percent': (Decimal('0'), True, Decimal('100')),
+}
+
+
+_INT_TYPE = {int}
+_STR_TYPE = {str}
+_NUMBER_TYPES = {str, int}
+
+
+def _fast_ids(column, rule):
+    if set(map(type, column)) == _INT_TYPE and min(column) > 0:
+        return list(column)
+    return None
+
+
+def _fast_text(column, rule):
+    if set(map(type, column)) != _STR_TYPE:
+        return None
+    parsed = list(map(str.strip, column))
+    if rule.max_length and max(map(len, parsed)) > rule.max_length:
+        return None
+    if not all(parsed):
+        if rule.required:
+            return None
+        parsed = [value or rule.default for value in parsed]
+    return parsed
+
+
+def _fast_numbers(column, rule):
+    if not set(map(type, column)) <= _NUMBER_TYPES:
+        return None
+    low, low_allowed, high = _NUMBER_BOUNDS[rule.kind]
+    try:
+        parsed = list(map(Decimal, column))
+        lowest, highest = min(parsed), max(parsed)
+    except (InvalidOperation, ValueError):
+        return None
+    # Infinity would be the highest value; NaN fails the min/max comparisons
+    if lowest < low or (lowest == low and not low_allowed) or not highest.is_finite() \
+            or (high is not None and highest > high):
+        return None
+    return parsed
+
+
+# Whole-column checks for the usual, well-formed column; a column they
+# reject (returning None) is parsed value by value to report each error
+FAST_COLUMN_PARSERS = {
+    'id': _fast_ids,
+    'text': _fast_text,
+    'amount': _fast_numbers,
+    'quantity': _fast_numbers,
+    'percent': _fast_numbers,
+}
+
+CompiledRule = namedtuple('CompiledRule', ['name', 'parse', 'required', 'default', 'parse_column'])
+
+
+def _compile_rule(rule):
+    """Resolve a FieldRule into a CompiledRule with the checks folded into its parsers"""
+    if isinstance(rule.kind, tuple):
+        allowed = frozenset(rule.kind)
+        message = f"must be one of: {', '.join(rule.kind)}"
+
+        def parse(value):
+            if not isinstance(value, str) or value not in allowed:
+                raise ValueError(message)
+            return value
+    elif rule.max_length:
+        base, max_length = PARSERS[rule.kind], rule.max_length
+        message = f"must be at most {max_length} characters"
+
+        def parse(value):
+            value = base(value)
+            if len(value) > max_length:
+                raise ValueError(message)
+            return value
+    else:
+        parse = PARSERS[rule.kind]
+
+    fast = FAST_COLUMN_PARSERS.get(rule.kind) if isinstance(rule.kind, str) else None
+    parse_column = (lambda column: fast(column, rule)) if fast else (lambda column: None)
+    return CompiledRule(rule.name, parse, rule.required, rule.default, parse_column)
+
+
+_HEADER_RULES = tuple(_compile_rule(rule) for rule in HEADER_SCHEMA)
+_LINE_RULES = tuple(_compile_rule(rule) for rule in LINE_SCHEMA)
+_LINE_NAMES = tuple(rule.name for rule in LINE_SCHEMA)
+_REQUIRED_COLUMNS = tuple(rule.name for rule in LINE_SCHEMA if rule.required)
+
+
+def _is_blank(value):
+    return value is None or value == ''
+
+
+def _validate_header(payload, errors):
+    header = {}
+    for name, parse, required, default, parse_column in _HEADER_RULES:
+        value = payload.get(name)
+        if _is_blank(value):
+            if required:
+                errors[name] = 'is required'
+            header[name] = default
+            continue
+        try:
+            header[name] = parse(value)
+        except ValueError as e:
+            errors[name] = str(e)
+    return header
+
+
+def _validate_columns(items, errors):
+    """Parse each column of the items object; returns the parsed columns (None where absent)"""
+    if not isinstance(items, dict):
+        errors['items'] = 'must be an object of arrays'
+        return None, 0
+
+    length, missing = None, False
+    for name in _REQUIRED_COLUMNS:
+        column = items.get(name)
+        if not isinstance(column, list):
+            errors[f"items.{name}"] = 'is required (an array)'
+            missing = True
+        elif length is None:
+            length = len(column)
+    if missing:
+        return None, 0
+    if length == 0:
+        errors['items'] = 'must have at least one line'
+        return None, 0
+    if length > MAX_BILL_LINES:
+        errors['items'] = f"must have at most {MAX_BILL_LINES} lines"
+        return None, 0
+
+    columns = []
+    for name, parse, required, default, parse_column in _LINE_RULES:
+        column = items.get(name)
+        if column is None:
+            columns.append(None)
+            continue
+        if not isinstance(column, list) or len(column) != length:
+            errors[f"items.{name}"] = f"must be an array of {length} values"
+            columns.append(None)
+            continue
+        parsed = parse_column(column)
+        if parsed is not None:
+            columns.append(parsed)
+            continue
+        parsed = [default] * length
+        for index, value in enumerate(column):
+            if _is_blank(value):
+                if required:
+                    errors[f"items.{name}[{index}]"] = 'is required'
+                continue
+            try:
+                parsed[index] = parse(value)
+            except ValueError as e:
+                errors[f"items.{name}[{index}]"] = str(e)
+                if len(errors) >= MAX_ERRORS:
+                    return None, 0
+        columns.append(parsed)
+    return columns, length
+
+
+def validate_bill_payload(payload):
+    """
+    Validate a JSON bill payload.
+
+    Args:
+        payload (dict): Decoded JSON body
+
+    Returns:
+        tuple: (header, lines) - HEADER_FIELDS values and lines shaped like
+            bill_utils.normalize_line output
+
+    Raises:
+        BillPayloadError: With every problem found (up to MAX_ERRORS)
+    """
+    if not isinstance(payload, dict):
+        raise BillPayloadError({'payload': 'must be a JSON object'})
+    errors = {}
+    header = _validate_header(payload, errors)
+    columns, length = _validate_columns(payload.get('items'), errors)
+    if errors:
+        raise BillPayloadError(errors)
+
+    filled = [column if column is not None else [rule.default] * length
+              for column, rule in zip(columns, _LINE_RULES)]
+    lines = list(map(dict, map(zip, repeat(_LINE_NAMES), zip(*filled))))
+    return header, lines
+
+
+def check_bill_references(header, lines):
+    """
+    Check that the customer and products of a validated payload exist.
+
+    Two queries whatever the number of lines, instead of the forms' choice
+    lists of every customer and product.
+
+    Raises:
+        BillPayloadError: For an unknown customer or product
+    """
+    errors = {}
+    if db.session.get(Customer, header['customer_id']) is None:
+        errors['customer_id'] = 'unknown customer'
+
+    product_ids = {line['product_id'] for line in lines}
+    found = set(db.session.execute(select(Product.id).where(Product.id.in_(product_ids))).scalars())
+    for index, line in enumerate(lines):
+        if line['product_id'] not in found:
+            errors[f"items.product_id[{index}]"] = 'unknown product'
+            if len(errors) >= MAX_ERRORS:
+                break
+    if errors:
+        raise BillPayloadError(errors)
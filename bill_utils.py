@@ -0,0 +1,483 @@
+"""
+Bill item helpers shared by bill creation and editing.
+
+Submitted invoice lines are reconciled against the bill's existing BillItem
+rows instead of deleting and recreating every item. Only rows whose values
+changed are written, GST is recalculated only for lines whose amount inputs
+changed, and the bill header totals are adjusted by the per-line deltas.
+
+The per-HSN/per-rate tax breakup of each bill is stored in BillTaxSummary
+rows so invoices and reports can read it without rescanning the items, and
+``check_bill_totals`` detects bills whose stored totals drifted from their
+items.
+"""
+
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from sqlalchemy.orm import selectinload
+from extensions import db
+from gst_calculator import calculate_gst
+from metrics import observe_gst_calculations
+from models import Bill, BillItem, BillTaxSummary, BillSequence, Company, Customer
+
+ZERO = Decimal('0')
+
+# Line values that affect the taxable amount or GST of an item
+MONETARY_FIELDS = ('quantity', 'rate', 'gst_rate')
+# Line values that are copied onto the item but never change the tax
+DESCRIPTIVE_FIELDS = ('product_id', 'product_name', 'description', 'hsn_code', 'unit')
+
+# Header columns kept in sync with the sum of the item rows
+TOTAL_FIELDS = ('amount', 'cgst_amount', 'sgst_amount', 'igst_amount')
+# Bill header column holding the sum of each item column
+HEADER_COLUMNS = {'amount': 'subtotal', 'cgst_amount': 'cgst_amount',
+                  'sgst_amount': 'sgst_amount', 'igst_amount': 'igst_amount'}
+
+# Amount columns of a BillTaxSummary row
+BREAKUP_FIELDS = ('quantity', 'taxable_amount', 'cgst_amount', 'sgst_amount', 'igst_amount')
+
+
+def _to_decimal(value, default):
+    try:
+        if value is None or str(value).strip() == '':
+            return Decimal(default)
+        return Decimal(str(value).strip())
+    except (InvalidOperation, ValueError, TypeError):
+        return Decimal(default)
+
+
+def _to_int(value):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value or None
+
+
+def normalize_line(data):
+    """
+    Normalize a submitted invoice line into the types stored on BillItem.
+
+    Args:
+        data (dict): Raw line values (item_id, product_id, product_name,
+            description, hsn_code, quantity, unit, rate, gst_rate)
+
+    Returns:
+        dict: Line with Decimal amounts and int/None ids
+    """
+    return {
+        'item_id': _to_int(data.get('item_id')),
+        'product_id': _to_int(data.get('product_id')),
+        'product_name': data.get('product_name'),
+        'description': data.get('description') or '',
+        'hsn_code': data.get('hsn_code'),
+        'quantity': _to_decimal(data.get('quantity'), '1'),
+        'unit': data.get('unit'),
+        'rate': _to_decimal(data.get('rate'), '0'),
+        'gst_rate': _to_decimal(data.get('gst_rate'), '18'),
+    }
+
+
+def line_from_form(item_form):
+    """Build a normalized line from a BillForm ``items`` entry"""
+    # FormField.data is the nested form's data; attribute access would hit
+    # FormField's own attributes (e.g. ``description``) instead
+    return normalize_line(item_form.data)
+
+
+def _line_signature(values):
+    return tuple(values.get(f) for f in DESCRIPTIVE_FIELDS + MONETARY_FIELDS)
+
+
+def _item_signature(item):
+    return tuple(getattr(item, f) for f in DESCRIPTIVE_FIELDS + MONETARY_FIELDS)
+
+
+def _item_totals(item):
+    return {f: getattr(item, f) or ZERO for f in TOTAL_FIELDS}
+
+
+def calculate_line_amounts(item, seller_state, buyer_state):
+    """Recalculate the amount and GST columns of a single item in place"""
+    item.amount = (item.quantity * item.rate).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    item.taxable_amount = item.amount  # Legacy column mirrors amount
+
+    gst_amounts = calculate_gst(item.amount, item.gst_rate, seller_state, buyer_state)
+    item.cgst_amount = gst_amounts['cgst']
+    item.sgst_amount = gst_amounts['sgst']
+    item.igst_amount = gst_amounts['igst']
+
+    # Legacy columns
+    item.unit_price = item.rate
+    item.gst_amount = item.cgst_amount + item.sgst_amount + item.igst_amount
+    item.total_amount = item.amount + item.gst_amount
+
+
+def reconcile_bill_items(bill, lines, seller_state, buyer_state, recalculate_all=False):
+    """
+    Reconcile submitted lines with the bill's existing items.
+
+    Lines carrying an ``item_id`` of one of the bill's items update that row;
+    lines without one first reuse an unclaimed row with identical values and
+    are otherwise inserted. Rows left unclaimed are deleted. GST is only
+    recalculated for inserted rows and rows whose quantity, rate or GST rate
+    changed, unless ``recalculate_all`` is set (e.g. the place of supply
+    changed between intra- and inter-state).
+
+    The bill's subtotal and CGST/SGST/IGST columns are adjusted by the
+    difference between the old and new values of the touched rows. Call
+    ``apply_bill_totals`` afterwards to refresh discount and grand total.
+
+    Args:
+        bill (Bill): The bill being created or edited
+        lines (list): Normalized lines from ``normalize_line``
+        seller_state (str): Company state code
+        buyer_state (str): Customer state code
+        recalculate_all (bool): Recalculate GST for every kept line
+
+    Returns:
+        dict: Counts of 'inserted', 'updated', 'recalculated', 'deleted'
+            and 'unchanged' rows
+    """
+    existing = {item.id: item for item in bill.items if item.id is not None}
+    lines = [line for line in lines if line.get('product_name')]
+    started = time.perf_counter()
+    assigned = [None] * len(lines)
+    claimed = set()
+
+    # Explicit matches first, so a content match cannot steal a referenced row
+    for index, line in enumerate(lines):
+        item = existing.get(line.get('item_id'))
+        if item is not None and item.id not in claimed:
+            assigned[index] = item
+            claimed.add(item.id)
+
+    unclaimed_by_signature = {}
+    for item in existing.values():
+        if item.id not in claimed:
+            unclaimed_by_signature.setdefault(_item_signature(item), []).append(item)
+
+    for index, line in enumerate(lines):
+        if assigned[index] is None:
+            bucket = unclaimed_by_signature.get(_line_signature(line))
+            if bucket:
+                assigned[index] = bucket.pop(0)
+                claimed.add(assigned[index].id)
+
+    deltas = {f: ZERO for f in TOTAL_FIELDS}
+    stats = {'inserted': 0, 'updated': 0, 'recalculated': 0, 'deleted': 0, 'unchanged': 0}
+
+    for line, item in zip(lines, assigned):
+        if item is None:
+            item = BillItem(**{f: line[f] for f in DESCRIPTIVE_FIELDS + MONETARY_FIELDS})
+            calculate_line_amounts(item, seller_state, buyer_state)
+            bill.items.append(item)
+            for f in TOTAL_FIELDS:
+                deltas[f] += getattr(item, f)
+            stats['inserted'] += 1
+            continue
+
+        changed = [f for f in DESCRIPTIVE_FIELDS + MONETARY_FIELDS if getattr(item, f) != line[f]]
+        for f in changed:
+            setattr(item, f, line[f])
+        if changed:
+            stats['updated'] += 1
+        else:
+            stats['unchanged'] += 1
+
+        if recalculate_all or any(f in MONETARY_FIELDS for f in changed):
+            before = _item_totals(item)
+            calculate_line_amounts(item, seller_state, buyer_state)
+            for f in TOTAL_FIELDS:
+                deltas[f] += getattr(item, f) - before[f]
+            stats['recalculated'] += 1
+
+    for item_id, item in existing.items():
+        if item_id not in claimed:
+            for f, value in _item_totals(item).items():
+                deltas[f] -= value
+            bill.items.remove(item)  # delete-orphan cascade removes the row
+            stats['deleted'] += 1
+
+    bill.subtotal = (bill.subtotal or ZERO) + deltas['amount']
+    bill.cgst_amount = (bill.cgst_amount or ZERO) + deltas['cgst_amount']
+    bill.sgst_amount = (bill.sgst_amount or ZERO) + deltas['sgst_amount']
+    bill.igst_amount = (bill.igst_amount or ZERO) + deltas['igst_amount']
+
+    observe_gst_calculations(stats['inserted'] + stats['recalculated'], time.perf_counter() - started)
+    return stats
+
+
+# Bill header values set by the create and edit forms and the JSON API
+HEADER_FIELDS = ('customer_id', 'bill_date', 'due_date', 'status', 'discount_type', 'discount_value', 'notes')
+
+
+def header_from_form(form):
+    """Bill header values from a BillForm"""
+    return {f: form[f].data for f in HEADER_FIELDS}
+
+
+def format_bill_number(year, number):
+    return f"INV-{year}-{number:04d}"
+
+
+def reserve_bill_numbers(count=1, year=None):
+    """
+    Reserve a run of INV-<year>-NNNN numbers (committed with the caller's transaction).
+
+    The year's BillSequence row is locked until commit, so bills created on
+    the server and blocks leased to devices never get the same number.
+
+    Returns:
+        tuple: (year, first reserved number)
+    """
+    year = year or datetime.now().year
+    sequence = BillSequence.query.filter_by(year=year).with_for_update().first()
+    if not sequence:
+        sequence = BillSequence(year=year, sequence_number=0)
+        db.session.add(sequence)
+    first = sequence.sequence_number + 1
+    sequence.sequence_number += count
+    return year, first
+
+
+def next_bill_number(year=None):
+    """Reserve the next INV-<year>-NNNN number (committed with the bill)"""
+    return format_bill_number(*reserve_bill_numbers(1, year))
+
+
+def _seller_state():
+    company = Company.query.first()
+    return company.state_code if company else '27'
+
+
+def _buyer_state(customer_id, seller_state):
+    customer = db.session.get(Customer, customer_id)
+    return customer.state_code if customer and customer.state_code else seller_state
+
+
+def create_bill_from_lines(header, lines, bill_number=None, seller_state=None):
+    """
+    Create a bill from header values and normalized lines.
+
+    Shared by the bill form, the JSON bill API and offline bill uploads;
+    the caller commits.
+
+    Args:
+        header (dict): HEADER_FIELDS values
+        lines (list): Normalized lines from ``normalize_line``
+        bill_number (str): Number already assigned (an offline bill); the next one by default
+        seller_state (str): Company state code, when the caller already has it
+
+    Returns:
+        Bill: The new bill, added to the session
+    """
+    bill = Bill(
+        bill_number=bill_number or next_bill_number(),
+        customer_id=header['customer_id'],
+        bill_date=header['bill_date'],
+        due_date=header.get('due_date'),
+        status=header.get('status') or 'Draft',
+        discount_type=header.get('discount_type') or 'none',
+        discount_value=header.get('discount_value') or 0,
+        notes=header.get('notes')
+    )
+    seller_state = seller_state or _seller_state()
+    reconcile_bill_items(bill, lines, seller_state, _buyer_state(header['customer_id'], seller_state))
+    apply_bill_totals(bill)
+    db.session.add(bill)
+    return bill
+
+
+def update_bill_from_lines(bill, header, lines):
+    """
+    Apply edited header values and lines to a bill; the caller commits.
+
+    Only the item rows that changed are written (see reconcile_bill_items).
+
+    Returns:
+        dict: reconcile_bill_items counts
+    """
+    seller_state = _seller_state()
+    old_buyer_state = bill.customer.state_code or seller_state
+
+    bill.customer_id = header['customer_id']
+    bill.bill_date = header['bill_date']
+    bill.due_date = header.get('due_date')
+    bill.status = header.get('status') or bill.status
+    bill.discount_type = header.get('discount_type') or 'none'
+    bill.discount_value = header.get('discount_value') or 0
+    bill.notes = header.get('notes')
+
+    buyer_state = _buyer_state(header['customer_id'], seller_state)
+    # Switching between intra- and inter-state supply changes the tax on every line
+    supply_type_changed = (old_buyer_state == seller_state) != (buyer_state == seller_state)
+
+    stats = reconcile_bill_items(bill, lines, seller_state, buyer_state, recalculate_all=supply_type_changed)
+    apply_bill_totals(bill)
+    # Item-only edits leave the bill row unchanged, so onupdate would not fire;
+    # stored as naive UTC like the column default (http_cache.py relies on it)
+    bill.updated_at = datetime.utcnow()
+    return stats
+
+
+def calculate_discount(subtotal, discount_type, discount_value):
+    """Return the discount amount for a subtotal and the bill's discount settings"""
+    discount_value = Decimal(str(discount_value or 0))
+    if discount_type == 'percentage' and discount_value > 0:
+        return (subtotal * discount_value) / 100
+    if discount_type == 'amount' and discount_value > 0:
+        return min(discount_value, subtotal)
+    return ZERO
+
+
+def apply_bill_totals(bill):
+    """
+    Finish the bill totals after its items and header sums are up to date.
+
+    Recomputes the discount and grand total from the header columns and
+    refreshes the stored tax breakup rows.
+    """
+    subtotal = bill.subtotal or ZERO
+    discount_amount = calculate_discount(subtotal, bill.discount_type, bill.discount_value)
+
+    total_gst = (bill.cgst_amount or ZERO) + (bill.sgst_amount or ZERO) + (bill.igst_amount or ZERO)
+    bill.discount_amount = discount_amount
+    bill.gst_amount = total_gst  # Legacy column
+    bill.total_amount = subtotal - discount_amount + total_gst
+    bill.final_amount = bill.total_amount  # Legacy column
+
+    refresh_tax_summary(bill)
+
+
+def _breakup_key(hsn_code, gst_rate, unit):
+    return (hsn_code, Decimal(str(gst_rate or 0)), unit)
+
+
+def compute_tax_breakup(items):
+    """
+    Group item amounts by HSN code, GST rate and unit.
+
+    Returns:
+        dict: (hsn_code, gst_rate, unit) -> {field: Decimal} for BREAKUP_FIELDS
+    """
+    breakup = {}
+    for item in items:
+        key = _breakup_key(item.hsn_code, item.gst_rate, item.unit)
+        row = breakup.get(key)
+        if row is None:
+            row = breakup[key] = dict.fromkeys(BREAKUP_FIELDS, ZERO)
+        row['quantity'] += item.quantity or ZERO
+        row['taxable_amount'] += item.amount or ZERO
+        row['cgst_amount'] += item.cgst_amount or ZERO
+        row['sgst_amount'] += item.sgst_amount or ZERO
+        row['igst_amount'] += item.igst_amount or ZERO
+    return breakup
+
+
+def stored_tax_breakup(bill):
+    """Return the bill's stored BillTaxSummary rows in compute_tax_breakup's shape"""
+    return {_breakup_key(row.hsn_code, row.gst_rate, row.unit):
+            {f: getattr(row, f) or ZERO for f in BREAKUP_FIELDS}
+            for row in bill.tax_summary}
+
+
+def get_tax_breakup(bill):
+    """
+    Return the bill's tax breakup, preferring the stored rows.
+
+    Bills saved before the breakup was stored fall back to grouping the items.
+    """
+    if bill.tax_summary:
+        return stored_tax_breakup(bill)
+    return compute_tax_breakup(bill.items)
+
+
+def refresh_tax_summary(bill):
+    """Bring the bill's BillTaxSummary rows in line with its items, writing only changed rows"""
+    existing = {_breakup_key(row.hsn_code, row.gst_rate, row.unit): row for row in bill.tax_summary}
+
+    for key, values in compute_tax_breakup(bill.items).items():
+        row = existing.pop(key, None)
+        if row is None:
+            hsn_code, gst_rate, unit = key
+            bill.tax_summary.append(BillTaxSummary(hsn_code=hsn_code, gst_rate=gst_rate, unit=unit, **values))
+            continue
+        for field, value in values.items():
+            if getattr(row, field) != value:
+                setattr(row, field, value)
+
+    for row in existing.values():
+        bill.tax_summary.remove(row)
+
+
+def find_bill_drift(bill):
+    """
+    Compare a bill's stored totals and tax breakup with its items.
+
+    Returns:
+        list: Human-readable descriptions of each mismatch (empty if consistent)
+    """
+    issues = []
+
+    sums = {f: sum((getattr(item, f) or ZERO for item in bill.items), ZERO) for f in TOTAL_FIELDS}
+    for field, column in HEADER_COLUMNS.items():
+        stored = getattr(bill, column) or ZERO
+        if stored != sums[field]:
+            issues.append(f"{column}: stored {stored}, items sum to {sums[field]}")
+
+    subtotal = bill.subtotal or ZERO
+    expected_total = (subtotal - calculate_discount(subtotal, bill.discount_type, bill.discount_value)
+                      + (bill.cgst_amount or ZERO) + (bill.sgst_amount or ZERO) + (bill.igst_amount or ZERO))
+    if (bill.total_amount or ZERO).quantize(Decimal('0.01')) != expected_total.quantize(Decimal('0.01')):
+        issues.append(f"total_amount: stored {bill.total_amount}, header columns give {expected_total}")
+
+    stored = stored_tax_breakup(bill)
+    computed = compute_tax_breakup(bill.items)
+    for key in sorted(set(stored) | set(computed), key=str):
+        if stored.get(key) != computed.get(key):
+            hsn_code, gst_rate, unit = key
+            issues.append(f"tax summary HSN {hsn_code} @ {gst_rate}% ({unit}): "
+                          f"stored {stored.get(key)}, items give {computed.get(key)}")
+
+    return issues
+
+
+def repair_bill_totals(bill):
+    """Reset a bill's header sums from its items and rebuild the stored breakup"""
+    for field, column in HEADER_COLUMNS.items():
+        setattr(bill, column, sum((getattr(item, field) or ZERO for item in bill.items), ZERO))
+    apply_bill_totals(bill)
+
+
+def check_bill_totals(fix=False, batch_size=500):
+    """
+    Scan all bills for totals or tax breakup drift.
+
+    Bills are loaded in id order in batches, with items and tax summary rows
+    fetched in bulk per batch.
+
+    Args:
+        fix (bool): Repair drifting bills and commit after each batch
+        batch_size (int): Number of bills loaded per batch
+
+    Yields:
+        tuple: (bill_number, issues) for each bill with drift
+    """
+    last_id = 0
+    while True:
+        batch = Bill.query.options(selectinload(Bill.items), selectinload(Bill.tax_summary)) \
+            .filter(Bill.id > last_id).order_by(Bill.id).limit(batch_size).all()
+        if not batch:
+            break
+        for bill in batch:
+            issues = find_bill_drift(bill)
+            if issues:
+                if fix:
+                    repair_bill_totals(bill)
+                yield bill.bill_number, issues
+        last_id = batch[-1].id
+        if fix:
+            db.session.commit()
+        db.session.expunge_all()
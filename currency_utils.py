@@ -3,6 +3,8 @@ Utility functions for currency formatting and number to words conversion
 with special handling for Indian rupee symbol
 """
 
+from utils import format_indian_number
+
 def format_rupee(amount, space_after_symbol=True, use_fallback=False):
     """
     Format amount with rupee symbol, ensuring compatibility with PDF rendering
@@ -15,11 +17,8 @@ def format_rupee(amount, space_after_symbol=True, use_fallback=False):
     Returns:
         Formatted string with rupee symbol and amount
     """
-    if amount is None:
-        amount = 0
-        
-    # Format the number with 2 decimal places
-    formatted_amount = f"{float(amount):.2f}"
+    # Indian digit grouping (12,34,567.89), rounded on the Decimal path
+    formatted_amount = format_indian_number(amount)
     
     # Use 'Rs.' text as a fallback if fonts have issues with ₹ symbol
     if use_fallback:
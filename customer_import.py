@@ -0,0 +1,255 @@
+"""
+Bulk customer import from CSV or XLSX.
+
+Rows are streamed from the file and processed in batches: each batch has its
+GSTINs validated in one bulk call, is deduplicated against earlier rows of
+the file, and is written with ``INSERT ... ON CONFLICT DO UPDATE`` against
+the customer dedupe indexes (GSTIN, or phone for customers without one), so
+re-importing a file updates existing customers instead of duplicating them.
+Rows need a GSTIN or a phone number so that they can be matched again;
+rejected rows are written to a CSV error report.
+"""
+
+import re
+from datetime import datetime
+from sqlalchemy import select, func, or_, text
+from extensions import db
+from models import Customer, GSTIN_KEY_WHERE, PHONE_KEY_WHERE
+from gstin import STATE_CODES, validate_gstins
+from import_utils import iter_import_rows, count_import_rows, batched, dialect_insert, ErrorReport
+from jobs import job_handler, update_progress, job_result_path
+from sync_feed import record_bulk_changes
+from tax_reports import mark_customers_dirty
+from utils import get_state_name
+
+IMPORT_BATCH_SIZE = 1000
+
+CUSTOMER_COLUMNS = ('name', 'email', 'phone', 'address', 'gst_number', 'state_code')
+
+# Accepted header spellings (after normalize_header) for each column
+CUSTOMER_ALIASES = {
+    'customer_name': 'name', 'customer': 'name', 'party_name': 'name',
+    'email_id': 'email', 'e_mail': 'email',
+    'mobile': 'phone', 'mobile_number': 'phone', 'phone_number': 'phone', 'contact': 'phone',
+    'gstin': 'gst_number', 'gst': 'gst_number', 'gst_no': 'gst_number', 'gstin_uin': 'gst_number',
+    'state': 'state_code', 'state_name': 'state_code', 'place_of_supply': 'state_code',
+}
+
+STATE_CODES_BY_NAME = {get_state_name(code).lower(): code for code in sorted(STATE_CODES)
+                       if get_state_name(code) != 'Unknown'}
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def normalize_phone(phone):
+    """Reduce a phone number to its digits, dropping a +91 or leading 0 from mobiles"""
+    digits = _NON_DIGITS.sub('', phone or '')
+    if len(digits) == 12 and digits.startswith('91'):
+        digits = digits[2:]
+    elif len(digits) == 11 and digits.startswith('0'):
+        digits = digits[1:]
+    return digits if 6 <= len(digits) <= 15 else None
+
+
+def resolve_state_code(value):
+    """
+    Resolve a state code or state name.
+
+    Returns:
+        tuple: (state_code or None, error message or None)
+    """
+    value = (value or '').strip()
+    if not value:
+        return None, None
+    if value.isdigit():
+        code = value.zfill(2)
+        return (code, None) if code in STATE_CODES else (None, f"Unknown state code '{value}'")
+    code = STATE_CODES_BY_NAME.get(value.lower())
+    return (code, None) if code else (None, f"Unknown state '{value}'")
+
+
+def find_duplicate_customer(gst_number, phone, is_guest=False, exclude_id=None):
+    """
+    Find an existing customer with the same dedupe key.
+
+    Customers are keyed by GSTIN when they have one, otherwise (unless they
+    are guests) by phone, matching the uix_customer_* indexes.
+
+    Returns:
+        Customer: The conflicting customer, or None
+    """
+    if gst_number:
+        query = Customer.query.filter(Customer.gst_number == gst_number)
+    elif phone and not is_guest:
+        query = Customer.query.filter(Customer.phone == phone, Customer.is_guest.is_(False),
+                                      or_(Customer.gst_number.is_(None), Customer.gst_number == ''))
+    else:
+        return None
+    if exclude_id:
+        query = query.filter(Customer.id != exclude_id)
+    return query.first()
+
+
+def _prepare_batch(batch, seen, report):
+    """Validate and normalize a batch of rows, reporting rejected ones"""
+    records = []
+    gstins = validate_gstins(row.get('gst_number') for _, row in batch)
+    now = datetime.utcnow()
+
+    for (row_number, row), gstin in zip(batch, gstins):
+        name = row.get('name', '')
+        if not name:
+            report.add(row_number, 'Name is required', row)
+            continue
+        if len(name) > 200:
+            report.add(row_number, 'Name is longer than 200 characters', row)
+            continue
+
+        email = row.get('email') or None
+        if email and ('@' not in email or len(email) > 120):
+            report.add(row_number, f"Invalid email '{email}'", row)
+            continue
+
+        gst_number = gstin.gstin or None
+        if gst_number and not gstin.valid:
+            report.add(row_number, f"GSTIN: {gstin.error}", row)
+            continue
+
+        state_code, state_error = resolve_state_code(row.get('state_code'))
+        if state_error:
+            report.add(row_number, state_error, row)
+            continue
+        if gst_number:
+            if state_code and state_code != gstin.state_code:
+                report.add(row_number, f"GSTIN state {gstin.state_code} does not match state {state_code}", row)
+                continue
+            state_code = gstin.state_code
+
+        phone = normalize_phone(row.get('phone'))
+        if row.get('phone') and not phone:
+            report.add(row_number, f"Invalid phone number '{row['phone']}'", row)
+            continue
+
+        # Without a GSTIN or phone a row could not be matched on re-import, so it is rejected
+        if not gst_number and not phone:
+            report.add(row_number, 'GSTIN or phone is required to identify the customer', row)
+            continue
+        key = ('GSTIN', gst_number) if gst_number else ('phone', phone)
+        if key in seen:
+            report.add(row_number, f"Duplicate of row {seen[key]} (same {key[0]})", row)
+            continue
+        seen[key] = row_number
+
+        records.append({
+            'name': name,
+            'email': email,
+            'phone': phone,
+            'address': row.get('address') or None,
+            'gst_number': gst_number,
+            'state_code': state_code,
+            'is_guest': False,
+            'custom_fields': {},
+            'created_at': now,
+            'updated_at': now,
+        })
+    return records
+
+
+def _upsert_statement(key_column, key_where):
+    """INSERT ... ON CONFLICT (key) DO UPDATE, keeping existing values where the import is blank"""
+    stmt = dialect_insert(Customer)
+    excluded = stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=[key_column],
+        index_where=text(key_where),
+        set_={
+            'name': excluded.name,
+            'email': func.coalesce(excluded.email, Customer.email),
+            'phone': func.coalesce(excluded.phone, Customer.phone),
+            'address': func.coalesce(excluded.address, Customer.address),
+            'state_code': func.coalesce(excluded.state_code, Customer.state_code),
+            'updated_at': excluded.updated_at,
+        })
+
+
+def _upsert_customers(records):
+    """
+    Write a batch of prepared customers.
+
+    Returns:
+        tuple: (inserted, updated)
+    """
+    by_gstin = [r for r in records if r['gst_number']]
+    by_phone = [r for r in records if not r['gst_number']]
+
+    # Existing customers the batch will update: counted for the summary, and
+    # a changed state moves their bills to another place of supply
+    existing = {}
+    if by_gstin:
+        existing.update(((customer.gst_number, None), customer) for customer in db.session.execute(
+            select(Customer.id, Customer.gst_number, Customer.state_code).where(
+                Customer.gst_number.in_([r['gst_number'] for r in by_gstin]))))
+    if by_phone:
+        existing.update(((None, customer.phone), customer) for customer in db.session.execute(
+            select(Customer.id, Customer.phone, Customer.state_code).where(
+                Customer.phone.in_([r['phone'] for r in by_phone]),
+                Customer.is_guest.is_(False),
+                or_(Customer.gst_number.is_(None), Customer.gst_number == ''))))
+    moved = []
+    for r in records:
+        customer = existing.get((r['gst_number'], None) if r['gst_number'] else (None, r['phone']))
+        if customer is not None and r['state_code'] and r['state_code'] != customer.state_code:
+            moved.append(customer.id)
+
+    if by_gstin:
+        db.session.execute(_upsert_statement('gst_number', GSTIN_KEY_WHERE), by_gstin)
+    if by_phone:
+        db.session.execute(_upsert_statement('phone', PHONE_KEY_WHERE), by_phone)
+    if records:
+        # Inserted and updated rows all carry the batch's updated_at
+        record_bulk_changes(Customer, Customer.updated_at == records[0]['updated_at'])
+        mark_customers_dirty(moved)
+
+    return len(records) - len(existing), len(existing)
+
+
+def import_customers(path, error_report_path, job=None, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Import customers from a CSV or XLSX file.
+
+    Args:
+        path (str): Uploaded file
+        error_report_path (str): Where to write the CSV of rejected rows
+        job (Job): Background job to report progress on, if any
+        batch_size (int): Rows validated and upserted per transaction
+
+    Returns:
+        dict: rows, inserted, updated, errors and error_report (path or None)
+    """
+    if job is not None:
+        update_progress(job, 0, count_import_rows(path))
+
+    report = ErrorReport(error_report_path, CUSTOMER_COLUMNS)
+    seen = {}
+    stats = {'rows': 0, 'inserted': 0, 'updated': 0}
+    try:
+        for batch in batched(iter_import_rows(path, CUSTOMER_ALIASES), batch_size):
+            inserted, updated = _upsert_customers(_prepare_batch(batch, seen, report))
+            stats['rows'] += len(batch)
+            stats['inserted'] += inserted
+            stats['updated'] += updated
+            if job is not None:
+                update_progress(job, stats['rows'], commit=False)
+            db.session.commit()
+    finally:
+        report.close()
+
+    stats['errors'] = report.count
+    stats['error_report'] = report.report_path
+    return stats
+
+
+# Upserts make a re-run safe, so a failed import is retried once
+@job_handler('customer_import', label='Customer import', max_attempts=2)
+def run_customer_import(job, path, filename=None):
+    return import_customers(path, job_result_path(job, 'errors.csv'), job=job)
@@ -9,6 +9,14 @@ This script provides commands to:
 4. Downgrade to a specific migration
 5. Create a new migration
 6. Reset and initialize the database with default data
+7. Check stored bill totals and tax breakup for drift
+8. Rebuild the daily GST report aggregates
+9. Generate the GSTR-1 JSON for a return period
+10. Run background job workers
+11. Clean up expired job results and recover stale jobs
+12. Seed synthetic customers, products and bills for load testing
+13. Compact the mobile sync change feed
+14. Build the mobile bootstrap snapshot
 
 Usage:
     python db_manage.py init                     # Initialize the database with all tables
@@ -18,6 +26,18 @@ Usage:
     python db_manage.py upgrade                  # Apply all unapplied migrations
     python db_manage.py downgrade [revision]     # Downgrade to a specific revision
     python db_manage.py revision "message"       # Create a new migration
+    python db_manage.py check-totals [--fix]     # Report (and optionally repair) bill totals drift
+    python db_manage.py refresh-aggregates [--start YYYY-MM-DD] [--end YYYY-MM-DD]
+                                                 # Rebuild the daily GST report aggregates
+    python db_manage.py gstr1 MMYYYY [--output file.json]
+                                                 # Write the GSTR-1 JSON for a return period
+    python db_manage.py worker [--processes N] [--once]
+                                                 # Run background job workers (JOB_QUEUE_MODE=worker)
+    python db_manage.py cleanup-jobs             # Delete expired job results, requeue stale jobs
+    python db_manage.py seed [--customers N] [--products N] [--bills N]
+                                                 # Add synthetic GST billing data for load testing
+    python db_manage.py compact-sync             # Drop sync feed rows superseded by later changes
+    python db_manage.py build-snapshot [--force] # Rebuild the mobile bootstrap snapshot if data changed
 """
 
 import os
@@ -226,7 +246,7 @@ def initialize_data():
                 sample_company = Company(
                     name="My Awesome Company",
                     address="456 Business Avenue, Bangalore, Karnataka",
-                    gst_number="29AABCA1234A1Z5",  # Sample GST for Karnataka
+                    gst_number="29AABCA1234A1ZF",  # Sample GST for Karnataka
                     tan_number="BLRA12345B",
                     state_code="29",
                     created_at=datetime.datetime.now(),
@@ -243,7 +263,7 @@ def initialize_data():
             if customer_count == 0:
                 sample_customer = Customer(
                     name="Sample Business Pvt Ltd",
-                    gst_number="27AABCS1234A1Z5",  # Sample GST number for Maharashtra
+                    gst_number="27AABCS1234A1Z1",  # Sample GST number for Maharashtra
                     address="123 Main Street, Mumbai",
                     state_code="27",
                     phone="9876543210",
@@ -363,6 +383,152 @@ def initialize_data():
         print(f"Error initializing database with default data: {e}")
         return False
 
+def check_totals(fix=False):
+    """Compare stored bill totals and tax breakup with the bill items"""
+    try:
+        from app import app
+        from bill_utils import check_bill_totals
+        
+        with app.app_context():
+            drift_count = 0
+            for bill_number, issues in check_bill_totals(fix=fix):
+                drift_count += 1
+                print(f"{bill_number}:")
+                for issue in issues:
+                    print(f"  - {issue}")
+            
+            if drift_count == 0:
+                print("All bill totals are consistent with their items.")
+            elif fix:
+                print(f"Repaired {drift_count} bill(s).")
+            else:
+                print(f"Found {drift_count} bill(s) with drift. Run with --fix to repair them.")
+            return drift_count == 0 or fix
+    except Exception as e:
+        print(f"Error checking bill totals: {e}")
+        return False
+
+def refresh_aggregates(start=None, end=None):
+    """Rebuild the daily GST report aggregates for a period (all bills by default)"""
+    try:
+        from datetime import datetime
+        from app import app
+        from tax_reports import rebuild_tax_aggregates
+        
+        start_date = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+        end_date = datetime.strptime(end, '%Y-%m-%d').date() if end else None
+        
+        with app.app_context():
+            row_count = rebuild_tax_aggregates(start_date, end_date)
+            print(f"Rebuilt GST report aggregates: {row_count} row(s).")
+            return True
+    except Exception as e:
+        print(f"Error rebuilding GST report aggregates: {e}")
+        return False
+
+def generate_gstr1(period, output=None):
+    """Validate and write the GSTR-1 JSON for a return period"""
+    try:
+        from app import app
+        from gstr1 import validate_gstr1, write_gstr1
+        
+        output = output or f"GSTR1_{period}.json"
+        with app.app_context():
+            errors = validate_gstr1(period)
+            if errors:
+                print(f"GSTR-1 validation failed with {len(errors)} error(s):")
+                for error in errors:
+                    print(f"  - {error}")
+                return False
+            
+            with open(output, 'w', encoding='utf-8') as f:
+                stats = write_gstr1(f, period)
+            print(f"Wrote {output}: {stats['b2b_invoices']} B2B invoice(s) for {stats['b2b_customers']} customer(s), "
+                  f"{stats['b2cs_rows']} B2CS row(s), {stats['hsn_rows']} HSN row(s).")
+            return True
+    except Exception as e:
+        print(f"Error generating GSTR-1: {e}")
+        return False
+
+def run_workers(processes=1, once=False, poll_interval=1.0):
+    """Run background job worker processes until interrupted"""
+    try:
+        # Job workers use the small, timeout-free pool profile unless told otherwise
+        os.environ.setdefault('DB_POOL_PROFILE', 'worker')
+        from app import app
+        from jobs import start_workers
+        
+        print(f"Starting {processes} job worker(s); press Ctrl+C to stop.")
+        start_workers(app, processes=processes, once=once, poll_interval=poll_interval)
+        return True
+    except Exception as e:
+        print(f"Error running job workers: {e}")
+        return False
+
+def cleanup_jobs():
+    """Delete expired job result files and recover jobs whose worker died"""
+    try:
+        from app import app
+        from jobs import requeue_stale_jobs, cleanup_expired_results
+        
+        with app.app_context():
+            stale = requeue_stale_jobs()
+            expired = cleanup_expired_results()
+            print(f"Recovered {stale} stale job(s); removed the results of {expired} expired job(s).")
+            return True
+    except Exception as e:
+        print(f"Error cleaning up jobs: {e}")
+        return False
+
+def seed(customers, products, bills, seed_value=42, batch_size=None):
+    """Add synthetic customers, products and bills with realistic GST data"""
+    try:
+        from app import app
+        from seed_data import seed_database, DEFAULT_BATCH_BILLS
+        
+        with app.app_context():
+            counts = seed_database(customers, products, bills, seed=seed_value,
+                                   batch_bills=batch_size or DEFAULT_BATCH_BILLS, progress=print)
+            print(f"Seeded {counts['customers']} customer(s), {counts['products']} product(s) and "
+                  f"{counts['bills']} bill(s) with {counts['items']} item(s) in {counts['seconds']}s.")
+            return True
+    except Exception as e:
+        print(f"Error seeding data: {e}")
+        return False
+
+def compact_sync():
+    """Delete mobile sync feed rows superseded by a later change of the same record"""
+    try:
+        from app import app
+        from sync_feed import compact_sync_changes
+        
+        with app.app_context():
+            deleted = compact_sync_changes()
+            print(f"Removed {deleted} superseded sync change(s).")
+            return True
+    except Exception as e:
+        print(f"Error compacting the sync feed: {e}")
+        return False
+
+def build_snapshot(force=False):
+    """Build the mobile bootstrap snapshot, unless the cached one is still current"""
+    try:
+        from app import app
+        from sync_snapshot import build_snapshot as build, latest_snapshot, snapshot_is_current
+        
+        with app.app_context():
+            latest = latest_snapshot()
+            if not force and latest and snapshot_is_current(latest[1]):
+                print(f"Snapshot {latest[0]} is current at watermark {latest[1]}.")
+            else:
+                path, watermark, counts = build()
+                print(f"Built {path} at watermark {watermark}: "
+                      + ', '.join(f"{rows} {table}" for table, rows in counts.items()) + '.')
+            return True
+    except Exception as e:
+        print(f"Error building the sync snapshot: {e}")
+        return False
+
 def main():
     parser = argparse.ArgumentParser(description="Database Management Tool")
     subparsers = parser.add_subparsers(dest="command", help="Commands")
@@ -390,6 +556,44 @@ def main():
     revision_parser = subparsers.add_parser("revision", help="Create a new migration")
     revision_parser.add_argument("message", help="Migration message")
     
+    # Check totals command
+    check_totals_parser = subparsers.add_parser("check-totals", help="Check bill totals and tax breakup for drift")
+    check_totals_parser.add_argument("--fix", action="store_true", help="Repair drifting bills")
+    
+    # Refresh aggregates command
+    refresh_aggregates_parser = subparsers.add_parser("refresh-aggregates", help="Rebuild the daily GST report aggregates")
+    refresh_aggregates_parser.add_argument("--start", help="First bill date to rebuild (YYYY-MM-DD)")
+    refresh_aggregates_parser.add_argument("--end", help="Last bill date to rebuild (YYYY-MM-DD)")
+    
+    # GSTR-1 command
+    gstr1_parser = subparsers.add_parser("gstr1", help="Generate the GSTR-1 JSON for a return period")
+    gstr1_parser.add_argument("period", help="Return period (MMYYYY)")
+    gstr1_parser.add_argument("--output", help="Output file (default: GSTR1_<period>.json)")
+    
+    # Worker command
+    worker_parser = subparsers.add_parser("worker", help="Run background job workers")
+    worker_parser.add_argument("--processes", type=int, default=1, help="Number of worker processes (default: 1)")
+    worker_parser.add_argument("--once", action="store_true", help="Exit when the queue is empty")
+    worker_parser.add_argument("--poll", type=float, default=1.0, help="Seconds between polls of an empty queue")
+    
+    # Cleanup jobs command
+    cleanup_jobs_parser = subparsers.add_parser("cleanup-jobs", help="Delete expired job results and requeue stale jobs")
+    
+    # Seed command
+    seed_parser = subparsers.add_parser("seed", help="Add synthetic customers, products and bills for load testing")
+    seed_parser.add_argument("--customers", type=int, default=1000, help="Customers to add (default: 1000)")
+    seed_parser.add_argument("--products", type=int, default=2000, help="Products to add (default: 2000)")
+    seed_parser.add_argument("--bills", type=int, default=10000, help="Bills to add (default: 10000)")
+    seed_parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42)")
+    seed_parser.add_argument("--batch-size", type=int, help="Bills written per transaction (default: 20000)")
+    
+    # Compact sync command
+    compact_sync_parser = subparsers.add_parser("compact-sync", help="Drop sync feed rows superseded by later changes")
+    
+    # Build snapshot command
+    build_snapshot_parser = subparsers.add_parser("build-snapshot", help="Build the mobile bootstrap snapshot")
+    build_snapshot_parser.add_argument("--force", action="store_true", help="Rebuild even if the data is unchanged")
+    
     args = parser.parse_args()
     
     if args.command == "init":
@@ -407,6 +611,30 @@ def main():
         downgrade_database(args.revision)
     elif args.command == "revision":
         create_revision(args.message)
+    elif args.command == "check-totals":
+        if not check_totals(fix=args.fix):
+            sys.exit(1)
+    elif args.command == "refresh-aggregates":
+        if not refresh_aggregates(args.start, args.end):
+            sys.exit(1)
+    elif args.command == "gstr1":
+        if not generate_gstr1(args.period, args.output):
+            sys.exit(1)
+    elif args.command == "worker":
+        if not run_workers(args.processes, args.once, args.poll):
+            sys.exit(1)
+    elif args.command == "cleanup-jobs":
+        if not cleanup_jobs():
+            sys.exit(1)
+    elif args.command == "seed":
+        if not seed(args.customers, args.products, args.bills, args.seed, args.batch_size):
+            sys.exit(1)
+    elif args.command == "compact-sync":
+        if not compact_sync():
+            sys.exit(1)
+    elif args.command == "build-snapshot":
+        if not build_snapshot(args.force):
+            sys.exit(1)
     else:
         parser.print_help()
 
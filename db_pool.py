@@ -0,0 +1,242 @@
+"""
+Database connection pool sizing and instrumentation.
+
+Pool settings come from a deployment profile chosen with DB_POOL_PROFILE,
+each of which can be overridden by an environment variable:
+
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE
+
+Every process has its own pool, so the most connections a deployment can
+open is processes x (pool_size + max_overflow). Pick the profile (and the
+gunicorn worker count) so that stays under PostgreSQL's max_connections;
+the pool metrics endpoint reports both.
+
+DB_STATEMENT_TIMEOUT (milliseconds) makes PostgreSQL cancel statements
+that run longer, so a runaway report cannot hold a web worker. It does not
+apply to the 'worker' profile used by background job workers, whose exports
+are expected to run long. SQLite has no statement timeout.
+
+The pool is instrumented to count checkouts, new connections and
+invalidations and to time how long each checkout waited for a connection;
+``pool_status`` combines these with the pool's current state.
+"""
+
+import os
+import threading
+import time
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, NullPool
+
+DEFAULT_POOL_PROFILE = 'default'
+
+# Pool settings per deployment profile (DB_POOL_PROFILE)
+POOL_PROFILES = {
+    # SQLAlchemy's defaults: fine for a few sync gunicorn workers
+    'default': {'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 30, 'pool_recycle': 300},
+    # Database plans with a low connection limit (20-25 connections)
+    'small': {'pool_size': 2, 'max_overflow': 2, 'pool_timeout': 10, 'pool_recycle': 300},
+    # gthread workers with many threads each
+    'large': {'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 10, 'pool_recycle': 300},
+    # `db_manage.py worker` processes run one job at a time; no statement timeout
+    'worker': {'pool_size': 1, 'max_overflow': 2, 'pool_timeout': 60, 'pool_recycle': 300,
+               'statement_timeout': False},
+    # Behind PgBouncer: connections are pooled by the bouncer, not in-process
+    'pgbouncer': {'poolclass': NullPool},
+}
+
+POOL_ENV_OVERRIDES = {
+    'DB_POOL_SIZE': 'pool_size',
+    'DB_MAX_OVERFLOW': 'max_overflow',
+    'DB_POOL_TIMEOUT': 'pool_timeout',
+    'DB_POOL_RECYCLE': 'pool_recycle',
+}
+
+
+class PoolMetrics:
+    """Process-wide pool event counters and checkout wait times"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkins = 0
+            self.connects = 0
+            self.invalidations = 0
+            self.soft_invalidations = 0
+            self.timeouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self.slow_waits = 0
+
+    def record_wait(self, seconds, slow_threshold=0.1):
+        with self._lock:
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if seconds >= slow_threshold:
+                self.slow_waits += 1
+
+    def increment(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            waited = self.checkouts or 1
+            return {
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'soft_invalidations': self.soft_invalidations,
+                'timeouts': self.timeouts,
+                'checkout_wait_avg_ms': round(self.wait_total / waited * 1000, 3),
+                'checkout_wait_max_ms': round(self.wait_max * 1000, 3),
+                'checkout_wait_total_s': round(self.wait_total, 3),
+                'slow_checkouts': self.slow_waits,
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times how long each checkout waits for a connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.increment('timeouts')
+            raise
+        finally:
+            pool_metrics.record_wait(time.perf_counter() - start)
+
+
+def pool_settings(profile=None):
+    """
+    Resolve the pool settings of a profile with the environment overrides applied.
+
+    Args:
+        profile (str): Profile name; DB_POOL_PROFILE or 'default' if not given
+
+    Returns:
+        dict: Pool keyword arguments, plus 'profile' and 'statement_timeout' (ms or None)
+
+    Raises:
+        ValueError: For an unknown profile
+    """
+    profile = profile or os.environ.get('DB_POOL_PROFILE') or DEFAULT_POOL_PROFILE
+    if profile not in POOL_PROFILES:
+        raise ValueError(f"Unknown DB_POOL_PROFILE '{profile}' (expected one of {', '.join(POOL_PROFILES)})")
+    settings = dict(POOL_PROFILES[profile])
+    if settings.get('poolclass') is not NullPool:
+        for env_name, key in POOL_ENV_OVERRIDES.items():
+            if os.environ.get(env_name):
+                settings[key] = int(os.environ[env_name])
+
+    statement_timeout = settings.pop('statement_timeout', None)
+    if statement_timeout is not False and os.environ.get('DB_STATEMENT_TIMEOUT'):
+        statement_timeout = int(os.environ['DB_STATEMENT_TIMEOUT'])
+    settings['statement_timeout'] = statement_timeout or None
+    settings['profile'] = profile
+    return settings
+
+
+def engine_options(database_url, profile=None):
+    """
+    Build SQLALCHEMY_ENGINE_OPTIONS for a database and deployment profile.
+
+    In-memory SQLite keeps SQLAlchemy's single-connection pool, and sizing
+    options are dropped for it.
+
+    Returns:
+        dict: Engine keyword arguments
+    """
+    settings = pool_settings(profile)
+    statement_timeout = settings.pop('statement_timeout')
+    settings.pop('profile')
+
+    options = {'pool_pre_ping': True}
+    url = make_url(database_url) if database_url else None
+    if url is not None and url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return options
+
+    if settings.get('poolclass') is NullPool:
+        options['poolclass'] = NullPool
+    else:
+        options.update(settings)
+        options['poolclass'] = InstrumentedQueuePool
+    if statement_timeout and url is not None and url.get_backend_name() == 'postgresql':
+        options['connect_args'] = {'options': f"-c statement_timeout={statement_timeout}"}
+    return options
+
+
+def instrument_engine(engine):
+    """Count the pool events of an engine in pool_metrics"""
+    def on_connect(dbapi_connection, connection_record):
+        pool_metrics.increment('connects')
+
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_metrics.increment('checkouts')
+
+    def on_checkin(dbapi_connection, connection_record):
+        pool_metrics.increment('checkins')
+
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        pool_metrics.increment('invalidations')
+
+    def on_soft_invalidate(dbapi_connection, connection_record, exception):
+        pool_metrics.increment('soft_invalidations')
+
+    event.listen(engine, 'connect', on_connect)
+    event.listen(engine, 'checkout', on_checkout)
+    event.listen(engine, 'checkin', on_checkin)
+    event.listen(engine, 'invalidate', on_invalidate)
+    event.listen(engine, 'soft_invalidate', on_soft_invalidate)
+
+
+def pool_status(engine, settings=None):
+    """
+    Current state and counters of an engine's pool in this process.
+
+    On PostgreSQL the server's max_connections and the connections open to
+    the database (from all processes) are included, to size workers against.
+
+    Args:
+        engine: SQLAlchemy engine
+        settings (dict): Resolved pool_settings, for reporting
+
+    Returns:
+        dict: Pool configuration, state, counters and server connection figures
+    """
+    pool = engine.pool
+    status = {
+        'pid': os.getpid(),
+        'pool_class': type(pool).__name__,
+        'profile': (settings or {}).get('profile'),
+        'statement_timeout_ms': (settings or {}).get('statement_timeout'),
+    }
+    if isinstance(pool, QueuePool):
+        status.update({
+            'pool_size': pool.size(),
+            'max_overflow': pool._max_overflow,
+            'max_connections_per_process': pool.size() + max(pool._max_overflow, 0),
+            'pool_timeout': pool.timeout(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+        })
+    status.update(pool_metrics.snapshot())
+
+    if engine.dialect.name == 'postgresql':
+        with engine.connect() as conn:
+            status['server_max_connections'] = int(conn.execute(text('SHOW max_connections')).scalar())
+            status['server_connections'] = conn.execute(
+                text('SELECT count(*) FROM pg_stat_activity WHERE datname = current_database()')).scalar()
+    return status
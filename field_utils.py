@@ -10,7 +10,12 @@ from extensions import db
 from models import FieldDefinition, User, Product, Customer, Company, Category, Bill, BillItem
 from flask import current_app
 import json
+import re
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import func
 from sqlalchemy.exc import SQLAlchemyError
+from metrics import record_cache
 
 # Model mapping dictionary to get the correct model class for an entity type
 MODEL_MAP = {
@@ -23,6 +28,139 @@ MODEL_MAP = {
     'bill_item': BillItem
 }
 
+# Plain snapshot of a FieldDefinition, safe to keep between requests
+FieldSpec = namedtuple('FieldSpec', [
+    'field_name', 'display_name', 'field_type', 'required', 'searchable',
+    'options', 'default_value', 'validation_regex', 'help_text'
+])
+
+# entity_type -> (version, tuple of FieldSpec)
+_definition_cache = {}
+
+_TRUE_VALUES = ('true', '1', 'yes', 'on', 'y')
+_FALSE_VALUES = ('false', '0', 'no', 'off', 'n', '')
+
+def parse_field_options(options):
+    """Parse a select field's options (a JSON list, or one option per line)"""
+    if not options:
+        return ()
+    try:
+        values = json.loads(options)
+    except (TypeError, ValueError):
+        values = options.strip().split('\n')
+    return tuple(str(value).strip() for value in values if str(value).strip())
+
+def field_definitions_version(entity_type):
+    """
+    Cheap fingerprint of an entity type's field definitions.
+
+    Adding or deleting a definition changes the count and saving one bumps
+    updated_at, so the fingerprint changes whenever the definitions do -
+    including changes made by another worker process.
+
+    Returns:
+        tuple: (count, latest updated_at)
+    """
+    count, latest = db.session.query(
+        func.count(FieldDefinition.id), func.max(FieldDefinition.updated_at)
+    ).filter(FieldDefinition.entity_type == entity_type).one()
+    return count, latest
+
+def get_field_definitions(entity_type):
+    """
+    Get the enabled field definitions for an entity type, in form order.
+
+    Definitions are cached per process and reloaded only when
+    field_definitions_version() changes, so callers pay for one small
+    aggregate query instead of loading every definition.
+
+    Args:
+        entity_type (str): The type of entity ('product', 'customer', etc.)
+
+    Returns:
+        tuple: FieldSpec for each enabled field
+    """
+    version = field_definitions_version(entity_type)
+    cached = _definition_cache.get(entity_type)
+    hit = bool(cached) and cached[0] == version
+    record_cache('field_definitions', hit)
+    if hit:
+        return cached[1]
+
+    specs = tuple(
+        FieldSpec(
+            field_name=field.field_name,
+            display_name=field.display_name,
+            field_type=(field.field_type or 'text').lower(),
+            required=bool(field.required),
+            searchable=bool(field.searchable),
+            options=parse_field_options(field.options),
+            default_value=field.default_value,
+            validation_regex=field.validation_regex,
+            help_text=field.help_text,
+        )
+        for field in FieldDefinition.get_fields_for_entity(entity_type)
+    )
+    _definition_cache[entity_type] = (version, specs)
+    return specs
+
+def convert_field_value(spec, raw):
+    """
+    Convert text (e.g. from an import file) to a custom field value.
+
+    Values are stored the way the product forms store them: numbers as
+    floats, booleans as bools, dates as ISO strings and everything else as
+    text.
+
+    Args:
+        spec (FieldSpec): The field definition
+        raw (str): Text value; blank means no value
+
+    Returns:
+        The converted value, or None if blank
+
+    Raises:
+        ValueError: If the value is not valid for the field
+    """
+    raw = (raw or '').strip()
+    if not raw:
+        if spec.required:
+            raise ValueError(f"{spec.display_name} is required")
+        return None
+
+    field_type = spec.field_type
+    if field_type == 'number':
+        try:
+            value = float(raw.replace(',', ''))
+        except ValueError:
+            raise ValueError(f"{spec.display_name} must be a number")
+    elif field_type == 'boolean':
+        lowered = raw.lower()
+        if lowered not in _TRUE_VALUES and lowered not in _FALSE_VALUES:
+            raise ValueError(f"{spec.display_name} must be yes or no")
+        value = lowered in _TRUE_VALUES
+    elif field_type == 'date':
+        value = None
+        for fmt in ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%Y-%m-%d %H:%M:%S'):
+            try:
+                value = datetime.strptime(raw, fmt).date().isoformat()
+                break
+            except ValueError:
+                continue
+        if value is None:
+            raise ValueError(f"{spec.display_name} must be a date (YYYY-MM-DD)")
+    elif field_type == 'select':
+        if spec.options and raw not in spec.options:
+            raise ValueError(f"{spec.display_name} must be one of: {', '.join(spec.options)}")
+        value = raw
+    else:
+        value = raw
+
+    if spec.validation_regex and field_type in ('text', 'textarea') \
+            and not re.fullmatch(spec.validation_regex, value):
+        raise ValueError(f"{spec.display_name} has an invalid format")
+    return value
+
 def initialize_default_fields():
     """
     Initialize default fields for different entity types.
@@ -1,11 +1,14 @@
 from flask_wtf import FlaskForm
-from flask_wtf.file import FileField, FileAllowed
+from flask_wtf.file import FileField, FileAllowed, FileRequired
 from wtforms import StringField, TextAreaField, DecimalField, SelectField, BooleanField, DateField, HiddenField, FieldList, FormField, IntegerField, PasswordField
-from wtforms.validators import DataRequired, Length, Optional, NumberRange, Regexp, Email, EqualTo
+from wtforms.validators import DataRequired, Length, Optional, NumberRange, Regexp, Email, EqualTo, ValidationError
 from wtforms.widgets import TextArea
 import re
-import json
+from datetime import date
 from models import Category
+from gstin import gstin_error
+from field_utils import get_field_definitions
+from metrics import record_cache
 
 class CompanyConfigForm(FlaskForm):
     name = StringField('Company Name', validators=[DataRequired(), Length(min=2, max=200)])
@@ -40,6 +43,12 @@ class CompanyConfigForm(FlaskForm):
         Optional(),
         FileAllowed(['jpg', 'jpeg', 'png', 'gif'], 'Images only!')
     ])
+    
+    def validate_gst_number(self, field):
+        """Verify the GSTIN state code and check digit (the format is checked by Regexp)"""
+        error = None if field.errors else gstin_error(field.data)
+        if error:
+            raise ValidationError(error)
 
 class CustomerForm(FlaskForm):
     name = StringField('Customer Name', validators=[DataRequired(), Length(min=2, max=200)])
@@ -69,6 +78,14 @@ class CustomerForm(FlaskForm):
         ('36', 'Telangana'), ('37', 'Andhra Pradesh (New)')
     ])
     is_guest = BooleanField('Guest Customer')
+    
+    def validate_gst_number(self, field):
+        """Verify the GSTIN check digit and that it belongs to the selected state"""
+        error = None if field.errors else gstin_error(field.data)
+        if error:
+            raise ValidationError(error)
+        if self.state_code.data and field.data[:2] != self.state_code.data:
+            raise ValidationError('GSTIN state code does not match the selected state')
 
 class ProductForm(FlaskForm):
     name = StringField('Product Name', validators=[DataRequired(), Length(min=2, max=200)])
@@ -81,107 +98,112 @@ class ProductForm(FlaskForm):
     unit = StringField('Unit', validators=[DataRequired(), Length(max=20)], default='Nos')
     category = SelectField('Category', validators=[DataRequired()], coerce=str, choices=[])
     
-    def __init__(self, *args, **kwargs):
-        super(ProductForm, self).__init__(*args, **kwargs)
-        self.custom_field_values = {}
+    # FieldSpec of each custom field, declared as custom_<field_name> by product_form_class()
+    custom_field_specs = ()
 
     def set_category_choices(self):
         self.category.choices = [(c.id, c.category_name) for c in Category.query.all()]
-        
-    def add_custom_fields(self):
-        """Add custom fields to the form based on enabled field definitions"""
-        from models import FieldDefinition
-        import json
-        from flask import request
-        
-        # Get all enabled fields for products
-        fields = FieldDefinition.query.filter_by(entity_type='product', enabled=True).order_by(FieldDefinition.field_order).all()
-        
-        # Debug prints
-        print("Request form data:", request.form if request and request.form else "No form data")
-        print("Current form data:", self.data)
-        
-        # Store original fields to preserve their order
-        original_fields = list(self._fields.items())
-        self._fields.clear()
-        
-        # First add back all the original fields
-        for name, field in original_fields:
-            self._fields[name] = field
-            
-        print("Custom field values before adding fields:", self.custom_field_values)  # Debug print
-            
-        # Add each custom field dynamically
-        for field in fields:
-            field_name = f"custom_{field.field_name}"
-            validators = [Optional()]
-            if field.required:
-                validators = [DataRequired()]
-            
-            # Create the field class based on type
-            field_class = None
-            field_type = field.field_type.lower()
-            field_kwargs = {
-                'validators': validators,
-                'label': field.display_name
-            }
-            
-            if field_type == 'text':
-                field_class = StringField
-            elif field_type == 'textarea':
-                field_class = TextAreaField
-            elif field_type == 'number':
-                field_class = DecimalField
-                field_kwargs['places'] = 2
-            elif field_type == 'boolean':
-                field_class = BooleanField
-            elif field_type == 'date':
-                field_class = DateField
-            elif field_type == 'select':
-                field_class = SelectField
-                choices = []
-                if hasattr(field, 'options') and field.options:
-                    try:
-                        options = json.loads(field.options)
-                    except json.JSONDecodeError:
-                        options = field.options.strip().split('\n')
-                    choices = [(opt.strip(), opt.strip()) for opt in options if opt.strip()]
-                field_kwargs['choices'] = choices
-            else:
-                field_class = StringField
-            
-            if field_class:
-                # Create an instance of the field and bind it to the form
-                field_instance = field_class(**field_kwargs)
-                field_instance = field_instance.bind(form=self, name=field_name)
-                
-                # Get the stored value for this field
-                stored_value = self.custom_field_values.get(field.field_name)  # Use field.field_name instead of field_name
-                print(f"Processing field {field_name} with stored value: {stored_value}, type: {type(stored_value)}")  # Debug print
-                
-                # Handle type conversion for stored values
-                if stored_value is not None:
-                    if field_type == 'number' and not isinstance(stored_value, (int, float, str)):
-                        stored_value = str(stored_value)  # Convert to string for DecimalField
-                    elif field_type == 'boolean' and isinstance(stored_value, str):
-                        stored_value = stored_value.lower() in ('true', '1', 'yes', 'on')
-                        
-                print(f"After conversion - field {field_name}: value = {stored_value}, type = {type(stored_value)}")  # Debug print
-                
-                # Process the field with the stored value if available
-                if stored_value is not None:
-                    try:
-                        field_instance.process(formdata=None, data=stored_value)
-                    except Exception as e:
-                        print(f"Error processing field {field_name}: {str(e)}")
-                else:
-                    field_instance.process(formdata=None)
-                
-                self._fields[field_name] = field_instance
-                setattr(self, field_name, field_instance)
-                print(f"Final field value for {field_name}: {field_instance.data}")  # Debug print
-            
-        return fields
+
+    @classmethod
+    def custom_field_initial(cls, values):
+        """
+        Form data for a product's stored custom field values.
+
+        Args:
+            values (dict): The product's custom_fields
+
+        Returns:
+            dict: custom_<field_name> -> value, to pass as the form's data
+        """
+        initial = {}
+        for spec in cls.custom_field_specs:
+            value = (values or {}).get(spec.field_name)
+            if value is None:
+                continue
+            if spec.field_type == 'boolean' and isinstance(value, str):
+                value = value.lower() in ('true', '1', 'yes', 'on', 'y')
+            elif spec.field_type == 'date' and isinstance(value, str):
+                try:
+                    value = date.fromisoformat(value[:10])
+                except ValueError:
+                    continue
+            initial[f"custom_{spec.field_name}"] = value
+        return initial
+
+    def custom_field_data(self):
+        """
+        The submitted custom field values, as stored in Product.custom_fields.
+
+        Numbers are stored as floats, booleans as bools and dates as ISO
+        strings; blank fields are left out.
+
+        Returns:
+            dict: field_name -> value
+        """
+        values = {}
+        for spec in self.custom_field_specs:
+            value = self[f"custom_{spec.field_name}"].data
+            if spec.field_type == 'number':
+                value = float(value) if value is not None else None
+            elif spec.field_type == 'boolean':
+                value = bool(value)
+            elif spec.field_type == 'date':
+                value = value.isoformat() if value else None
+            elif isinstance(value, str):
+                value = value.strip() or None
+            if value is not None:
+                values[spec.field_name] = value
+        return values
+
+
+def _custom_form_field(spec):
+    """Unbound WTForms field for a custom field definition"""
+    validators = [DataRequired()] if spec.required else [Optional()]
+    kwargs = {'label': spec.display_name, 'validators': validators, 'description': spec.help_text or ''}
+    field_type = spec.field_type
+    if field_type in ('text', 'textarea') and spec.validation_regex:
+        validators.append(Regexp(rf"(?:{spec.validation_regex})\Z", message=f"{spec.display_name} has an invalid format"))
+    if field_type == 'textarea':
+        return TextAreaField(**kwargs)
+    if field_type == 'number':
+        return DecimalField(places=2, **kwargs)
+    if field_type == 'boolean':
+        return BooleanField(**kwargs)
+    if field_type == 'date':
+        return DateField(**kwargs)
+    if field_type == 'select':
+        return SelectField(choices=[(option, option) for option in spec.options], **kwargs)
+    return StringField(**kwargs)
+
+
+# (field definitions, compiled form class) for the current product field definitions
+_product_form_class = (None, None)
+
+
+def product_form_class():
+    """
+    ProductForm subclass with the enabled product custom fields declared up front.
+
+    The class is compiled once per version of the field definitions (see
+    field_utils.get_field_definitions) and reused until they change, so a
+    product form costs the same to build and validate as a static form.
+
+    Returns:
+        type: A ProductForm subclass with a custom_<field_name> field per definition
+    """
+    global _product_form_class
+    specs = get_field_definitions('product')
+    cached_specs, form_class = _product_form_class
+    hit = form_class is not None and cached_specs == specs
+    record_cache('product_form_class', hit)
+    if hit:
+        return form_class
+
+    attrs = {f"custom_{spec.field_name}": _custom_form_field(spec) for spec in specs}
+    attrs['custom_field_specs'] = specs
+    form_class = type('CustomProductForm', (ProductForm,), attrs)
+    _product_form_class = (specs, form_class)
+    return form_class
 
 class QuickAddProductForm(FlaskForm):
     name = StringField('Product Name', validators=[DataRequired(), Length(min=2, max=200)])
@@ -196,6 +218,7 @@ class QuickAddProductForm(FlaskForm):
         self.category.choices = [(c.id, c.category_name) for c in Category.query.all()]
 
 class BillItemForm(FlaskForm):
+    item_id = HiddenField()  # Existing BillItem id when editing, empty for new lines
     product_id = SelectField('Product', coerce=int, validators=[DataRequired()], choices=[])
     quantity = DecimalField('Quantity', validators=[DataRequired()], places=3, default=1)
     # These fields will be auto-populated from selected product
@@ -268,6 +291,15 @@ class CreateUserForm(FlaskForm):
     confirm_password = PasswordField('Confirm Password', 
                                    validators=[DataRequired(), EqualTo('password', message='Passwords must match')])
 
+class ImportForm(FlaskForm):
+    file = FileField('CSV or Excel File', validators=[
+        FileRequired(),
+        FileAllowed(['csv', 'xlsx'], 'CSV or .xlsx files only!')
+    ])
+
+class ProductImportForm(ImportForm):
+    dry_run = BooleanField('Dry run (validate only, do not save)')
+
 class CategoryForm(FlaskForm):
     category_name = StringField('Category Name', validators=[DataRequired(), Length(min=2, max=100)])
 
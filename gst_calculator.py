@@ -112,3 +112,37 @@ def get_gst_summary(items):
         summary[gst_rate]['total_amount'] += item.get('total_amount', 0)
     
     return summary
+
+def get_rate_summary(breakup):
+    """
+    Collapse a per-HSN tax breakup into totals by GST rate
+    
+    Args:
+        breakup: Dict of (hsn_code, gst_rate, unit) -> amounts, as returned
+            by bill_utils.get_tax_breakup
+    
+    Returns:
+        dict: Summary with totals by GST rate, in the same shape as get_gst_summary
+    """
+    summary = {}
+    
+    for (hsn_code, gst_rate, unit), values in sorted(breakup.items(), key=lambda kv: kv[0][1]):
+        if gst_rate not in summary:
+            summary[gst_rate] = {
+                'base_amount': Decimal('0'),
+                'cgst': Decimal('0'),
+                'sgst': Decimal('0'),
+                'igst': Decimal('0'),
+                'total_gst': Decimal('0'),
+                'total_amount': Decimal('0')
+            }
+        
+        total_gst = values['cgst_amount'] + values['sgst_amount'] + values['igst_amount']
+        summary[gst_rate]['base_amount'] += values['taxable_amount']
+        summary[gst_rate]['cgst'] += values['cgst_amount']
+        summary[gst_rate]['sgst'] += values['sgst_amount']
+        summary[gst_rate]['igst'] += values['igst_amount']
+        summary[gst_rate]['total_gst'] += total_gst
+        summary[gst_rate]['total_amount'] += values['taxable_amount'] + total_gst
+    
+    return summary
@@ -0,0 +1,105 @@
+"""
+GSTIN validation.
+
+A GSTIN is 15 characters: a 2-digit state code, the holder's 10-character
+PAN, an entity number, the letter Z and a check character. The check
+character is a Luhn mod-36 digit over the first 14 characters.
+
+The pattern is compiled once and the checksum uses lookup tables for each
+character's weighted contribution, so validating is a regex match plus 14
+dict lookups. ``validate_gstins`` checks many values at once (e.g. a customer
+import), validating each distinct GSTIN only once.
+"""
+
+import re
+from collections import namedtuple
+
+GSTIN_PATTERN = re.compile(r'^[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z]{1}[1-9A-Z]{1}[Z]{1}[0-9A-Z]{1}$')
+
+# State and union territory codes used in GSTINs (97 is "Other Territory")
+STATE_CODES = frozenset([f"{code:02d}" for code in range(1, 39)] + ['97'])
+
+_CHARSET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def _weighted_table(factor):
+    """Map each character to the sum of the base-36 digits of value * factor"""
+    return {char: sum(divmod(value * factor, 36)) for value, char in enumerate(_CHARSET)}
+
+
+# Characters at even indexes (0, 2, ...) are weighted 1, odd indexes 2
+_WEIGHT_TABLES = tuple(_weighted_table(1 if index % 2 == 0 else 2) for index in range(14))
+
+GSTINResult = namedtuple('GSTINResult', ['gstin', 'valid', 'state_code', 'pan', 'error'])
+
+
+def checksum_char(gstin):
+    """
+    Compute the check character for the first 14 characters of a GSTIN.
+
+    Args:
+        gstin (str): At least the first 14 characters, uppercase
+
+    Returns:
+        str: The expected 15th character
+    """
+    total = 0
+    for table, char in zip(_WEIGHT_TABLES, gstin[:14]):
+        total += table[char]
+    return _CHARSET[(36 - total % 36) % 36]
+
+
+def gstin_error(gstin):
+    """
+    Check a GSTIN and explain what is wrong with it.
+
+    Args:
+        gstin (str): The GSTIN to check (expected uppercase, no spaces)
+
+    Returns:
+        str: None if the GSTIN is valid, otherwise a short error message
+    """
+    if not gstin:
+        return 'GSTIN is empty'
+    if len(gstin) != 15 or not GSTIN_PATTERN.match(gstin):
+        return 'Invalid GSTIN format'
+    if gstin[:2] not in STATE_CODES:
+        return f'Invalid state code {gstin[:2]}'
+    if checksum_char(gstin) != gstin[14]:
+        return 'GSTIN check digit does not match'
+    return None
+
+
+def is_valid_gstin(gstin):
+    """Return True if the GSTIN has a valid format, state code and check digit"""
+    return gstin_error(gstin) is None
+
+
+def validate_gstins(gstins):
+    """
+    Validate many GSTINs at once.
+
+    Values are stripped and uppercased before checking. Each distinct GSTIN
+    is validated once, however often it repeats in the input.
+
+    Args:
+        gstins (iterable): GSTIN strings (None or blank entries are reported invalid)
+
+    Returns:
+        list: A GSTINResult per input, in order, with state_code and pan set
+        for valid GSTINs
+    """
+    seen = {}
+    results = []
+    for value in gstins:
+        gstin = (value or '').strip().upper()
+        result = seen.get(gstin)
+        if result is None:
+            error = gstin_error(gstin)
+            if error:
+                result = GSTINResult(gstin, False, None, None, error)
+            else:
+                result = GSTINResult(gstin, True, gstin[:2], gstin[2:12], None)
+            seen[gstin] = result
+        results.append(result)
+    return results
@@ -0,0 +1,325 @@
+"""
+GSTR-1 return generation.
+
+Builds the GSTR-1 JSON for one return period (``fp``, MMYYYY) with:
+
+* ``b2b``  - invoices to registered customers, grouped by customer GSTIN
+* ``b2cs`` - supplies to unregistered customers, grouped by place of supply and rate
+* ``hsn``  - HSN-wise summary of all outward supplies
+
+The B2B section is streamed: one query ordered by GSTIN, bill date and bill
+yields per-rate rows from the stored tax breakup (BillTaxSummary), which are
+grouped into invoices and customers with ``itertools.groupby`` and written to
+the output as they complete. Memory therefore stays bounded by a single
+invoice regardless of how many bills the period has. The B2CS and HSN
+sections are small by nature and are summed in the database from the same
+BillTaxSummary rows, joined to the live customer data, so every supply is
+reported under exactly one of B2B and B2CS.
+
+Large inter-state B2C invoices (B2CL) are reported under B2CS; the app does
+not track the B2CL threshold separately.
+"""
+
+import json
+from datetime import date, timedelta
+from itertools import groupby
+from operator import itemgetter
+from sqlalchemy import select, func, and_
+from extensions import db
+from models import Bill, BillTaxSummary, Customer, Company
+from tax_reports import EXCLUDED_STATUSES
+from gstin import gstin_error, validate_gstins
+
+# Return format version written to the "version" key
+GSTR1_VERSION = 'GST3.0.4'
+
+# Unit -> Unique Quantity Code used in the HSN summary; unknown units map to OTH
+UQC_CODES = {
+    'NOS': 'NOS', 'NO': 'NOS', 'PCS': 'PCS', 'PC': 'PCS', 'KG': 'KGS', 'KGS': 'KGS',
+    'G': 'GMS', 'GM': 'GMS', 'GMS': 'GMS', 'L': 'LTR', 'LTR': 'LTR', 'LITRE': 'LTR',
+    'ML': 'MLT', 'M': 'MTR', 'MTR': 'MTR', 'BOX': 'BOX', 'SET': 'SET', 'DOZ': 'DOZ',
+    'PAC': 'PAC', 'PACK': 'PAC', 'BAG': 'BAG', 'BTL': 'BTL', 'UNT': 'UNT', 'UNIT': 'UNT',
+}
+
+# Rows fetched per round trip while streaming B2B invoices
+STREAM_BATCH_SIZE = 2000
+
+
+def return_period(fp):
+    """
+    Parse a GSTR-1 return period.
+
+    Args:
+        fp (str): Period in portal format, MMYYYY (e.g. '042025')
+
+    Returns:
+        tuple: (first_day, last_day) of the month
+
+    Raises:
+        ValueError: If fp is not a valid MMYYYY period
+    """
+    try:
+        if len(fp) != 6 or not fp.isdigit():
+            raise ValueError
+        start = date(int(fp[2:]), int(fp[:2]), 1)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid return period '{fp}', expected MMYYYY")
+    end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return start, end
+
+
+def _money(value):
+    return round(float(value or 0), 2)
+
+
+def _uqc(unit):
+    return UQC_CODES.get((unit or '').strip().upper(), 'OTH')
+
+
+def _place_of_supply(company_state):
+    return func.coalesce(func.nullif(Customer.state_code, ''), company_state)
+
+
+def _is_registered():
+    return and_(Customer.gst_number.isnot(None), Customer.gst_number != '')
+
+
+def iter_b2b_rows(start_date, end_date, company_state, batch_size=STREAM_BATCH_SIZE):
+    """
+    Stream per-invoice, per-rate rows for registered customers.
+
+    Rows are ordered by customer GSTIN, bill date and bill id so callers can
+    group them without buffering the period.
+
+    Yields:
+        Row: ctin, id, bill_number, bill_date, total_amount, pos, gst_rate,
+        taxable_amount, cgst_amount, sgst_amount, igst_amount
+    """
+    stmt = select(
+        Customer.gst_number.label('ctin'),
+        Bill.id,
+        Bill.bill_number,
+        Bill.bill_date,
+        Bill.total_amount,
+        _place_of_supply(company_state).label('pos'),
+        BillTaxSummary.gst_rate,
+        func.sum(BillTaxSummary.taxable_amount).label('taxable_amount'),
+        func.sum(BillTaxSummary.cgst_amount).label('cgst_amount'),
+        func.sum(BillTaxSummary.sgst_amount).label('sgst_amount'),
+        func.sum(BillTaxSummary.igst_amount).label('igst_amount'),
+    ).select_from(BillTaxSummary) \
+        .join(Bill, BillTaxSummary.bill_id == Bill.id) \
+        .join(Customer, Bill.customer_id == Customer.id) \
+        .where(Bill.bill_date.between(start_date, end_date),
+               Bill.status.notin_(EXCLUDED_STATUSES),
+               _is_registered()) \
+        .group_by(Customer.gst_number, Bill.id, Bill.bill_number, Bill.bill_date, Bill.total_amount,
+                  Customer.state_code, BillTaxSummary.gst_rate) \
+        .order_by(Customer.gst_number, Bill.bill_date, Bill.id, BillTaxSummary.gst_rate)
+
+    # yield_per streams the result (server-side cursor on PostgreSQL) instead of buffering it
+    yield from db.session.execute(stmt.execution_options(yield_per=batch_size))
+
+
+def iter_b2b_invoices(rows):
+    """
+    Group streamed rate rows into GSTR-1 invoice objects.
+
+    Yields:
+        tuple: (ctin, invoice dict)
+    """
+    for _, invoice_rows in groupby(rows, key=lambda row: row.id):
+        items = []
+        for num, row in enumerate(invoice_rows, start=1):
+            items.append({
+                'num': num,
+                'itm_det': {
+                    'txval': _money(row.taxable_amount),
+                    'rt': float(row.gst_rate),
+                    'iamt': _money(row.igst_amount),
+                    'camt': _money(row.cgst_amount),
+                    'samt': _money(row.sgst_amount),
+                    'csamt': 0,
+                },
+            })
+        yield row.ctin, {
+            'inum': row.bill_number,
+            'idt': row.bill_date.strftime('%d-%m-%Y'),
+            'val': _money(row.total_amount),
+            'pos': row.pos,
+            'rchrg': 'N',
+            'inv_typ': 'R',
+            'itms': items,
+        }
+
+
+def iter_b2b(invoices):
+    """
+    Group (ctin, invoice) pairs by customer GSTIN.
+
+    Yields:
+        tuple: (ctin, iterator of invoice dicts), lazily, one customer at a time
+    """
+    for ctin, group in groupby(invoices, key=itemgetter(0)):
+        yield ctin, (invoice for _, invoice in group)
+
+
+def b2cs_rows(start_date, end_date, company_state):
+    """Summarize unregistered supplies by place of supply and rate"""
+    state_code = _place_of_supply(company_state)
+    stmt = select(
+        state_code.label('state_code'),
+        BillTaxSummary.gst_rate,
+        func.sum(BillTaxSummary.taxable_amount).label('taxable_amount'),
+        func.sum(BillTaxSummary.cgst_amount).label('cgst_amount'),
+        func.sum(BillTaxSummary.sgst_amount).label('sgst_amount'),
+        func.sum(BillTaxSummary.igst_amount).label('igst_amount'),
+    ).select_from(BillTaxSummary) \
+        .join(Bill, BillTaxSummary.bill_id == Bill.id) \
+        .join(Customer, Bill.customer_id == Customer.id) \
+        .where(Bill.bill_date.between(start_date, end_date),
+               Bill.status.notin_(EXCLUDED_STATUSES),
+               ~_is_registered()) \
+        .group_by(state_code, BillTaxSummary.gst_rate) \
+        .order_by(state_code, BillTaxSummary.gst_rate)
+
+    for row in db.session.execute(stmt):
+        pos = row.state_code or company_state
+        yield {
+            'sply_ty': 'INTRA' if pos == company_state else 'INTER',
+            'pos': pos,
+            'typ': 'OE',
+            'rt': float(row.gst_rate),
+            'txval': _money(row.taxable_amount),
+            'iamt': _money(row.igst_amount),
+            'camt': _money(row.cgst_amount),
+            'samt': _money(row.sgst_amount),
+            'csamt': 0,
+        }
+
+
+def hsn_rows(start_date, end_date):
+    """Summarize all outward supplies by HSN code, unit and rate"""
+    stmt = select(
+        BillTaxSummary.hsn_code,
+        BillTaxSummary.unit,
+        BillTaxSummary.gst_rate,
+        func.sum(BillTaxSummary.quantity).label('quantity'),
+        func.sum(BillTaxSummary.taxable_amount).label('taxable_amount'),
+        func.sum(BillTaxSummary.cgst_amount).label('cgst_amount'),
+        func.sum(BillTaxSummary.sgst_amount).label('sgst_amount'),
+        func.sum(BillTaxSummary.igst_amount).label('igst_amount'),
+    ).select_from(BillTaxSummary) \
+        .join(Bill, BillTaxSummary.bill_id == Bill.id) \
+        .where(Bill.bill_date.between(start_date, end_date),
+               Bill.status.notin_(EXCLUDED_STATUSES)) \
+        .group_by(BillTaxSummary.hsn_code, BillTaxSummary.unit, BillTaxSummary.gst_rate) \
+        .order_by(BillTaxSummary.hsn_code, BillTaxSummary.gst_rate)
+
+    for num, row in enumerate(db.session.execute(stmt), start=1):
+        yield {
+            'num': num,
+            'hsn_sc': row.hsn_code,
+            'uqc': _uqc(row.unit),
+            'qty': round(float(row.quantity or 0), 3),
+            'rt': float(row.gst_rate),
+            'txval': _money(row.taxable_amount),
+            'iamt': _money(row.igst_amount),
+            'camt': _money(row.cgst_amount),
+            'samt': _money(row.sgst_amount),
+            'csamt': 0,
+        }
+
+
+def validate_gstr1(fp):
+    """
+    Check the data a GSTR-1 for the period depends on.
+
+    Validates the company GSTIN and, in one bulk pass, every customer GSTIN
+    billed in the period (format, state code and check digit), and checks
+    that each GSTIN's state prefix matches the recorded state code.
+
+    Args:
+        fp (str): Return period, MMYYYY
+
+    Returns:
+        list: Error messages; empty if the return can be generated
+    """
+    start_date, end_date = return_period(fp)
+    errors = []
+
+    company = Company.query.first()
+    if not company:
+        return ['Company details are not configured']
+    company_error = gstin_error(company.gst_number)
+    if company_error:
+        errors.append(f"Company GSTIN '{company.gst_number}': {company_error}")
+    elif company.gst_number[:2] != company.state_code:
+        errors.append(f"Company GSTIN '{company.gst_number}' does not match state code {company.state_code}")
+
+    customers = db.session.execute(
+        select(Customer.name, Customer.gst_number, Customer.state_code)
+        .join(Bill, Bill.customer_id == Customer.id)
+        .where(Bill.bill_date.between(start_date, end_date),
+               Bill.status.notin_(EXCLUDED_STATUSES),
+               _is_registered())
+        .distinct()
+    ).all()
+    results = validate_gstins(gst_number for _, gst_number, _ in customers)
+    for (name, gst_number, state_code), result in zip(customers, results):
+        if not result.valid:
+            errors.append(f"Customer '{name}' GSTIN '{gst_number}': {result.error}")
+        elif state_code and result.state_code != state_code:
+            errors.append(f"Customer '{name}' GSTIN '{gst_number}' does not match state code {state_code}")
+
+    return errors
+
+
+def _write_array(out, items):
+    """Write an iterable of JSON-serializable items as an array, returning the count"""
+    count = 0
+    out.write('[')
+    for item in items:
+        if count:
+            out.write(',')
+        out.write(json.dumps(item, separators=(',', ':')))
+        count += 1
+    out.write(']')
+    return count
+
+
+def write_gstr1(out, fp, batch_size=STREAM_BATCH_SIZE):
+    """
+    Write the GSTR-1 JSON for a period to a text stream.
+
+    Args:
+        out: Writable text file object
+        fp (str): Return period, MMYYYY
+        batch_size (int): Rows fetched per round trip for the B2B stream
+
+    Returns:
+        dict: Counts of customers, invoices, B2CS rows and HSN rows written
+    """
+    start_date, end_date = return_period(fp)
+    company = Company.query.first()
+    company_state = company.state_code if company else None
+    stats = {'b2b_customers': 0, 'b2b_invoices': 0, 'b2cs_rows': 0, 'hsn_rows': 0}
+
+    out.write('{"gstin":%s,"fp":%s,"version":%s,"b2b":[' % (
+        json.dumps(company.gst_number if company else ''), json.dumps(fp), json.dumps(GSTR1_VERSION)))
+
+    invoices = iter_b2b_invoices(iter_b2b_rows(start_date, end_date, company_state, batch_size))
+    for ctin, customer_invoices in iter_b2b(invoices):
+        if stats['b2b_customers']:
+            out.write(',')
+        out.write('{"ctin":%s,"inv":' % json.dumps(ctin))
+        stats['b2b_invoices'] += _write_array(out, customer_invoices)
+        out.write('}')
+        stats['b2b_customers'] += 1
+
+    out.write('],"b2cs":')
+    stats['b2cs_rows'] = _write_array(out, b2cs_rows(start_date, end_date, company_state))
+    out.write(',"hsn":{"data":')
+    stats['hsn_rows'] = _write_array(out, hsn_rows(start_date, end_date))
+    out.write('}}')
+    return stats
@@ -0,0 +1,170 @@
+"""
+HTTP validators for the product APIs and invoice PDFs.
+
+Each cached endpoint first runs a small version query: the updated_at
+columns of the rows a response is built from, or for product lists the
+latest product change in the sync feed (sync_feed.py records inserts,
+updates, deletes, bulk imports and category renames). The version becomes
+a weak ETag and a Last-Modified date. When the client's If-None-Match (or,
+without one, If-Modified-Since) still matches, a bodyless 304 is sent and
+the response is never built.
+
+Responses are ``Cache-Control: private, no-cache``: browsers keep them and
+revalidate on every use, so an edited price is seen on the next fetch.
+
+The version queries and validator checks do not depend on the Flask
+request, so async_api.py runs the same ones for the product endpoints it
+serves.
+"""
+
+import hashlib
+from datetime import timezone
+from flask import request, current_app
+from sqlalchemy import select, func
+from extensions import db
+from models import Product, Category, Bill, Customer, Company, FieldDefinition, SyncChange
+from api_format import negotiate
+
+
+def weak_etag(*parts):
+    """Opaque ETag value (without the W/ prefix) for the version parts"""
+    return hashlib.sha1('|'.join(map(str, parts)).encode('utf-8')).hexdigest()[:24]
+
+
+def _http_date(value):
+    """A naive UTC timestamp as an aware datetime with HTTP's one-second resolution"""
+    return value.replace(microsecond=0, tzinfo=timezone.utc) if value else None
+
+
+def _latest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def response_validators(version, last_modified, mimetype=None):
+    """
+    (etag, last_modified) sent for a version.
+
+    Args:
+        version (tuple): Values that change whenever the response would
+        last_modified (datetime): Naive UTC time of the latest change, or None
+        mimetype (str): The negotiated format, for bodies that depend on the Accept header
+    """
+    if mimetype is not None:
+        version = version + (mimetype,)
+    return weak_etag(*version), _http_date(last_modified)
+
+
+def validators_match(etag, last_modified, if_none_match, if_modified_since):
+    """
+    True when a request's validators match the current version (RFC 9110 13.2.2).
+
+    Args:
+        etag (str): Current ETag value
+        last_modified (datetime): Current Last-Modified, or None
+        if_none_match (ETags): Parsed If-None-Match header
+        if_modified_since (datetime): Parsed If-Modified-Since header, or None
+    """
+    if if_none_match:
+        return if_none_match.contains_weak(etag)
+    if if_modified_since and last_modified:
+        return last_modified <= if_modified_since
+    return False
+
+
+def is_not_modified(etag, last_modified):
+    """True when the current request's validators match the current version"""
+    return validators_match(etag, last_modified, request.if_none_match, request.if_modified_since)
+
+
+def conditional_response(version, last_modified, build, negotiated=True):
+    """
+    A response carrying validators for a version, or a 304 when the client is up to date.
+
+    Args:
+        version (tuple): Values that change whenever the response would
+        last_modified (datetime): Naive UTC time of the latest change, or None
+        build (callable): Builds the full response; only called when needed
+        negotiated (bool): The body depends on the Accept header (api_response)
+
+    Returns:
+        Response: The full response or a 304, with ETag, Last-Modified and Cache-Control
+    """
+    etag, last_modified = response_validators(
+        version, last_modified, negotiate(request.accept_mimetypes) if negotiated else None)
+    if is_not_modified(etag, last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.make_response(build())
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    if negotiated:
+        response.vary.add('Accept')
+    return response
+
+
+def product_version_query(product_id):
+    """The version query of a product's API payload (see product_version)"""
+    return select(Product.updated_at, Category.updated_at.label('category_updated_at')) \
+        .outerjoin(Category, Product.category_id == Category.id).where(Product.id == product_id)
+
+
+def product_version_from_row(product_id, row):
+    if row is None:
+        return None
+    return (product_id, row.updated_at, row.category_updated_at), _latest(row.updated_at, row.category_updated_at)
+
+
+def product_version(product_id):
+    """
+    (version, last_modified) of a product's API payload, or None for an unknown product.
+
+    The payload includes its category's name, so the category's updated_at is part of it.
+    """
+    return product_version_from_row(product_id, db.session.execute(product_version_query(product_id)).first())
+
+
+def catalogue_version_query():
+    """The version query of the product lists (see catalogue_version)"""
+    latest = select(SyncChange).where(SyncChange.entity == 'product') \
+        .order_by(SyncChange.id.desc()).limit(1).subquery()
+    return select(select(latest.c.id).scalar_subquery().label('change_id'),
+                  select(latest.c.changed_at).scalar_subquery().label('changed_at'),
+                  func.max(FieldDefinition.updated_at).label('fields_updated_at'),
+                  func.count(FieldDefinition.id).label('field_count')) \
+        .where(FieldDefinition.entity_type == 'product')
+
+
+def catalogue_version_from_row(row):
+    return (row.change_id or 0, row.fields_updated_at, row.field_count), _latest(row.changed_at, row.fields_updated_at)
+
+
+def catalogue_version():
+    """
+    (version, last_modified) of the product lists (search, recent).
+
+    The latest product change in the sync feed is an index lookup
+    (ix_sync_change_entity_latest); the searchable custom field
+    definitions, which add values to every listed product, are few.
+    """
+    return catalogue_version_from_row(db.session.execute(catalogue_version_query()).one())
+
+
+def bill_pdf_version(bill_id):
+    """
+    (version, last_modified) of a bill's invoice PDF, or None for an unknown bill.
+
+    The PDF shows the bill, its customer and the company details. Item
+    edits go through bill_utils, which sets the bill's updated_at.
+    """
+    row = db.session.execute(
+        select(Bill.updated_at, Customer.updated_at.label('customer_updated_at'),
+               select(func.max(Company.updated_at)).scalar_subquery().label('company_updated_at'))
+        .outerjoin(Customer, Bill.customer_id == Customer.id).where(Bill.id == bill_id)
+    ).first()
+    if row is None:
+        return None
+    return (bill_id,) + tuple(row), _latest(*row)
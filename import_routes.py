@@ -0,0 +1,90 @@
+"""
+Routes for bulk data imports.
+
+Uploads are saved under UPLOAD_FOLDER/imports and processed by a background
+job; the job status page (job_routes) polls for progress and links the
+error report once the import finishes.
+"""
+
+import os
+import uuid
+from flask import Blueprint, render_template, request, redirect, url_for, send_file, abort, current_app
+from flask_login import login_required, current_user
+from werkzeug.utils import secure_filename
+from app import app
+from forms import ImportForm, ProductImportForm
+from import_utils import IMPORT_SUBFOLDER
+from jobs import enqueue_job
+from job_routes import get_job_or_404
+from customer_import import CUSTOMER_COLUMNS
+from product_import import PRODUCT_COLUMNS, custom_field_columns
+
+# Uploads for imports may be larger than the general MAX_CONTENT_LENGTH
+app.config.setdefault('IMPORT_MAX_CONTENT_LENGTH', 100 * 1024 * 1024)
+
+# Create a Blueprint for import routes
+import_bp = Blueprint('imports', __name__)
+
+
+@import_bp.url_value_preprocessor
+def raise_upload_limit(endpoint, values):
+    """Allow large import files; this runs before CSRF protection parses the form"""
+    if endpoint and endpoint.endswith('_import'):
+        request.max_content_length = app.config['IMPORT_MAX_CONTENT_LENGTH']
+
+
+def _start_import(kind, upload, **params):
+    """Save an uploaded file and start the import job for it"""
+    folder = os.path.join(current_app.config['UPLOAD_FOLDER'], IMPORT_SUBFOLDER)
+    os.makedirs(folder, exist_ok=True)
+
+    filename = secure_filename(upload.filename)
+    path = os.path.join(folder, f"{uuid.uuid4().hex}.{filename.rsplit('.', 1)[-1].lower()}")
+    upload.save(path)
+
+    return enqueue_job(kind, {'path': path, 'filename': filename, **params}, user_id=current_user.id)
+
+
+@import_bp.route('/customers/import', methods=['GET', 'POST'])
+@login_required
+def customer_import():
+    """Upload a customer file for bulk import"""
+    form = ImportForm()
+
+    if form.validate_on_submit():
+        job = _start_import('customer_import', form.file.data)
+        return redirect(url_for('jobs.job_detail', job_id=job.id))
+
+    return render_template('imports/upload.html', form=form, title='Import Customers',
+                           columns=CUSTOMER_COLUMNS, back_url=url_for('customers'), back_label='Customers')
+
+
+@import_bp.route('/products/import', methods=['GET', 'POST'])
+@login_required
+def product_import():
+    """Upload a product catalogue file for bulk import"""
+    form = ProductImportForm()
+
+    if form.validate_on_submit():
+        job = _start_import('product_import', form.file.data, dry_run=form.dry_run.data)
+        return redirect(url_for('jobs.job_detail', job_id=job.id))
+
+    # Custom fields are imported from columns named after the field
+    columns = PRODUCT_COLUMNS + tuple(sorted({spec.field_name for spec in custom_field_columns().values()}))
+    return render_template('imports/upload.html', form=form, title='Import Products',
+                           columns=columns, back_url=url_for('products'), back_label='Products')
+
+
+@import_bp.route('/imports/<int:job_id>/errors')
+@login_required
+def import_errors(job_id):
+    """Download the CSV report of rejected rows"""
+    job = get_job_or_404(job_id)
+    report = (job.result or {}).get('error_report')
+    if not report or not os.path.exists(report):
+        abort(404)
+    return send_file(os.path.abspath(report), mimetype='text/csv', as_attachment=True,
+                     download_name=f"import_{job.id}_errors.csv")
+
+# Register the blueprint with the application
+app.register_blueprint(import_bp)
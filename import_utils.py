@@ -0,0 +1,146 @@
+"""
+Shared helpers for bulk CSV/XLSX imports.
+
+Files are read as a stream (csv.DictReader, or openpyxl in read-only mode) so
+an import of a few hundred thousand rows never holds the whole sheet in
+memory. Rows are yielded as dicts keyed by normalized header names, with all
+values as stripped strings.
+"""
+
+import csv
+import os
+import re
+from itertools import islice
+from extensions import db
+
+IMPORT_EXTENSIONS = {'csv', 'xlsx'}
+
+# Directory (under UPLOAD_FOLDER) for uploaded import files and error reports
+IMPORT_SUBFOLDER = 'imports'
+
+
+def normalize_header(name):
+    """Normalize a column header: 'GST Number ' -> 'gst_number'"""
+    return re.sub(r'[^a-z0-9]+', '_', str(name or '').strip().lower()).strip('_')
+
+
+def _cell_text(value):
+    """Convert a spreadsheet cell to text; integral floats lose their '.0'"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def iter_import_rows(path, aliases=None):
+    """
+    Stream the data rows of a CSV or XLSX file.
+
+    Args:
+        path (str): File path; the extension selects the reader
+        aliases (dict): Normalized header -> canonical column name
+
+    Yields:
+        tuple: (row_number, {column: text}) with row numbers as seen in the
+        file (the header is row 1)
+    """
+    aliases = aliases or {}
+    extension = path.rsplit('.', 1)[-1].lower()
+
+    if extension == 'csv':
+        # utf-8-sig strips the BOM Excel adds when saving CSV
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                return
+            columns = [aliases.get(normalize_header(h), normalize_header(h)) for h in header]
+            for row_number, values in enumerate(reader, start=2):
+                if not any(value.strip() for value in values):
+                    continue
+                yield row_number, {column: value.strip() for column, value in zip(columns, values)}
+    elif extension == 'xlsx':
+        import openpyxl
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = [aliases.get(normalize_header(h), normalize_header(h)) for h in header]
+            for row_number, values in enumerate(rows, start=2):
+                texts = [_cell_text(value) for value in values]
+                if not any(texts):
+                    continue
+                yield row_number, dict(zip(columns, texts))
+        finally:
+            workbook.close()
+    else:
+        raise ValueError(f"Unsupported import file type '.{extension}'")
+
+
+def count_import_rows(path):
+    """Estimate the number of data rows (for progress), without parsing values"""
+    extension = path.rsplit('.', 1)[-1].lower()
+    if extension == 'xlsx':
+        import openpyxl
+        workbook = openpyxl.load_workbook(path, read_only=True)
+        try:
+            return max((workbook.active.max_row or 1) - 1, 0)
+        finally:
+            workbook.close()
+    with open(path, 'rb') as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+
+def batched(iterable, size):
+    """Yield lists of up to size items"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def dialect_insert(model):
+    """An INSERT for the model that supports on_conflict_do_update/do_nothing on this database"""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+
+class ErrorReport:
+    """
+    CSV report of rejected rows, written as the import runs.
+
+    The file is only created once the first error is added.
+    """
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = list(columns)
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def add(self, row_number, message, row):
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, 'w', newline='', encoding='utf-8')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(['row', 'error'] + self.columns)
+        self._writer.writerow([row_number, message] + [row.get(column, '') for column in self.columns])
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    @property
+    def report_path(self):
+        """Path of the report, or None if there were no errors"""
+        return self.path if self.count else None
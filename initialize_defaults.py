@@ -48,7 +48,7 @@ def create_sample_customer():
         # Create a sample customer
         sample_customer = Customer(
             name="Sample Business Pvt Ltd",
-            gst_number="27AABCS1234A1Z5",  # Sample GST number for Maharashtra
+            gst_number="27AABCS1234A1Z1",  # Sample GST number for Maharashtra
             address="123 Main Street, Mumbai",
             state_code="27",
             phone="9876543210",
@@ -0,0 +1,83 @@
+"""
+Routes for background jobs: the status page, the polling API and result
+downloads. Jobs are visible to the user who queued them and to admins.
+"""
+
+import os
+from flask import Blueprint, render_template, url_for, jsonify, send_file, abort
+from flask_login import login_required, current_user
+from app import app, db
+from models import Job
+from jobs import job_to_dict, job_label, job_result_dir
+
+# Create a Blueprint for job routes
+job_bp = Blueprint('jobs', __name__)
+
+
+def get_job_or_404(job_id):
+    """Fetch a job visible to the current user"""
+    job = db.session.get(Job, job_id)
+    if job is None or (job.created_by != current_user.id and not current_user.is_admin()):
+        abort(404)
+    return job
+
+
+def result_file(job):
+    """Path of a finished job's result file, or None if it has none (or it expired)"""
+    filename = (job.result or {}).get('file')
+    if job.status != 'completed' or not filename:
+        return None
+    path = os.path.join(job_result_dir(job), os.path.basename(filename))
+    return path if os.path.exists(path) else None
+
+
+@job_bp.route('/jobs')
+@login_required
+def job_list():
+    """Recent jobs of the current user (all users' for admins)"""
+    query = Job.query
+    if not current_user.is_admin():
+        query = query.filter(Job.created_by == current_user.id)
+    jobs = query.order_by(Job.created_at.desc()).limit(50).all()
+    return render_template('jobs/list.html', jobs=jobs, job_label=job_label)
+
+
+@job_bp.route('/jobs/<int:job_id>')
+@login_required
+def job_detail(job_id):
+    """Progress page for a job; polls job_status until it finishes"""
+    job = get_job_or_404(job_id)
+    return render_template('jobs/status.html', job=job, label=job_label(job))
+
+
+@job_bp.route('/jobs/<int:job_id>/download')
+@login_required
+def job_download(job_id):
+    """Download the file a job produced"""
+    job = get_job_or_404(job_id)
+    path = result_file(job)
+    if path is None:
+        abort(404)
+    return send_file(os.path.abspath(path), mimetype=job.result.get('mimetype'), as_attachment=True,
+                     download_name=job.result.get('download_name') or os.path.basename(path))
+
+
+@job_bp.route('/api/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    """API endpoint for polling a job's progress"""
+    job = get_job_or_404(job_id)
+    data = job_to_dict(job)
+    result = data['result']
+    # Expose result files as download links rather than server paths
+    if result and 'error_report' in result:
+        result = dict(result, error_report=url_for('imports.import_errors', job_id=job.id)
+                      if result['error_report'] and not result.get('expired') else None)
+    if result and 'file' in result:
+        result = dict(result, file=None)
+    data['result'] = result
+    data['download_url'] = url_for('jobs.job_download', job_id=job.id) if result_file(job) else None
+    return jsonify(data)
+
+# Register the blueprint with the application
+app.register_blueprint(job_bp)
@@ -0,0 +1,465 @@
+"""
+Background jobs: a database-backed queue with no external broker.
+
+Long-running work (imports, exports, PDF batches) runs outside the request:
+the route queues a Job row and shows a status page that polls the job's
+progress. Queued jobs are run by worker processes started with
+``python db_manage.py worker`` when JOB_QUEUE_MODE is 'worker', or, when no
+worker is deployed (the default 'thread' mode), in a thread of the web
+process that queued them.
+
+Handlers are registered per kind with ``@job_handler('kind')`` and are
+called with the Job and its params; they report progress with
+``update_progress``, write any result files under ``job_result_dir(job)``
+and return a JSON-serializable result. A handler that raises is retried
+with exponential backoff until the job's max_attempts are used up. Result
+files, and the uploaded file a job was given as its ``path`` param, are
+deleted once the job's result expires (JOB_RESULT_TTL).
+
+That cleanup, and the recovery of jobs whose process stopped, run every
+minute in worker processes. In 'thread' mode they run in the web process,
+at most every JOB_MAINTENANCE_INTERVAL seconds, when a job is queued; run
+``python db_manage.py cleanup-jobs`` from cron as well if jobs are rare.
+"""
+
+import os
+import shutil
+import signal
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update, or_
+from extensions import db
+from models import Job
+
+# Job kind -> handler(job, **params)
+JOB_HANDLERS = {}
+
+# Job kind -> {'label': ..., 'max_attempts': ...}
+JOB_KINDS = {}
+
+DEFAULT_JOB_CONFIG = {
+    'JOB_QUEUE_MODE': 'thread',         # 'thread' or 'worker'
+    'JOB_RESULT_FOLDER': 'uploads/job_results',
+    'JOB_RESULT_TTL': 24 * 3600,        # Seconds result files are kept
+    'JOB_RETRY_DELAY': 30,              # Seconds before the first retry, doubled per attempt
+    'JOB_STALE_AFTER': 30 * 60,         # Running jobs without progress for this long are requeued
+    'JOB_MAINTENANCE_INTERVAL': 5 * 60, # Seconds between maintenance passes in 'thread' mode
+}
+
+# Monotonic time of the next maintenance pass of this process ('thread' mode)
+_next_maintenance = 0.0
+_maintenance_lock = threading.Lock()
+
+
+def _config(key):
+    return current_app.config.get(key, DEFAULT_JOB_CONFIG[key])
+
+
+def job_handler(kind, label=None, max_attempts=1):
+    """
+    Register a function as the handler for a job kind.
+
+    Args:
+        kind (str): Job kind
+        label (str): Human-readable name for status pages
+        max_attempts (int): Runs before a failing job is given up on; only
+            handlers that are safe to re-run should allow more than one
+    """
+    def decorator(fn):
+        JOB_HANDLERS[kind] = fn
+        JOB_KINDS[kind] = {'label': label or kind.replace('_', ' ').capitalize(),
+                           'max_attempts': max_attempts}
+        return fn
+    return decorator
+
+
+def job_label(job):
+    """Human-readable name of a job's kind"""
+    return JOB_KINDS.get(job.kind, {}).get('label', job.kind)
+
+
+def create_job(kind, params=None, user_id=None):
+    """
+    Record a new job.
+
+    Args:
+        kind (str): Registered job kind
+        params (dict): JSON-serializable keyword arguments for the handler
+        user_id (int): User who requested the job
+
+    Returns:
+        Job: The committed job, status 'queued'
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind '{kind}'")
+    job = Job(kind=kind, params=params or {}, status='queued', created_by=user_id,
+              max_attempts=JOB_KINDS[kind]['max_attempts'], run_after=datetime.utcnow())
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def start_job(job):
+    """
+    Make sure a queued job will run.
+
+    In 'worker' mode the worker processes pick it up; otherwise it is run in
+    a background thread of this process.
+    """
+    if _config('JOB_QUEUE_MODE') == 'worker':
+        return None
+    return _start_thread(job.id)
+
+
+def _start_thread(job_id):
+    app = current_app._get_current_object()
+    thread = threading.Thread(target=run_job, args=(app, job_id), name=f"job-{job_id}", daemon=True)
+    thread.start()
+    return thread
+
+
+def enqueue_job(kind, params=None, user_id=None):
+    """Record a job and start it (see create_job and start_job)"""
+    if _config('JOB_QUEUE_MODE') != 'worker':
+        maybe_run_maintenance()
+    job = create_job(kind, params, user_id=user_id)
+    start_job(job)
+    return job
+
+
+def worker_name():
+    """Identify this process (and thread) in Job.locked_by"""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"[:100]
+
+
+def claim_job(worker, job_id=None):
+    """
+    Atomically take the next runnable queued job.
+
+    The job is moved to 'running' with a conditional UPDATE, so when several
+    workers race for the same row only one of them gets it. On PostgreSQL
+    the candidate is also selected with SKIP LOCKED so workers do not queue
+    up behind each other.
+
+    Args:
+        worker (str): Name recorded in Job.locked_by
+        job_id (int): Claim this particular job rather than the oldest one
+
+    Returns:
+        Job: The claimed job, or None if nothing is runnable
+    """
+    now = datetime.utcnow()
+    query = select(Job.id).where(Job.status == 'queued', or_(Job.run_after.is_(None), Job.run_after <= now))
+    if job_id is not None:
+        query = query.where(Job.id == job_id)
+    else:
+        query = query.order_by(Job.run_after, Job.id).limit(1)
+    if db.engine.dialect.name == 'postgresql':
+        query = query.with_for_update(skip_locked=True)
+
+    candidate = db.session.execute(query).scalar()
+    if candidate is None:
+        db.session.rollback()
+        return None
+
+    claimed = db.session.execute(
+        update(Job)
+        .where(Job.id == candidate, Job.status == 'queued')
+        .values(status='running', locked_by=worker, started_at=now, updated_at=now, attempts=Job.attempts + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return db.session.get(Job, candidate) if claimed else None
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt: JOB_RETRY_DELAY doubled per attempt made"""
+    return _config('JOB_RETRY_DELAY') * 2 ** max(attempts - 1, 0)
+
+
+def execute_job(job):
+    """
+    Run a claimed job's handler and record the outcome.
+
+    A failing job is queued again after a backoff delay while it has
+    attempts left, otherwise it is marked failed.
+
+    Returns:
+        Job: The job, reloaded after the run
+    """
+    job_id = job.id
+    handler = JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job kind '{job.kind}'")
+        result = handler(job, **(job.params or {}))
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Job {job_id} ({job.kind}) attempt {job.attempts} failed: "
+                                 f"{traceback.format_exc()}")
+        job = db.session.get(Job, job_id)
+        job.error = str(e)
+        job.locked_by = None
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_after = datetime.utcnow() + timedelta(seconds=retry_delay(job.attempts))
+        else:
+            job.status = 'failed'
+            _finish(job)
+    else:
+        job.status = 'completed'
+        job.result = result
+        job.error = None
+        job.locked_by = None
+        _finish(job)
+    db.session.commit()
+    return job
+
+
+def _finish(job):
+    job.finished_at = datetime.utcnow()
+    job.expires_at = job.finished_at + timedelta(seconds=_config('JOB_RESULT_TTL'))
+
+
+def run_job(app, job_id):
+    """Run one job (including its retries) in its own app context; used by 'thread' mode"""
+    with app.app_context():
+        try:
+            while True:
+                job = claim_job(worker_name(), job_id)
+                if job is None:
+                    return
+                job = execute_job(job)
+                if job.status != 'queued':
+                    return
+                time.sleep(max((job.run_after - datetime.utcnow()).total_seconds(), 0))
+        finally:
+            db.session.remove()
+
+
+def update_progress(job, current, total=None, commit=True):
+    """
+    Record a job's progress.
+
+    Progress updates also show the job is alive: a running job that makes
+    none for JOB_STALE_AFTER seconds is assumed lost and requeued.
+
+    Args:
+        job (Job): The running job
+        current (int): Units of work done so far
+        total (int): Total units of work, if known
+        commit (bool): Commit now (handlers committing a batch anyway can pass False)
+    """
+    job.progress_current = current
+    if total is not None:
+        job.progress_total = total
+    job.updated_at = datetime.utcnow()
+    if commit:
+        db.session.commit()
+
+
+def job_result_dir(job):
+    """Directory for a job's result files (created if needed)"""
+    path = os.path.join(_config('JOB_RESULT_FOLDER'), str(job.id))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def job_result_path(job, filename):
+    """Path of a result file of a job"""
+    return os.path.join(job_result_dir(job), filename)
+
+
+def requeue_stale_jobs():
+    """
+    Recover jobs whose worker died: running jobs with no progress for
+    JOB_STALE_AFTER seconds are queued again, or failed if out of attempts.
+
+    Returns:
+        int: Number of jobs recovered
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=_config('JOB_STALE_AFTER'))
+    stale = Job.query.filter(Job.status == 'running', Job.updated_at < cutoff).all()
+    for job in stale:
+        job.error = f"Worker {job.locked_by or '(unknown)'} stopped responding"
+        job.locked_by = None
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_after = datetime.utcnow()
+        else:
+            job.status = 'failed'
+            _finish(job)
+    db.session.commit()
+    return len(stale)
+
+
+def cleanup_expired_results():
+    """
+    Delete the files of jobs whose results have expired.
+
+    The job rows are kept (with result['expired'] set) so their history and
+    summary stay visible.
+
+    Returns:
+        int: Number of jobs cleaned up
+    """
+    expired = Job.query.filter(Job.expires_at.isnot(None), Job.expires_at <= datetime.utcnow()).all()
+    for job in expired:
+        shutil.rmtree(os.path.join(_config('JOB_RESULT_FOLDER'), str(job.id)), ignore_errors=True)
+        upload = (job.params or {}).get('path')
+        if upload:
+            try:
+                os.remove(upload)
+            except FileNotFoundError:
+                pass  # Never uploaded, or removed by another process
+        job.result = dict(job.result or {}, expired=True)
+        job.expires_at = None
+    db.session.commit()
+    return len(expired)
+
+
+def restart_queued_jobs():
+    """
+    Start a thread for every due queued job ('thread' mode).
+
+    A queued job is normally run by the thread that queued it; jobs
+    requeued by requeue_stale_jobs, or waiting to retry when their process
+    stopped, have none. A job that still has one is claimed only once.
+
+    Returns:
+        int: Number of threads started
+    """
+    due = db.session.execute(select(Job.id).where(
+        Job.status == 'queued', or_(Job.run_after.is_(None), Job.run_after <= datetime.utcnow()))).scalars().all()
+    for job_id in due:
+        _start_thread(job_id)
+    return len(due)
+
+
+def maybe_run_maintenance():
+    """
+    Requeue stale jobs, clean up expired results and restart orphaned
+    queued jobs, unless this process did so in the last
+    JOB_MAINTENANCE_INTERVAL seconds. Used by 'thread' mode, which has no
+    worker loop to do it; failures are logged and do not reach the caller.
+
+    Returns:
+        bool: Whether a maintenance pass ran
+    """
+    global _next_maintenance
+    with _maintenance_lock:
+        if time.monotonic() < _next_maintenance:
+            return False
+        _next_maintenance = time.monotonic() + _config('JOB_MAINTENANCE_INTERVAL')
+    try:
+        requeue_stale_jobs()
+        cleanup_expired_results()
+        restart_queued_jobs()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.error(f"Job maintenance failed: {traceback.format_exc()}")
+    return True
+
+
+def run_worker(app, poll_interval=1.0, maintenance_interval=60, once=False):
+    """
+    Worker loop: claim and run queued jobs until stopped.
+
+    SIGTERM/SIGINT stop the worker after the current job. Every
+    maintenance_interval seconds stale jobs are requeued and expired
+    results are cleaned up.
+
+    Args:
+        app (Flask): The application
+        poll_interval (float): Seconds to sleep when the queue is empty
+        maintenance_interval (float): Seconds between maintenance passes
+        once (bool): Exit once the queue is empty instead of polling
+    """
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    with app.app_context():
+        name = worker_name()
+        app.logger.info(f"Job worker {name} started")
+        next_maintenance = 0
+        while not stopping.is_set():
+            if time.monotonic() >= next_maintenance:
+                requeue_stale_jobs()
+                cleanup_expired_results()
+                next_maintenance = time.monotonic() + maintenance_interval
+
+            job = claim_job(name)
+            if job is not None:
+                execute_job(job)
+                db.session.remove()
+                continue
+            if once:
+                break
+            stopping.wait(poll_interval)
+        app.logger.info(f"Job worker {name} stopped")
+
+
+def _worker_process(app, kwargs):
+    # Connections inherited from the parent process must not be shared
+    with app.app_context():
+        db.engine.dispose(close=False)
+    run_worker(app, **kwargs)
+
+
+def start_workers(app, processes=1, **kwargs):
+    """
+    Run the worker loop in several processes and wait for them to exit.
+
+    Args:
+        app (Flask): The application
+        processes (int): Number of worker processes
+        **kwargs: Passed to run_worker
+    """
+    if processes <= 1:
+        run_worker(app, **kwargs)
+        return
+
+    import multiprocessing
+    children = [multiprocessing.Process(target=_worker_process, args=(app, kwargs), name=f"job-worker-{i + 1}")
+                for i in range(processes)]
+    for child in children:
+        child.start()
+    try:
+        for child in children:
+            child.join()
+    except KeyboardInterrupt:
+        for child in children:
+            child.terminate()
+        for child in children:
+            child.join()
+
+
+def job_to_dict(job):
+    """Serialize a job for the progress polling API"""
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'label': job_label(job),
+        'status': job.status,
+        'progress_current': job.progress_current,
+        'progress_total': job.progress_total,
+        'progress_percent': job.progress_percent,
+        'result': job.result,
+        'error': job.error,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'run_after': job.run_after.isoformat() if job.run_after and job.status == 'queued' else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'expires_at': job.expires_at.isoformat() if job.expires_at else None,
+    }
@@ -0,0 +1,164 @@
+"""
+Prometheus metrics for requests, invoice PDFs, exports, GST calculation
+and caches, published in the Prometheus text format on /metrics.
+
+Under gunicorn every worker (and every job worker) has its own counters.
+Set PROMETHEUS_MULTIPROC_DIR to an empty directory shared by all of them,
+created before the app starts and cleared on each deploy; each process then
+writes its samples to memory-mapped files there and /metrics adds them up
+across processes. Only counters and histograms are used, so no gunicorn
+hook is needed when workers exit.
+
+prometheus_client is optional: without it the recording helpers do
+nothing and /metrics responds 503.
+"""
+
+import os
+import threading
+import time
+from flask import g, request
+
+try:
+    from prometheus_client import Counter, Histogram, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, \
+        generate_latest
+    from prometheus_client import multiprocess
+except ImportError:
+    Counter = Histogram = None
+    CONTENT_TYPE_LATEST = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _NoopMetric:
+    """Stands in for a metric when prometheus_client is not installed"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def observe(self, amount):
+        pass
+
+
+def _metric(kind, *args, **kwargs):
+    return kind(*args, **kwargs) if kind is not None else _NoopMetric()
+
+
+REQUEST_LATENCY = _metric(
+    Histogram, 'billing_http_request_duration_seconds', 'Time to serve a request, per Flask endpoint',
+    ['endpoint', 'method'], buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+REQUESTS = _metric(
+    Counter, 'billing_http_requests_total', 'Requests served, per Flask endpoint and status',
+    ['endpoint', 'method', 'status'])
+
+PDF_RENDER_TIME = _metric(
+    Histogram, 'billing_invoice_pdf_render_seconds', 'Time to render an invoice PDF',
+    buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10))
+PDF_SIZE = _metric(
+    Histogram, 'billing_invoice_pdf_bytes', 'Size of rendered invoice PDFs',
+    buckets=(10e3, 25e3, 50e3, 100e3, 250e3, 500e3, 1e6, 2.5e6))
+
+EXPORT_ROWS = _metric(
+    Counter, 'billing_export_rows_total', 'Rows (bills or invoices) written by exports', ['kind'])
+EXPORT_DURATION = _metric(
+    Histogram, 'billing_export_duration_seconds', 'Time to write an export', ['kind'],
+    buckets=(.1, .5, 1, 5, 10, 30, 60, 300, 900, 1800))
+
+GST_LINES = _metric(
+    Counter, 'billing_gst_line_calculations_total', 'Bill lines whose GST was (re)calculated')
+GST_SECONDS = _metric(
+    Counter, 'billing_gst_calculation_seconds_total', 'Time spent reconciling and calculating bill lines')
+
+CACHE_REQUESTS = _metric(
+    Counter, 'billing_cache_requests_total', 'Cache lookups by cache and result (hit or miss)',
+    ['cache', 'result'])
+
+# lru_cache-wrapped functions reported as caches: name -> function
+LRU_CACHES = {}
+_lru_seen = {}
+_lru_lock = threading.Lock()
+
+
+def record_cache(cache, hit):
+    """Count a lookup of a hand-rolled cache"""
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def register_lru_cache(name, fn):
+    """Report the hits and misses of an lru_cache-wrapped function as cache `name`"""
+    LRU_CACHES[name] = fn
+    _lru_seen[name] = (0, 0)
+
+
+def sync_lru_cache_metrics():
+    """Add the lru_cache hits and misses since the last call to the cache counters"""
+    # Skipped rather than waited for when another thread is already syncing
+    if not _lru_lock.acquire(blocking=False):
+        return
+    try:
+        for name, fn in LRU_CACHES.items():
+            info = fn.cache_info()
+            hits, misses = _lru_seen[name]
+            if info.hits > hits:
+                CACHE_REQUESTS.labels(name, 'hit').inc(info.hits - hits)
+            if info.misses > misses:
+                CACHE_REQUESTS.labels(name, 'miss').inc(info.misses - misses)
+            _lru_seen[name] = (info.hits, info.misses)
+    finally:
+        _lru_lock.release()
+
+
+def observe_pdf(seconds, size):
+    """Record an invoice PDF render"""
+    PDF_RENDER_TIME.observe(seconds)
+    PDF_SIZE.observe(size)
+
+
+def observe_export(kind, rows, seconds):
+    """Record a finished export of `rows` rows"""
+    EXPORT_ROWS.labels(kind).inc(rows)
+    EXPORT_DURATION.labels(kind).observe(seconds)
+
+
+def observe_gst_calculations(lines, seconds):
+    """Record a batch of bill line GST calculations"""
+    if lines:
+        GST_LINES.inc(lines)
+    GST_SECONDS.inc(seconds)
+
+
+def metrics_available():
+    return Counter is not None
+
+
+def render_metrics():
+    """
+    Render the metrics of this process, or of all processes sharing
+    PROMETHEUS_MULTIPROC_DIR, in the Prometheus text format.
+
+    Returns:
+        bytes: The exposition
+    """
+    sync_lru_cache_metrics()
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def init_metrics(app):
+    """Time every request the app serves, per endpoint"""
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.pop('request_started', None)
+        if started is not None and request.endpoint != 'static':
+            endpoint = request.endpoint or 'unmatched'
+            REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - started)
+            REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+            sync_lru_cache_metrics()
+        return response
@@ -1,6 +1,6 @@
 from extensions import db
 from datetime import datetime
-from sqlalchemy import Text, JSON
+from sqlalchemy import Text, JSON, text
 from flask_login import UserMixin, AnonymousUserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 import json
@@ -113,6 +113,11 @@ class Company(db.Model):
         from field_utils import get_all_entity_field_values
         return get_all_entity_field_values('company', self.id)
 
+# Partial index predicates for the customer dedupe keys
+GSTIN_KEY_WHERE = "gst_number IS NOT NULL AND gst_number <> ''"
+PHONE_KEY_WHERE = ("is_guest = false AND (gst_number IS NULL OR gst_number = '') "
+                   "AND phone IS NOT NULL AND phone <> ''")
+
 class Customer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
@@ -129,6 +134,16 @@ class Customer(db.Model):
     # Relationship with bills
     bills = db.relationship('Bill', backref='customer', lazy=True)
     
+    # Dedupe keys (also the ON CONFLICT targets of the bulk import): a GSTIN identifies
+    # one customer; registered customers without a GSTIN are identified by phone.
+    # Guests are excluded since walk-ins are added again on every visit.
+    __table_args__ = (
+        db.Index('uix_customer_gst_number', 'gst_number', unique=True,
+                 postgresql_where=text(GSTIN_KEY_WHERE), sqlite_where=text(GSTIN_KEY_WHERE)),
+        db.Index('uix_customer_phone', 'phone', unique=True,
+                 postgresql_where=text(PHONE_KEY_WHERE), sqlite_where=text(PHONE_KEY_WHERE)),
+    )
+    
     def get_custom_field_value(self, field_name):
         """Get a custom field value"""
         from field_utils import get_entity_field_value
@@ -181,7 +196,7 @@ class Bill(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     bill_number = db.Column(db.String(50), unique=True, nullable=False)
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
-    bill_date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
+    bill_date = db.Column(db.Date, nullable=False, default=datetime.utcnow, index=True)
     due_date = db.Column(db.Date)
     subtotal = db.Column(db.Numeric(12, 2), nullable=False, default=0)
     discount_type = db.Column(db.String(10), default='none')  # 'none', 'percentage', 'amount'
@@ -197,11 +212,18 @@ class Bill(db.Model):
     notes = db.Column(Text)
     status = db.Column(db.String(20), default='Draft')  # Draft, Sent, Paid, Cancelled
     custom_fields = db.Column(JSON, default=dict)
+    device_id = db.Column(db.Integer, db.ForeignKey('device.id'))  # Set on bills created offline on a device
+    client_ref = db.Column(db.String(64))  # The device's id for an offline bill (upload idempotency key)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (db.UniqueConstraint('device_id', 'client_ref', name='uix_bill_device_client_ref'),)
+    
     # Relationship with bill items
     items = db.relationship('BillItem', backref='bill', lazy=True, cascade='all, delete-orphan')
+    # Stored per-HSN/per-rate tax breakup, maintained by bill_utils.apply_bill_totals
+    tax_summary = db.relationship('BillTaxSummary', backref='bill', lazy=True, cascade='all, delete-orphan',
+                                  order_by='(BillTaxSummary.gst_rate, BillTaxSummary.hsn_code)')
     
     def get_custom_field_value(self, field_name):
         """Get a custom field value"""
@@ -263,6 +285,47 @@ class BillItem(db.Model):
         from field_utils import get_all_entity_field_values
         return get_all_entity_field_values('bill_item', self.id)
 
+class BillTaxSummary(db.Model):
+    """Tax breakup of a bill, one row per HSN code, GST rate and unit"""
+    __tablename__ = 'bill_tax_summary'
+    id = db.Column(db.Integer, primary_key=True)
+    bill_id = db.Column(db.Integer, db.ForeignKey('bill.id'), nullable=False, index=True)
+    hsn_code = db.Column(db.String(10), nullable=False)
+    gst_rate = db.Column(db.Numeric(5, 2), nullable=False)
+    unit = db.Column(db.String(20))
+    quantity = db.Column(db.Numeric(14, 3), nullable=False, default=0)
+    taxable_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    cgst_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    sgst_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    igst_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('bill_id', 'hsn_code', 'gst_rate', 'unit', name='uix_bill_tax_summary_line'),)
+    
+    @property
+    def total_tax(self):
+        return (self.cgst_amount or 0) + (self.sgst_amount or 0) + (self.igst_amount or 0)
+
+class TaxDailyAggregate(db.Model):
+    """Materialized daily GST totals per HSN code, rate, place of supply and B2B/B2C"""
+    __tablename__ = 'tax_daily_aggregate'
+    id = db.Column(db.Integer, primary_key=True)
+    bill_date = db.Column(db.Date, nullable=False)
+    hsn_code = db.Column(db.String(10), nullable=False)
+    gst_rate = db.Column(db.Numeric(5, 2), nullable=False)
+    unit = db.Column(db.String(20))
+    state_code = db.Column(db.String(2))  # Place of supply (customer state, else company state)
+    is_b2b = db.Column(db.Boolean, nullable=False, default=False)  # Customer has a GSTIN
+    quantity = db.Column(db.Numeric(16, 3), nullable=False, default=0)
+    taxable_amount = db.Column(db.Numeric(16, 2), nullable=False, default=0)
+    cgst_amount = db.Column(db.Numeric(16, 2), nullable=False, default=0)
+    sgst_amount = db.Column(db.Numeric(16, 2), nullable=False, default=0)
+    igst_amount = db.Column(db.Numeric(16, 2), nullable=False, default=0)
+    
+    __table_args__ = (db.UniqueConstraint('bill_date', 'hsn_code', 'gst_rate', 'unit', 'state_code', 'is_b2b',
+                                          name='uix_tax_daily_aggregate_key'),)
+
 class BillSequence(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     year = db.Column(db.Integer, nullable=False)
@@ -382,3 +445,75 @@ class FieldDefinitionHistory(db.Model):
     field_definition = db.relationship('FieldDefinition')
     # Relationship with user
     user = db.relationship('User')
+
+class Job(db.Model):
+    """Background job (an import, export or PDF batch) queued in the database"""
+    __tablename__ = 'job'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # e.g. 'customer_import'
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    params = db.Column(JSON, default=dict)
+    progress_current = db.Column(db.Integer, nullable=False, default=0)
+    progress_total = db.Column(db.Integer)  # None while unknown
+    result = db.Column(JSON)
+    error = db.Column(Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=1)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)  # Not picked up before this (retry backoff)
+    locked_by = db.Column(db.String(100))  # Worker running the job
+    expires_at = db.Column(db.DateTime)  # Result files are deleted after this
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Workers poll for the oldest runnable queued job
+    __table_args__ = (db.Index('ix_job_status_run_after', 'status', 'run_after'),)
+    
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+    
+    @property
+    def progress_percent(self):
+        if not self.progress_total:
+            return 100 if self.status == 'completed' else 0
+        return min(100, int(self.progress_current * 100 / self.progress_total))
+
+class SyncChange(db.Model):
+    """Change feed for the mobile app: one row per changed record, in commit order (see sync_feed.py)"""
+    __tablename__ = 'sync_change'
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)  # The sync watermark
+    entity = db.Column(db.String(20), nullable=False)  # 'company', 'customer', 'product', 'bill', 'bill_item'
+    entity_id = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(10), nullable=False)  # 'upsert' or 'delete'
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    # Compaction looks up the changes of a record; http_cache reads the latest change of an entity
+    __table_args__ = (db.Index('ix_sync_change_entity', 'entity', 'entity_id'),
+                      db.Index('ix_sync_change_entity_latest', 'entity', 'id'))
+
+class Device(db.Model):
+    """A mobile device that creates bills offline (see offline_bills.py)"""
+    __tablename__ = 'device'
+    id = db.Column(db.Integer, primary_key=True)
+    device_uid = db.Column(db.String(64), unique=True, nullable=False)  # Generated on the device
+    name = db.Column(db.String(100))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    user = db.relationship('User')
+    number_blocks = db.relationship('DeviceNumberBlock', backref='device', lazy=True,
+                                    order_by='DeviceNumberBlock.id')
+
+class DeviceNumberBlock(db.Model):
+    """A range of INV-<year>-NNNN invoice numbers leased to a device"""
+    __tablename__ = 'device_number_block'
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.Integer, db.ForeignKey('device.id'), nullable=False, index=True)
+    year = db.Column(db.Integer, nullable=False)
+    start_number = db.Column(db.Integer, nullable=False)
+    end_number = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,84 @@
+"""
+Operational endpoints: Prometheus metrics, database connection pool
+metrics and per-endpoint SQL profiles.
+
+The JSON endpoints are available to admins, and to monitoring tools that
+send the METRICS_TOKEN environment variable as a bearer token.
+"""
+
+import hmac
+import os
+from functools import wraps
+from flask import Blueprint, Response, request, jsonify, abort, render_template, redirect, url_for, flash
+from flask_login import login_required, current_user
+from app import app, db
+from db_pool import pool_status
+from sql_profiler import perf_stats
+from metrics import metrics_available, render_metrics, CONTENT_TYPE_LATEST
+
+# Create a Blueprint for monitoring routes
+monitoring_bp = Blueprint('monitoring', __name__)
+
+
+def metrics_access_required(f):
+    """Allow admins, or requests bearing the METRICS_TOKEN"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = os.environ.get('METRICS_TOKEN')
+        auth = request.headers.get('Authorization', '')
+        if token and auth.startswith('Bearer ') and hmac.compare_digest(auth[len('Bearer '):], token):
+            return f(*args, **kwargs)
+        if current_user.is_authenticated and current_user.is_admin():
+            return f(*args, **kwargs)
+        abort(403)
+    return decorated_function
+
+
+@monitoring_bp.route('/metrics')
+@metrics_access_required
+def prometheus_metrics():
+    """Prometheus exposition of the request, PDF, export, GST and cache metrics"""
+    if not metrics_available():
+        return Response('prometheus_client is not installed\n', status=503, mimetype='text/plain')
+    return Response(render_metrics(), content_type=CONTENT_TYPE_LATEST)
+
+
+@monitoring_bp.route('/admin/metrics/pool')
+@metrics_access_required
+def pool_metrics():
+    """Connection pool configuration, state and counters of the worker serving the request"""
+    return jsonify(pool_status(db.engine, app.config.get('DB_POOL_SETTINGS')))
+
+
+
+@monitoring_bp.route('/admin/metrics/perf')
+@metrics_access_required
+def perf_metrics():
+    """Per-endpoint SQL query counts and timings of the worker serving the request"""
+    return jsonify(perf_stats.snapshot())
+
+
+@monitoring_bp.route('/admin/perf')
+@login_required
+def perf_overview():
+    """Per-endpoint SQL profile page, to spot N+1 queries and slow statements"""
+    if not current_user.is_admin():
+        flash('You do not have permission to view performance data.', 'danger')
+        return redirect(url_for('dashboard'))
+    return render_template('admin/perf.html', perf=perf_stats.snapshot(),
+                           slow_query_ms=app.config.get('SQL_SLOW_QUERY_MS', 100))
+
+
+@monitoring_bp.route('/admin/perf/reset', methods=['POST'])
+@login_required
+def perf_reset():
+    """Start collecting the per-endpoint SQL profile afresh"""
+    if not current_user.is_admin():
+        flash('You do not have permission to reset performance data.', 'danger')
+        return redirect(url_for('dashboard'))
+    perf_stats.reset()
+    flash('Performance data reset.', 'success')
+    return redirect(url_for('monitoring.perf_overview'))
+
+# Register the blueprint with the application
+app.register_blueprint(monitoring_bp)
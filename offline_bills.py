@@ -0,0 +1,251 @@
+"""
+Bills created offline on mobile devices.
+
+A device cannot take numbers from BillSequence while it is offline, so it
+leases a block of INV-<year>-NNNN numbers beforehand and numbers its bills
+from the block. Leasing advances the year's BillSequence past the block,
+so bills created on the server never reuse a leased number.
+
+Offline bills are uploaded in batches. Each bill carries the device's own
+id for it (``client_ref``) and the number it was given, plus the same
+fields as the JSON bill API (bill_payload.py):
+
+    {"bills": [{"client_ref": "a1f3...", "bill_number": "INV-2026-0412",
+                "customer_id": 12, "bill_date": "2026-10-19", "items": {...}}, ...]}
+
+Amounts computed on the device are ignored; GST and totals are recomputed
+with calculate_gst through bill_utils.create_bill_from_lines. A batch is
+checked with a fixed number of queries and its valid bills are committed
+in one transaction. Uploading a bill again returns the bill created the
+first time, so a device can resend a batch whose response it never got.
+"""
+
+import re
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import Bill, Customer, Product, Device, DeviceNumberBlock
+from bill_payload import validate_bill_payload, BillPayloadError
+from bill_utils import create_bill_from_lines, reserve_bill_numbers, format_bill_number, _seller_state
+
+DEFAULT_BLOCK_SIZE = 100
+MAX_BLOCK_SIZE = 1000
+# Most bills accepted in one upload
+MAX_UPLOAD_BILLS = 500
+
+_BILL_NUMBER = re.compile(r'^INV-(\d{4})-(\d+)$')
+
+
+class OfflineBillError(ValueError):
+    """An upload or lease request that cannot be processed at all"""
+
+
+class UploadConflictError(OfflineBillError):
+    """A concurrent upload took a number of the batch; nothing was saved"""
+
+
+def register_device(device_uid, user, name=None):
+    """
+    Register a device, or return it when already registered by the same user.
+
+    Args:
+        device_uid (str): Id generated on the device
+        user (User): The signed-in user
+        name (str): Display name, e.g. the phone model
+
+    Returns:
+        Device: The device, added to the session (the caller commits)
+
+    Raises:
+        OfflineBillError: When the id is invalid or belongs to another user's device
+    """
+    device_uid = (device_uid or '').strip() if isinstance(device_uid, str) else ''
+    if not device_uid or len(device_uid) > 64:
+        raise OfflineBillError('device_uid is required (at most 64 characters)')
+
+    device = Device.query.filter_by(device_uid=device_uid).first()
+    if device is None:
+        device = Device(device_uid=device_uid, user_id=user.id)
+        db.session.add(device)
+    elif device.user_id != user.id:
+        raise OfflineBillError('device_uid is registered to another user')
+    if name:
+        device.name = str(name)[:100]
+    device.last_seen_at = datetime.utcnow()
+    return device
+
+
+def lease_number_block(device, size=DEFAULT_BLOCK_SIZE, year=None):
+    """
+    Lease the next ``size`` invoice numbers of a year to a device.
+
+    Args:
+        device (Device): The device
+        size (int): Numbers in the block (1 to MAX_BLOCK_SIZE)
+        year (int): Invoice year (the current year by default)
+
+    Returns:
+        DeviceNumberBlock: The block, added to the session (the caller commits)
+    """
+    if not isinstance(size, int) or not 0 < size <= MAX_BLOCK_SIZE:
+        raise OfflineBillError(f"size must be between 1 and {MAX_BLOCK_SIZE}")
+    year, first = reserve_bill_numbers(size, year)
+    block = DeviceNumberBlock(device_id=device.id, year=year, start_number=first,
+                              end_number=first + size - 1)
+    db.session.add(block)
+    device.last_seen_at = datetime.utcnow()
+    return block
+
+
+def block_to_dict(block):
+    return {
+        'year': block.year,
+        'start_number': block.start_number,
+        'end_number': block.end_number,
+        'first': format_bill_number(block.year, block.start_number),
+        'last': format_bill_number(block.year, block.end_number),
+    }
+
+
+def _parse_bill_number(value):
+    """(year, number) of an INV-<year>-NNNN number, or None"""
+    match = _BILL_NUMBER.match(value) if isinstance(value, str) else None
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def _in_leased_block(blocks, year, number):
+    return any(block.year == year and block.start_number <= number <= block.end_number for block in blocks)
+
+
+def _bill_result(client_ref, status, bill):
+    return {
+        'client_ref': client_ref,
+        'status': status,
+        'bill_id': bill.id,
+        'bill_number': bill.bill_number,
+        'total_amount': float(bill.total_amount),
+    }
+
+
+def upload_offline_bills(device, entries):
+    """
+    Create a batch of a device's offline bills in one transaction.
+
+    Bills already uploaded (same device and client_ref) are reported as
+    'duplicate' with the existing bill; invalid bills are reported as
+    'error' with their field errors and do not stop the rest of the batch.
+
+    Args:
+        device (Device): The uploading device
+        entries (list): Bill payloads with client_ref and bill_number
+
+    Returns:
+        dict: {'results': [{'client_ref', 'status', ...}, ...], 'created': n,
+            'duplicates': n, 'errors': n}
+
+    Raises:
+        OfflineBillError: When the batch is malformed
+        UploadConflictError: When a concurrent upload took one of its numbers
+    """
+    if not isinstance(entries, list) or not entries:
+        raise OfflineBillError('bills must be a non-empty array')
+    if len(entries) > MAX_UPLOAD_BILLS:
+        raise OfflineBillError(f"at most {MAX_UPLOAD_BILLS} bills per upload")
+
+    results = [None] * len(entries)
+    parsed = {}  # index -> (client_ref, bill_number, header, lines)
+    seen_refs, seen_numbers = set(), set()
+    for index, entry in enumerate(entries):
+        client_ref = entry.get('client_ref') if isinstance(entry, dict) else None
+        if not isinstance(client_ref, str) or not client_ref.strip() or len(client_ref) > 64:
+            results[index] = {'client_ref': client_ref, 'status': 'error',
+                              'errors': {'client_ref': 'is required (at most 64 characters)'}}
+            continue
+        client_ref = client_ref.strip()
+        if client_ref in seen_refs:
+            results[index] = {'client_ref': client_ref, 'status': 'error',
+                              'errors': {'client_ref': 'is repeated in this upload'}}
+            continue
+        seen_refs.add(client_ref)
+        try:
+            header, lines = validate_bill_payload(entry)
+        except BillPayloadError as e:
+            results[index] = {'client_ref': client_ref, 'status': 'error', 'errors': e.errors}
+            continue
+        parsed[index] = (client_ref, entry.get('bill_number'), header, lines)
+
+    # Bills of this batch uploaded before
+    existing = {}
+    if seen_refs:
+        existing = {bill.client_ref: bill for bill in db.session.execute(
+            select(Bill).where(Bill.device_id == device.id, Bill.client_ref.in_(seen_refs))).scalars()}
+    for index, (client_ref, bill_number, header, lines) in list(parsed.items()):
+        if client_ref in existing:
+            results[index] = _bill_result(client_ref, 'duplicate', existing[client_ref])
+            del parsed[index]
+
+    # Load the customers (create_bill_from_lines then finds them in the
+    # session) and the product ids of the whole batch at once
+    customer_ids = {header['customer_id'] for _, _, header, _ in parsed.values()}
+    product_ids = {line['product_id'] for _, _, _, lines in parsed.values() for line in lines}
+    customers = {}  # Held so the session's identity map keeps them
+    if customer_ids:
+        customers = {customer.id: customer for customer in db.session.execute(
+            select(Customer).where(Customer.id.in_(customer_ids))).scalars()}
+    products = set()
+    if product_ids:
+        products = set(db.session.execute(select(Product.id).where(Product.id.in_(product_ids))).scalars())
+    numbers = [bill_number for _, bill_number, _, _ in parsed.values() if isinstance(bill_number, str)]
+    used = set()
+    if numbers:
+        used = set(db.session.execute(select(Bill.bill_number).where(Bill.bill_number.in_(numbers))).scalars())
+    blocks = device.number_blocks
+
+    for index, (client_ref, bill_number, header, lines) in list(parsed.items()):
+        errors = {}
+        parts = _parse_bill_number(bill_number)
+        if parts is None:
+            errors['bill_number'] = 'must be an INV-<year>-NNNN number'
+        elif not _in_leased_block(blocks, *parts):
+            errors['bill_number'] = 'is not in a number block leased to this device'
+        elif bill_number in used or bill_number in seen_numbers:
+            errors['bill_number'] = 'is already used'
+        if header['customer_id'] not in customers:
+            errors['customer_id'] = 'unknown customer'
+        for line_index, line in enumerate(lines):
+            if line['product_id'] not in products:
+                errors[f"items.product_id[{line_index}]"] = 'unknown product'
+        if errors:
+            results[index] = {'client_ref': client_ref, 'status': 'error', 'errors': errors}
+            del parsed[index]
+        else:
+            seen_numbers.add(bill_number)
+
+    if parsed:
+        seller_state = _seller_state()
+        for index, (client_ref, bill_number, header, lines) in parsed.items():
+            bill = create_bill_from_lines(header, lines, bill_number=bill_number, seller_state=seller_state)
+            bill.device_id = device.id
+            bill.client_ref = client_ref
+            results[index] = bill
+    device.last_seen_at = datetime.utcnow()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise UploadConflictError('a bill number or client_ref was taken by a concurrent upload; resend the batch')
+
+    if parsed:
+        # Commit expired the new bills; read their stored values back at once
+        created = {bill.client_ref: bill for bill in db.session.execute(
+            select(Bill).where(Bill.device_id == device.id,
+                               Bill.client_ref.in_([client_ref for client_ref, _, _, _ in parsed.values()]))).scalars()}
+        for index, (client_ref, _, _, _) in parsed.items():
+            results[index] = _bill_result(client_ref, 'created', created[client_ref])
+
+    counts = {'created': 0, 'duplicate': 0, 'error': 0}
+    for result in results:
+        counts[result['status']] += 1
+    return {'results': results, 'created': counts['created'], 'duplicates': counts['duplicate'],
+            'errors': counts['error']}
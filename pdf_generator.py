@@ -1,5 +1,6 @@
 import io
 import os
+import time
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -9,8 +10,10 @@ from reportlab.lib.enums import TA_LEFT, TA_RIGHT, TA_CENTER
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfbase import pdfmetrics
 from datetime import datetime
-from utils import get_state_name, number_to_words
+from utils import get_state_name, amount_in_words
 from currency_utils import format_rupee
+from bill_utils import get_tax_breakup
+from metrics import observe_pdf
 
 # Set this to True to use 'Rs.' instead of '₹' symbol if fonts don't display properly
 USE_FALLBACK_CURRENCY = False
@@ -32,8 +35,9 @@ except Exception as e:
     # Set to use fallback currency format
     USE_FALLBACK_CURRENCY = True
 
-def generate_invoice_pdf(bill, company):
-    """Generate PDF invoice for a bill"""
+def generate_invoice_pdf(bill, company, output_path=None):
+    """Generate PDF invoice for a bill; written to output_path, or a temp file if not given"""
+    started = time.perf_counter()
     buffer = io.BytesIO()
     
     # Create PDF document
@@ -240,6 +244,37 @@ def generate_invoice_pdf(bill, company):
     story.append(items_table)
     story.append(Spacer(1, 20))
     
+    # HSN-wise tax summary, read from the stored breakup
+    tax_summary_data = [['HSN', 'GST%', 'Taxable Value', 'CGST', 'SGST', 'IGST', 'Total Tax']]
+    for (hsn_code, gst_rate, unit), values in sorted(get_tax_breakup(bill).items(), key=lambda kv: (kv[0][1], kv[0][0])):
+        total_tax = values['cgst_amount'] + values['sgst_amount'] + values['igst_amount']
+        tax_summary_data.append([
+            hsn_code,
+            f"{gst_rate:.1f}%",
+            Paragraph(format_rupee(values['taxable_amount'], True, USE_FALLBACK_CURRENCY), amount_style),
+            Paragraph(format_rupee(values['cgst_amount'], True, USE_FALLBACK_CURRENCY), amount_style),
+            Paragraph(format_rupee(values['sgst_amount'], True, USE_FALLBACK_CURRENCY), amount_style),
+            Paragraph(format_rupee(values['igst_amount'], True, USE_FALLBACK_CURRENCY), amount_style),
+            Paragraph(format_rupee(total_tax, True, USE_FALLBACK_CURRENCY), amount_style)
+        ])
+    
+    if len(tax_summary_data) > 1:
+        tax_summary_table = Table(tax_summary_data, colWidths=[
+            0.9*inch, 0.6*inch, 1.2*inch, 1.0*inch, 1.0*inch, 1.0*inch, 1.1*inch
+        ])
+        tax_summary_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+            ('FONTNAME', (0, 0), (-1, 0), bold_font),
+            ('FONTNAME', (0, 1), (-1, -1), normal_font),
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ]))
+        story.append(tax_summary_table)
+        story.append(Spacer(1, 20))
+    
     # Totals table
     # Use Paragraph objects with our special style for currency values
     # This gives better control over the font used for rendering the rupee symbol
@@ -279,7 +314,7 @@ def generate_invoice_pdf(bill, company):
     story.append(Spacer(1, 20))
     
     # Amount in words
-    amount_words = f"Amount in words: {number_to_words(float(bill.total_amount))} Rupees Only"
+    amount_words = f"Amount in words: {amount_in_words(bill.total_amount)}"
     story.append(Paragraph(amount_words, normal_style))
     story.append(Spacer(1, 20))
     
@@ -305,11 +340,13 @@ def generate_invoice_pdf(bill, company):
     pdf_data = buffer.getvalue()
     buffer.close()
     
-    # Save to temporary file and return path
-    temp_filename = f"temp_invoice_{bill.bill_number}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    temp_path = os.path.join('/tmp', temp_filename)
+    # Save to the given path, or a temporary file, and return the path
+    if output_path is None:
+        temp_filename = f"temp_invoice_{bill.bill_number}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        output_path = os.path.join('/tmp', temp_filename)
     
-    with open(temp_path, 'wb') as f:
+    with open(output_path, 'wb') as f:
         f.write(pdf_data)
     
-    return temp_path
+    observe_pdf(time.perf_counter() - started, len(pdf_data))
+    return output_path
@@ -0,0 +1,344 @@
+"""
+Bulk product catalogue import from CSV or XLSX.
+
+Rows are streamed from the file and processed in batches. Categories are
+loaded once up front and resolved by name from a dict (unknown categories
+are created as they are first seen), columns other than the standard
+product columns are matched to the enabled product custom fields from the
+cached field definitions, and each batch is written with one executemany
+INSERT for new products and one for updates. Products are matched to
+existing ones by name, so re-importing a file updates the catalogue
+instead of duplicating it.
+
+In dry-run mode every row is validated and the summary reports what would
+be added or updated, but nothing is written.
+"""
+
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import select, insert, update
+from extensions import db
+from models import Product, Category
+from field_utils import get_field_definitions, convert_field_value
+from import_utils import iter_import_rows, count_import_rows, batched, normalize_header, ErrorReport
+from jobs import job_handler, update_progress, job_result_path
+from sync_feed import record_bulk_changes
+
+IMPORT_BATCH_SIZE = 1000
+
+PRODUCT_COLUMNS = ('name', 'description', 'price', 'hsn_code', 'gst_rate', 'cgst_rate', 'sgst_rate',
+                   'unit', 'category')
+
+# Accepted header spellings (after normalize_header) for each column
+PRODUCT_ALIASES = {
+    'product_name': 'name', 'product': 'name', 'item': 'name', 'item_name': 'name',
+    'hsn': 'hsn_code', 'hsn_sac': 'hsn_code', 'sac': 'hsn_code', 'sac_code': 'hsn_code', 'hsn_sac_code': 'hsn_code',
+    'rate': 'price', 'unit_price': 'price', 'selling_price': 'price',
+    'gst': 'gst_rate', 'gst_percent': 'gst_rate', 'tax_rate': 'gst_rate', 'total_gst_rate': 'gst_rate',
+    'cgst': 'cgst_rate', 'cgst_percent': 'cgst_rate',
+    'sgst': 'sgst_rate', 'sgst_percent': 'sgst_rate', 'utgst_rate': 'sgst_rate',
+    'uom': 'unit', 'units': 'unit', 'uqc': 'unit',
+    'category_name': 'category',
+}
+
+# GST rate slabs (total of CGST + SGST) a product may carry. The 0.25% slab
+# is left out: its 0.125% halves do not fit the two-decimal rate columns.
+GST_RATE_SLABS = frozenset(Decimal(rate) for rate in
+                           ('0', '0.1', '1', '1.5', '3', '5', '6', '7.5', '12', '18', '28', '40'))
+
+# HSN codes are 4, 6 or 8 digits; service (SAC) codes are 6 digits
+HSN_LENGTHS = (4, 6, 8)
+
+_TWO_PLACES = Decimal('0.01')
+
+
+def _parse_decimal(value, label):
+    """Parse an amount or rate, allowing thousands separators and a trailing %"""
+    text = (value or '').replace(',', '').rstrip('%').strip()
+    if not text:
+        return None
+    try:
+        number = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f"{label} must be a number")
+    if not number.is_finite() or number < 0:
+        raise ValueError(f"{label} must be a positive number")
+    return number.quantize(_TWO_PLACES)
+
+
+def validate_hsn_code(hsn_code):
+    """
+    Check an HSN/SAC code.
+
+    Returns:
+        str: Error message, or None if the code is valid
+    """
+    if not hsn_code:
+        return 'HSN code is required'
+    if not hsn_code.isdigit() or len(hsn_code) not in HSN_LENGTHS:
+        return f"Invalid HSN code '{hsn_code}' (expected 4, 6 or 8 digits)"
+    return None
+
+
+def resolve_gst_split(gst_rate, cgst_rate, sgst_rate):
+    """
+    Work out a product's total GST rate and its CGST/SGST split.
+
+    Any of the three may be missing: a total alone is split in half, and
+    CGST and SGST alone are added up. Whatever is given must be consistent:
+    CGST and SGST are always equal and add up to the total, and the total
+    must be a GST slab.
+
+    Args:
+        gst_rate (Decimal): Total rate, or None
+        cgst_rate (Decimal): CGST rate, or None
+        sgst_rate (Decimal): SGST rate, or None
+
+    Returns:
+        tuple: (gst_rate, cgst_rate, sgst_rate)
+
+    Raises:
+        ValueError: If the rates are missing or inconsistent
+    """
+    if cgst_rate is None and sgst_rate is None:
+        if gst_rate is None:
+            raise ValueError('GST rate is required')
+        cgst_rate = sgst_rate = (gst_rate / 2).quantize(_TWO_PLACES)
+    else:
+        cgst_rate = sgst_rate if cgst_rate is None else cgst_rate
+        sgst_rate = cgst_rate if sgst_rate is None else sgst_rate
+        if cgst_rate != sgst_rate:
+            raise ValueError(f"CGST rate {cgst_rate}% and SGST rate {sgst_rate}% must be equal")
+        if gst_rate is None:
+            gst_rate = cgst_rate + sgst_rate
+        elif cgst_rate + sgst_rate != gst_rate:
+            raise ValueError(f"CGST {cgst_rate}% + SGST {sgst_rate}% does not add up to GST rate {gst_rate}%")
+
+    if gst_rate not in GST_RATE_SLABS:
+        raise ValueError(f"GST rate {gst_rate}% is not a GST slab")
+    return gst_rate, cgst_rate, sgst_rate
+
+
+def custom_field_columns(entity_type='product'):
+    """
+    Map import column names to custom field definitions.
+
+    A custom field can be given by its field name, its display name or
+    custom_<field name> (as the product form names it).
+
+    Returns:
+        dict: normalized column name -> FieldSpec
+    """
+    columns = {}
+    for spec in get_field_definitions(entity_type):
+        for name in (normalize_header(spec.display_name), f"custom_{spec.field_name}", spec.field_name):
+            columns[name] = spec
+    return columns
+
+
+class ProductImporter:
+    """
+    State of one product import: the category lookup, the custom field
+    mapping, names already seen in the file and the running totals.
+    """
+
+    def __init__(self, report, dry_run=False):
+        self.report = report
+        self.dry_run = dry_run
+        self.custom_columns = custom_field_columns()
+        self.custom_specs = {spec.field_name: spec for spec in self.custom_columns.values()}
+        # All categories in one query; looked up by lower-cased name from here on
+        self.categories = {name.lower(): category_id for category_id, name in
+                           db.session.execute(select(Category.id, Category.category_name))}
+        self.seen = {}
+        self.ignored_columns = None
+        self.stats = {'rows': 0, 'inserted': 0, 'updated': 0, 'categories_created': 0}
+
+    def _note_columns(self, row):
+        """Record the columns of the file that are not imported (checked on the first row)"""
+        if self.ignored_columns is None:
+            self.ignored_columns = sorted(column for column in row if column
+                                          and column not in PRODUCT_COLUMNS and column not in self.custom_columns)
+
+    def _report(self, row_number, message, row):
+        """Add a rejected row to the report, with custom field values under their field names"""
+        values = dict(row)
+        for column, spec in self.custom_columns.items():
+            if column in row:
+                values[spec.field_name] = row[column]
+        self.report.add(row_number, message, values)
+
+    def _category_id(self, name):
+        """Resolve a category name, creating the category the first time it is seen"""
+        key = name.lower()
+        if key not in self.categories:
+            category_id = None
+            if not self.dry_run:
+                category = Category(category_name=name, custom_fields={})
+                db.session.add(category)
+                db.session.flush()
+                category_id = category.id
+            self.categories[key] = category_id
+            self.stats['categories_created'] += 1
+        return self.categories[key]
+
+    def _prepare_row(self, row):
+        """
+        Validate and convert one row.
+
+        Returns:
+            dict: Product column values, with custom_fields
+
+        Raises:
+            ValueError: If the row cannot be imported
+        """
+        name = row.get('name', '')
+        if not name:
+            raise ValueError('Name is required')
+        if len(name) > 200:
+            raise ValueError('Name is longer than 200 characters')
+
+        price = _parse_decimal(row.get('price'), 'Price')
+        if price is None:
+            raise ValueError('Price is required')
+
+        hsn_code = row.get('hsn_code', '').replace(' ', '')
+        error = validate_hsn_code(hsn_code)
+        if error:
+            raise ValueError(error)
+
+        gst_rate, cgst_rate, sgst_rate = resolve_gst_split(
+            _parse_decimal(row.get('gst_rate'), 'GST rate'),
+            _parse_decimal(row.get('cgst_rate'), 'CGST rate'),
+            _parse_decimal(row.get('sgst_rate'), 'SGST rate'))
+
+        unit = row.get('unit') or 'Nos'
+        if len(unit) > 20:
+            raise ValueError('Unit is longer than 20 characters')
+
+        category = row.get('category', '')
+        if len(category) > 100:
+            raise ValueError('Category is longer than 100 characters')
+
+        custom_fields = {}
+        for column, spec in self.custom_columns.items():
+            if column in row:
+                value = convert_field_value(spec, row[column])
+                if value is not None:
+                    custom_fields[spec.field_name] = value
+        for spec in self.custom_specs.values():
+            if spec.required and spec.field_name not in custom_fields:
+                raise ValueError(f"{spec.display_name} is required")
+
+        return {
+            'name': name,
+            'description': row.get('description') or None,
+            'price': price,
+            'hsn_code': hsn_code,
+            'gst_rate': gst_rate,
+            'cgst_rate': cgst_rate,
+            'sgst_rate': sgst_rate,
+            'unit': unit,
+            'category': category,
+            'custom_fields': custom_fields,
+        }
+
+    def _existing_products(self, names):
+        """Existing products with the given names: name -> (id, custom_fields)"""
+        existing = {}
+        rows = db.session.execute(
+            select(Product.id, Product.name, Product.custom_fields)
+            .where(Product.name.in_(names)).order_by(Product.id))
+        for product_id, name, custom_fields in rows:
+            existing.setdefault(name, (product_id, custom_fields))
+        return existing
+
+    def process_batch(self, batch):
+        """Validate a batch of rows and write (or, in a dry run, count) the products"""
+        records = []
+        for row_number, row in batch:
+            self._note_columns(row)
+            try:
+                record = self._prepare_row(row)
+            except ValueError as e:
+                self._report(row_number, str(e), row)
+                continue
+            if record['name'] in self.seen:
+                self._report(row_number, f"Duplicate of row {self.seen[record['name']]} (same name)", row)
+                continue
+            self.seen[record['name']] = row_number
+            records.append(record)
+
+        existing = self._existing_products([record['name'] for record in records]) if records else {}
+        now = datetime.utcnow()
+        inserts, updates = [], []
+        for record in records:
+            category = record.pop('category')
+            record['category_id'] = self._category_id(category) if category else None
+            record['updated_at'] = now
+            match = existing.get(record['name'])
+            if match:
+                product_id, custom_fields = match
+                # Imported custom field values are merged over the stored ones
+                record['custom_fields'] = dict(custom_fields or {}, **record['custom_fields'])
+                record['id'] = product_id
+                updates.append(record)
+            else:
+                record['created_at'] = now
+                inserts.append(record)
+
+        if not self.dry_run:
+            if inserts:
+                db.session.execute(insert(Product), inserts)
+            if updates:
+                db.session.execute(update(Product), updates)
+            if records:
+                record_bulk_changes(Product, Product.updated_at == now)
+
+        self.stats['rows'] += len(batch)
+        self.stats['inserted'] += len(inserts)
+        self.stats['updated'] += len(updates)
+
+
+def import_products(path, error_report_path, job=None, dry_run=False, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Import products from a CSV or XLSX file.
+
+    Args:
+        path (str): Uploaded file
+        error_report_path (str): Where to write the CSV of rejected rows
+        job (Job): Background job to report progress on, if any
+        dry_run (bool): Validate only; report what would change without saving
+        batch_size (int): Rows validated and written per transaction
+
+    Returns:
+        dict: rows, inserted, updated, categories_created, errors,
+        error_report (path or None), ignored_columns and dry_run
+    """
+    if job is not None:
+        update_progress(job, 0, count_import_rows(path))
+
+    specs = {spec.field_name: spec for spec in get_field_definitions('product')}
+    report = ErrorReport(error_report_path, PRODUCT_COLUMNS + tuple(specs))
+    importer = ProductImporter(report, dry_run=dry_run)
+    try:
+        for batch in batched(iter_import_rows(path, PRODUCT_ALIASES), batch_size):
+            importer.process_batch(batch)
+            if job is not None:
+                update_progress(job, importer.stats['rows'], commit=False)
+            db.session.commit()
+    finally:
+        report.close()
+
+    stats = dict(importer.stats)
+    stats['errors'] = report.count
+    stats['error_report'] = report.report_path
+    stats['ignored_columns'] = importer.ignored_columns or []
+    stats['dry_run'] = dry_run
+    return stats
+
+
+# Products are matched by name, so a failed import can safely be retried once
+@job_handler('product_import', label='Product import', max_attempts=2)
+def run_product_import(job, path, filename=None, dry_run=False):
+    return import_products(path, job_result_path(job, 'errors.csv'), job=job, dry_run=dry_run)
@@ -0,0 +1,272 @@
+"""
+Query profiles for list views and the product JSON APIs.
+
+List pages only need a handful of columns per row, so instead of loading
+full ORM objects (and lazy-loading the customer/category for every row)
+these helpers select exactly the columns each template renders, joined in a
+single statement. The resulting rows are lightweight named tuples that
+support attribute access, so templates can use ``row.bill_number`` etc.
+"""
+
+from datetime import datetime
+from sqlalchemy import select, func, or_, cast, String
+from flask_sqlalchemy.pagination import Pagination
+from extensions import db
+from models import Bill, Customer, Product, Category, FieldDefinition, FieldData
+
+# Columns rendered by bills.html and the dashboard
+BILL_LIST_COLUMNS = (
+    Bill.id,
+    Bill.bill_number,
+    Bill.bill_date,
+    Bill.due_date,
+    Bill.status,
+    Bill.subtotal,
+    Bill.cgst_amount,
+    Bill.sgst_amount,
+    Bill.igst_amount,
+    Bill.total_amount,
+    Customer.name.label('customer_name'),
+    Customer.is_guest.label('customer_is_guest'),
+)
+
+# Columns rendered by products.html
+PRODUCT_LIST_COLUMNS = (
+    Product.id,
+    Product.name,
+    Product.description,
+    Product.hsn_code,
+    Product.price,
+    Product.gst_rate,
+    Product.unit,
+    Product.created_at,
+    Category.category_name,
+)
+
+# Columns returned by the product JSON APIs (search, recent, detail)
+PRODUCT_API_COLUMNS = (
+    Product.id,
+    Product.name,
+    Product.description,
+    Product.price,
+    Product.hsn_code,
+    Product.gst_rate,
+    Product.unit,
+    Product.custom_fields,
+    Category.category_name,
+)
+
+PRODUCT_SEARCH_LIMIT = 100
+RECENT_PRODUCTS_LIMIT = 20
+# Most products returned by one /api/products/batch request
+PRODUCT_BATCH_LIMIT = 500
+
+
+def parse_filter_date(value):
+    """Parse a YYYY-MM-DD filter value, returning None if it is invalid"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def apply_bill_filters(stmt, search='', start_date=None, end_date=None, status=''):
+    """
+    Apply the bill list filters to a statement that already joins Customer.
+
+    Args:
+        stmt: A select() statement over Bill joined to Customer
+        search (str): Matches bill number or customer name
+        start_date (date): Inclusive lower bound on bill_date
+        end_date (date): Inclusive upper bound on bill_date
+        status (str): Exact bill status
+
+    Returns:
+        The filtered statement
+    """
+    if search:
+        stmt = stmt.where(or_(Bill.bill_number.contains(search),
+                              Customer.name.contains(search)))
+    if start_date:
+        stmt = stmt.where(Bill.bill_date >= start_date)
+    if end_date:
+        stmt = stmt.where(Bill.bill_date <= end_date)
+    if status:
+        stmt = stmt.where(Bill.status == status)
+    return stmt
+
+
+def bill_list_query(search='', start_date=None, end_date=None, status=''):
+    """
+    Build the row-tuple query used by the bills listing.
+
+    Returns:
+        Select: Statement yielding BILL_LIST_COLUMNS, newest first
+    """
+    stmt = select(*BILL_LIST_COLUMNS).join(Customer, Bill.customer_id == Customer.id)
+    stmt = apply_bill_filters(stmt, search, start_date, end_date, status)
+    return stmt.order_by(Bill.created_at.desc())
+
+
+def bill_list_summary(search='', start_date=None, end_date=None, status=''):
+    """
+    Count and total the filtered bills in a single aggregate query.
+
+    Returns:
+        tuple: (bill_count, total_amount)
+    """
+    stmt = select(func.count(Bill.id), func.coalesce(func.sum(Bill.total_amount), 0)) \
+        .join(Customer, Bill.customer_id == Customer.id)
+    stmt = apply_bill_filters(stmt, search, start_date, end_date, status)
+    count, total = db.session.execute(stmt).one()
+    return count, total
+
+
+def product_list_query(search=''):
+    """
+    Build the row-tuple query used by the products listing.
+
+    Returns:
+        Select: Statement yielding PRODUCT_LIST_COLUMNS, newest first
+    """
+    stmt = select(*PRODUCT_LIST_COLUMNS).outerjoin(Category, Product.category_id == Category.id)
+    if search:
+        stmt = stmt.where(or_(Product.name.contains(search),
+                              Product.hsn_code.contains(search)))
+    return stmt.order_by(Product.created_at.desc())
+
+
+def product_api_select():
+    """Select PRODUCT_API_COLUMNS with the category joined in"""
+    return select(*PRODUCT_API_COLUMNS).outerjoin(Category, Product.category_id == Category.id)
+
+
+def product_search_query(term='', category='', limit=PRODUCT_SEARCH_LIMIT):
+    """
+    Build the standard-field product search used by the bill form typeahead.
+
+    Args:
+        term (str): Matches name, description or HSN code
+        category (str): Exact category name
+        limit (int): Maximum rows
+
+    Returns:
+        Select: Statement yielding PRODUCT_API_COLUMNS, ordered by name
+    """
+    stmt = product_api_select()
+    if term:
+        pattern = f"%{term}%"
+        stmt = stmt.where(or_(Product.name.ilike(pattern),
+                              Product.description.ilike(pattern),
+                              Product.hsn_code.ilike(pattern)))
+    if category:
+        stmt = stmt.where(Category.category_name == category)
+    return stmt.order_by(Product.name).limit(limit)
+
+
+def product_custom_field_search_query(term, field_ids, exclude_ids=(), limit=PRODUCT_SEARCH_LIMIT):
+    """
+    Build the search over searchable custom field values.
+
+    A product matches when a FieldData value of one of the given fields, or
+    the text of its custom_fields JSON, contains the term.
+
+    Args:
+        term (str): Search term
+        field_ids (list): Ids of the searchable field definitions
+        exclude_ids (iterable): Products already found by the standard search
+        limit (int): Maximum rows
+
+    Returns:
+        Select: Statement yielding PRODUCT_API_COLUMNS, ordered by name
+    """
+    pattern = f"%{term}%"
+    field_matches = select(FieldData.entity_id).where(FieldData.field_definition_id.in_(field_ids),
+                                                      FieldData.value_text.ilike(pattern))
+    stmt = product_api_select().where(or_(Product.id.in_(field_matches),
+                                          cast(Product.custom_fields, String).ilike(pattern)))
+    if exclude_ids:
+        stmt = stmt.where(Product.id.notin_(list(exclude_ids)))
+    return stmt.order_by(Product.name).limit(limit)
+
+
+def recent_products_query(limit=RECENT_PRODUCTS_LIMIT):
+    """
+    Build the newest-products query shown before the user types a search.
+
+    Returns:
+        Select: Statement yielding PRODUCT_API_COLUMNS, newest first
+    """
+    return product_api_select().order_by(Product.created_at.desc()).limit(limit)
+
+
+def product_detail_query(product_id):
+    """Statement yielding the PRODUCT_API_COLUMNS row of one product"""
+    return product_api_select().where(Product.id == product_id)
+
+
+def products_by_ids_query(product_ids):
+    """Statement yielding the PRODUCT_API_COLUMNS rows of several products (in no particular order)"""
+    return product_api_select().where(Product.id.in_(product_ids))
+
+
+def searchable_fields_query(entity_type='product'):
+    """Statement yielding (id, field_name, display_name) of the enabled searchable fields"""
+    return select(FieldDefinition.id, FieldDefinition.field_name, FieldDefinition.display_name) \
+        .where(FieldDefinition.entity_type == entity_type, FieldDefinition.enabled.is_(True),
+               FieldDefinition.searchable.is_(True)) \
+        .order_by(FieldDefinition.field_order, FieldDefinition.id)
+
+
+def product_api_payload(row, searchable_fields=()):
+    """
+    Serialize a PRODUCT_API_COLUMNS row for the product JSON APIs.
+
+    Custom field values are read from the row's custom_fields column, so no
+    further queries are needed per product.
+
+    Args:
+        row: Row from one of the product API statements
+        searchable_fields: (id, field_name, display_name) rows to include
+
+    Returns:
+        dict: The product as returned to the client
+    """
+    values = row.custom_fields or {}
+    return {
+        'id': row.id,
+        'name': row.name,
+        'description': row.description,
+        'price': float(row.price),
+        'hsn_code': row.hsn_code,
+        'gst_rate': float(row.gst_rate),
+        'unit': row.unit,
+        'category': row.category_name or 'General',
+        'custom_fields': {field.field_name: {'value': values[field.field_name],
+                                             'display_name': field.display_name}
+                          for field in searchable_fields if values.get(field.field_name)},
+    }
+
+
+class RowPagination(Pagination):
+    """Pagination over a column select that yields row tuples instead of scalars.
+
+    If the caller already knows the total (e.g. from ``bill_list_summary``) it can
+    pass ``total=`` to skip the extra count query.
+    """
+
+    def _query_items(self):
+        stmt = self._query_args['select'].limit(self.per_page).offset(self._query_offset)
+        return db.session.execute(stmt).all()
+
+    def _query_count(self):
+        if self._query_args.get('total') is not None:
+            return self._query_args['total']
+        sub = self._query_args['select'].order_by(None).subquery()
+        return db.session.execute(select(func.count()).select_from(sub)).scalar()
+
+
+def paginate_rows(stmt, page, per_page=20, total=None, max_per_page=500):
+    """Paginate a column statement, returning row tuples rather than ORM objects"""
+    return RowPagination(select=stmt, page=page, per_page=per_page,
+                         max_per_page=max_per_page, error_out=False, total=total)
@@ -0,0 +1,145 @@
+"""
+Routes for GST tax reports.
+
+The HSN-wise, rate-wise, state-wise and B2B/B2C summaries are served from
+the materialized daily aggregates in tax_reports.py, as an HTML page, JSON
+and an Excel download.
+"""
+
+import io
+import tempfile
+from datetime import date, datetime
+from flask import Blueprint, render_template, request, jsonify, send_file, flash, redirect, url_for
+from flask_login import login_required
+from app import app
+from query_profiles import parse_filter_date
+from tax_reports import GROUPINGS, AMOUNT_COLUMNS, gst_summary, export_gst_summary_excel
+from gstr1 import validate_gstr1, write_gstr1
+from utils import get_state_name
+
+# Create a Blueprint for report routes
+report_bp = Blueprint('reports', __name__)
+
+
+def _report_params():
+    """Read the report filters from the query string, defaulting to the current financial year"""
+    today = date.today()
+    fy_start_year = today.year if today.month >= 4 else today.year - 1
+    start_date = parse_filter_date(request.args.get('start_date')) or date(fy_start_year, 4, 1)
+    end_date = parse_filter_date(request.args.get('end_date')) or today
+
+    group_by = request.args.get('group_by', 'hsn')
+    if group_by not in GROUPINGS:
+        group_by = 'hsn'
+
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'group_by': group_by,
+        'supply_type': request.args.get('supply_type', ''),
+        'state_code': request.args.get('state_code', ''),
+    }
+
+
+def _row_to_dict(row, group_by):
+    data = {}
+    for column in GROUPINGS[group_by]:
+        value = getattr(row, column)
+        if column == 'gst_rate':
+            value = float(value or 0)
+        elif column == 'is_b2b':
+            value = bool(value)
+        data[column] = value
+    for column in AMOUNT_COLUMNS:
+        data[column] = float(getattr(row, column) or 0)
+    data['total_tax'] = data['cgst_amount'] + data['sgst_amount'] + data['igst_amount']
+    return data
+
+
+@report_bp.route('/reports/gst')
+@login_required
+def gst_summary_report():
+    """GST summary report page"""
+    params = _report_params()
+    if params['start_date'] > params['end_date']:
+        flash('Start date must be on or before end date', 'danger')
+        rows = []
+    else:
+        rows = gst_summary(**params)
+
+    totals = {column: sum((getattr(row, column) or 0 for row in rows), 0) for column in AMOUNT_COLUMNS}
+
+    return render_template('reports/gst_summary.html', rows=rows, totals=totals,
+                           columns=GROUPINGS[params['group_by']], get_state_name=get_state_name,
+                           **params)
+
+
+@report_bp.route('/api/reports/gst-summary')
+@login_required
+def gst_summary_api():
+    """API endpoint returning the GST summary as JSON"""
+    params = _report_params()
+    rows = gst_summary(**params)
+    return jsonify({
+        'start_date': params['start_date'].isoformat(),
+        'end_date': params['end_date'].isoformat(),
+        'group_by': params['group_by'],
+        'rows': [_row_to_dict(row, params['group_by']) for row in rows]
+    })
+
+
+@report_bp.route('/reports/gst/export/excel')
+@login_required
+def export_gst_summary():
+    """Export the GST summary to Excel"""
+    params = _report_params()
+    rows = gst_summary(**params)
+    output = export_gst_summary_excel(rows, params['group_by'])
+
+    filename = (f"gst_summary_{params['group_by']}_{params['start_date']}_to_{params['end_date']}_"
+                f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
+    return send_file(
+        output,
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        as_attachment=True,
+        download_name=filename
+    )
+
+@report_bp.route('/reports/gstr1')
+@login_required
+def export_gstr1():
+    """Download the GSTR-1 JSON for a month"""
+    # The month picker submits YYYY-MM; the return period format is MMYYYY
+    month = request.args.get('period', '')
+    fp = f"{month[5:7]}{month[:4]}" if len(month) == 7 and month[4] == '-' else month
+
+    try:
+        errors = validate_gstr1(fp)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('reports.gst_summary_report'))
+
+    if errors:
+        for error in errors[:10]:
+            flash(error, 'danger')
+        if len(errors) > 10:
+            flash(f'{len(errors) - 10} more GSTIN errors not shown', 'danger')
+        return redirect(url_for('reports.gst_summary_report'))
+
+    # Stream the return into a temporary file rather than building it in memory
+    output = tempfile.TemporaryFile()
+    text = io.TextIOWrapper(output, encoding='utf-8')
+    write_gstr1(text, fp)
+    text.flush()
+    text.detach()
+    output.seek(0)
+
+    return send_file(
+        output,
+        mimetype='application/json',
+        as_attachment=True,
+        download_name=f'GSTR1_{fp}.json'
+    )
+
+# Register the blueprint with the application
+app.register_blueprint(report_bp)
@@ -1,28 +1,31 @@
 import os
-from flask import render_template, request, redirect, url_for, flash, jsonify, send_file, session
+from flask import render_template, request, redirect, url_for, flash, jsonify, send_file, session, abort
 from werkzeug.utils import secure_filename
 from flask_login import login_user, logout_user, login_required, current_user
 from flask_wtf.csrf import generate_csrf
 from app import app, db
-from models import Company, Customer, Product, Bill, BillItem, BillSequence, User, Category
-from forms import CompanyConfigForm, CustomerForm, ProductForm, BillForm, BillItemForm, LoginForm, UserForm, ChangePasswordForm, CreateUserForm, QuickAddProductForm
+from models import Company, Customer, Product, Bill, User, Category
+from forms import CompanyConfigForm, CustomerForm, product_form_class, BillForm, LoginForm, UserForm, ChangePasswordForm, CreateUserForm, QuickAddProductForm
 from utils import allowed_file, get_state_name
-from gst_calculator import calculate_gst
-from sqlalchemy import or_, and_, not_, cast, text, func
-from sqlalchemy.types import String
+from gst_calculator import get_rate_summary
+from bill_utils import (line_from_form, header_from_form, create_bill_from_lines, update_bill_from_lines,
+                        get_tax_breakup)
+from bill_payload import validate_bill_payload, check_bill_references, BillPayloadError
+from api_format import api_response
+from http_cache import conditional_response, product_version, catalogue_version, bill_pdf_version
+from customer_import import find_duplicate_customer
 from pdf_generator import generate_invoice_pdf
+from bill_exports import (export_filters, count_export_bills, export_filename, write_bills_excel,
+                          write_bills_pdf, EXCEL_MIMETYPE)
+from jobs import enqueue_job
+from query_profiles import (bill_list_query, bill_list_summary, product_list_query,
+                            paginate_rows, parse_filter_date, product_search_query,
+                            product_custom_field_search_query, recent_products_query,
+                            product_detail_query, searchable_fields_query, product_api_payload,
+                            products_by_ids_query, PRODUCT_BATCH_LIMIT)
 from datetime import datetime, date
 import uuid
 from functools import wraps
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 import io
 from decimal import Decimal
 import decimal
@@ -122,7 +125,7 @@ def dashboard():
     total_customers = Customer.query.count()
     total_products = Product.query.count()
     total_bills = Bill.query.count()
-    recent_bills = Bill.query.order_by(Bill.created_at.desc()).limit(5).all()
+    recent_bills = db.session.execute(bill_list_query().limit(5)).all()
     
     return render_template('index.html', 
                          total_customers=total_customers,
@@ -199,13 +202,23 @@ def customers():
     
     return render_template('customers.html', customers=customers, search=search)
 
+def customer_form_has_duplicate(form, customer_id=None):
+    """Flag the GSTIN or phone field if another customer already uses it"""
+    duplicate = find_duplicate_customer(form.gst_number.data or None, form.phone.data or None,
+                                        form.is_guest.data, exclude_id=customer_id)
+    if duplicate is None:
+        return False
+    field = form.gst_number if form.gst_number.data else form.phone
+    field.errors.append(f'Customer "{duplicate.name}" already has this {field.label.text}')
+    return True
+
 @app.route('/customers/add', methods=['GET', 'POST'])
 @login_required
 def add_customer():
     """Add new customer"""
     form = CustomerForm()
     
-    if form.validate_on_submit():
+    if form.validate_on_submit() and not customer_form_has_duplicate(form):
         customer = Customer()
         form.populate_obj(customer)
         
@@ -223,7 +236,7 @@ def edit_customer(id):
     customer = Customer.query.get_or_404(id)
     form = CustomerForm(obj=customer)
     
-    if form.validate_on_submit():
+    if form.validate_on_submit() and not customer_form_has_duplicate(form, customer.id):
         form.populate_obj(customer)
         db.session.commit()
         
@@ -254,101 +267,37 @@ def products():
     search = request.args.get('search', '')
     page = request.args.get('page', 1, type=int)
     
-    query = Product.query
-    if search:
-        query = query.filter(Product.name.contains(search) | 
-                           Product.hsn_code.contains(search))
-    
-    products = query.order_by(Product.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False)
+    # Row tuples with the category name joined in, no per-row lazy loads
+    products = paginate_rows(product_list_query(search), page=page, per_page=20)
     
     return render_template('products.html', products=products, search=search)
 
 @app.route('/products/add', methods=['GET', 'POST'])
 def add_product():
     """Add new product"""
-    form = ProductForm()
+    # Form class with the enabled custom fields, compiled once per field definition version
+    form = product_form_class()()
     
     # Populate category choices
     categories = Category.query.order_by(Category.category_name).all()
     form.category.choices = [(0, 'None')] + [(c.id, c.category_name) for c in categories]
     
-    # Get all enabled custom fields
-    from models import FieldDefinition
-    custom_fields = FieldDefinition.query.filter_by(
-        entity_type='product', 
-        enabled=True
-    ).order_by(FieldDefinition.field_order).all()
-    
-    print("Request method:", request.method)  # Debug print
-    if request.method == 'POST':
-        print("Form data received:", request.form)  # Debug print
-        
-    # Add custom fields to the form
-    form.add_custom_fields()
-    
     if form.validate_on_submit():
-        print("Form validated successfully")  # Debug print
-        print("Form data after validation:", form.data)  # Debug print
-        
         product = Product()
         
         # Copy basic fields
         for field in ['name', 'description', 'price', 'hsn_code', 'gst_rate', 'unit']:
             if hasattr(form, field):
-                value = getattr(form, field).data
-                print(f"Setting {field} = {value}")  # Debug print
-                setattr(product, field, value)
+                setattr(product, field, getattr(form, field).data)
         
         # Handle category separately
         if form.category.data and form.category.data != '0':
-            category = Category.query.get(form.category.data)
-            product.category = category
-            print(f"Setting category: {category.category_name if category else 'None'}")  # Debug print
+            product.category = Category.query.get(form.category.data)
         else:
             product.category = None
-            print("No category selected")  # Debug print
             
-        # Initialize custom_fields
-        product.custom_fields = {}
-        
         # Save custom field values
-        print("Raw form data:", request.form)  # Debug print
-        
-        new_custom_fields = {}  # Create a new dict for custom fields
-        
-        # Process all form fields that start with 'custom_'
-        for key, value in request.form.items():
-            if key.startswith('custom_'):
-                # Remove the 'custom_' prefix to get the actual field name
-                field_name = key[7:]  # Skip 'custom_'
-                print(f"Processing {key}: value = {value}")  # Debug print
-                
-                # Find the field definition to get the correct type
-                field_def = next((f for f in custom_fields if f.field_name == field_name), None)
-                if field_def:
-                    # Convert the value based on field type
-                    if field_def.field_type == 'number':
-                        try:
-                            # Handle empty string
-                            if value.strip() == '':
-                                processed_value = None
-                            else:
-                                processed_value = float(value)
-                        except ValueError:
-                            processed_value = None
-                    elif field_def.field_type == 'boolean':
-                        processed_value = value.lower() in ('true', '1', 'yes', 'on')
-                    else:
-                        # For text fields, store empty string as None
-                        processed_value = value if value.strip() != '' else None
-                    
-                    if processed_value is not None:
-                        print(f"Saving {field_name} = {processed_value} ({type(processed_value)})")  # Debug print
-                        new_custom_fields[field_name] = processed_value
-        
-        print("Final custom fields to save:", new_custom_fields)  # Debug print
-        product.custom_fields = new_custom_fields
+        product.custom_fields = form.custom_field_data()
         
         db.session.add(product)
         db.session.commit()
@@ -356,13 +305,16 @@ def add_product():
         flash('Product added successfully!', 'success')
         return redirect(url_for('products'))
     
-    return render_template('add_product.html', form=form, custom_fields=custom_fields)
+    return render_template('add_product.html', form=form, custom_fields=form.custom_field_specs)
 
 @app.route('/products/<int:id>/edit', methods=['GET', 'POST'])
 def edit_product(id):
     """Edit existing product"""
     product = Product.query.get_or_404(id)
-    form = ProductForm(obj=product)
+    
+    # Custom fields are pre-filled from the product's stored values
+    form_class = product_form_class()
+    form = form_class(obj=product, data=form_class.custom_field_initial(product.custom_fields))
     
     # Populate category choices
     categories = Category.query.order_by(Category.category_name).all()
@@ -371,17 +323,6 @@ def edit_product(id):
     # Set the selected category using the correct field
     form.category.data = str(product.category.id if product.category else 0)
     
-    # Prepare custom field values before adding fields to form
-    # Add custom fields to the form and pass the product's custom fields directly
-    form.custom_field_values = product.custom_fields if product.custom_fields else {}
-    print("Setting custom field values:", form.custom_field_values)  # Debug print
-    
-    # Add custom fields to the form
-    custom_fields = form.add_custom_fields()
-
-    # Print all form fields and their values for debugging
-    print("All form fields:", {name: field.data for name, field in form._fields.items()})
-    
     if form.validate_on_submit():
         # Copy basic fields
         for field in ['name', 'description', 'price', 'hsn_code', 'gst_rate', 'unit']:
@@ -396,56 +337,19 @@ def edit_product(id):
         else:
             product.category = None
             
-        # Initialize custom_fields JSON if it doesn't exist
-        if not product.custom_fields:
-            product.custom_fields = {}
-        
-        # Save custom field values
-        print("Before save - existing custom_fields:", product.custom_fields)  # Debug print
-        print("Raw form data:", request.form)  # Debug print of raw form data
-        
-        new_custom_fields = {}  # Create a new dict instead of modifying in place
-        
-        # Process all form fields that start with 'custom_'
-        for key, value in request.form.items():
-            if key.startswith('custom_'):
-                # Remove the 'custom_' prefix to get the actual field name
-                field_name = key[7:]  # Skip 'custom_'
-                print(f"Processing {key}: value = {value}")  # Debug print
-                
-                # Find the field definition to get the correct type
-                field_def = next((f for f in custom_fields if f.field_name == field_name), None)
-                if field_def:
-                    # Convert the value based on field type
-                    if field_def.field_type == 'number':
-                        try:
-                            # Handle empty string
-                            if value.strip() == '':
-                                processed_value = None
-                            else:
-                                processed_value = float(value)
-                        except ValueError:
-                            processed_value = None
-                    elif field_def.field_type == 'boolean':
-                        processed_value = value.lower() in ('true', '1', 'yes', 'on')
-                    else:
-                        # For text fields, store empty string as None
-                        processed_value = value if value.strip() != '' else None
-                    
-                    if processed_value is not None:
-                        print(f"Saving {field_name} = {processed_value} ({type(processed_value)})")  # Debug print
-                        new_custom_fields[field_name] = processed_value
-                    
-        print("Final custom fields to save:", new_custom_fields)  # Debug print
-        product.custom_fields = new_custom_fields  # Assign the new dict all at once
+        # Replace the values of the fields on the form; values of disabled
+        # fields are kept. Assign a new dict so the JSON column is marked dirty.
+        shown = {spec.field_name for spec in form.custom_field_specs}
+        custom_fields = {name: value for name, value in (product.custom_fields or {}).items() if name not in shown}
+        custom_fields.update(form.custom_field_data())
+        product.custom_fields = custom_fields
         
-        print("After save - new custom_fields:", product.custom_fields)  # Debug print
         db.session.commit()
         
         flash('Product updated successfully!', 'success')
         return redirect(url_for('products'))
     
-    return render_template('add_product.html', form=form, product=product, custom_fields=custom_fields)
+    return render_template('add_product.html', form=form, product=product, custom_fields=form.custom_field_specs)
 
 @app.route('/products/<int:id>/delete', methods=['POST'])
 def delete_product(id):
@@ -518,40 +422,28 @@ def bills():
     end_date = request.args.get('end_date', '')
     status = request.args.get('status', '')
     
-    query = Bill.query.join(Customer)
-    
-    # Text search
-    if search:
-        query = query.filter(Bill.bill_number.contains(search) |
-                           Customer.name.contains(search))
-    
     # Date range filter
+    start_date_obj = None
     if start_date:
-        try:
-            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-            query = query.filter(Bill.bill_date >= start_date_obj)
-        except ValueError:
+        start_date_obj = parse_filter_date(start_date)
+        if not start_date_obj:
             flash('Invalid start date format', 'danger')
             start_date = ''
     
+    end_date_obj = None
     if end_date:
-        try:
-            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-            query = query.filter(Bill.bill_date <= end_date_obj)
-        except ValueError:
+        end_date_obj = parse_filter_date(end_date)
+        if not end_date_obj:
             flash('Invalid end date format', 'danger')
             end_date = ''
     
-    # Status filter
-    if status:
-        query = query.filter(Bill.status == status)
-    
-    # Get summary statistics for the filtered results
-    total_bills = query.count()
-    total_amount = query.with_entities(db.func.sum(Bill.total_amount)).scalar() or 0
+    # Get summary statistics for the filtered results in one aggregate query
+    total_bills, total_amount = bill_list_summary(search, start_date_obj, end_date_obj, status)
     
-    bills = query.order_by(Bill.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False)
+    # Page rows carry only the listed columns plus the joined customer name
+    bills = paginate_rows(
+        bill_list_query(search, start_date_obj, end_date_obj, status),
+        page=page, per_page=20, total=total_bills)
     
     return render_template('bills.html', 
                          bills=bills, 
@@ -562,229 +454,64 @@ def bills():
                          total_bills=total_bills,
                          total_amount=total_amount)
 
+def queue_bill_export(kind, filters):
+    """Queue a bill export job and send the user to its progress page"""
+    job = enqueue_job(kind, {'filters': filters}, user_id=current_user.id)
+    flash('The export is being prepared in the background; download it from this page when it is ready.', 'info')
+    return redirect(url_for('jobs.job_detail', job_id=job.id))
+
+def export_in_background(filters):
+    """Large exports (or ones asked for with ?background=1) run as background jobs"""
+    return (request.args.get('background') == '1'
+            or count_export_bills(filters) > app.config['EXPORT_SYNC_LIMIT'])
+
 @app.route('/bills/export/excel')
 @login_required
 def export_bills_excel():
     """Export filtered bills to Excel"""
-    search = request.args.get('search', '')
-    start_date = request.args.get('start_date', '')
-    end_date = request.args.get('end_date', '')
-    status = request.args.get('status', '')
-    
-    # Build query with same filters as bills view
-    query = Bill.query.join(Customer)
-    
-    if search:
-        query = query.filter(Bill.bill_number.contains(search) |
-                           Customer.name.contains(search))
-    
-    if start_date:
-        try:
-            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-            query = query.filter(Bill.bill_date >= start_date_obj)
-        except ValueError:
-            pass
+    filters = export_filters(request.args)
+    if export_in_background(filters):
+        return queue_bill_export('bills_excel_export', filters)
     
-    if end_date:
-        try:
-            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-            query = query.filter(Bill.bill_date <= end_date_obj)
-        except ValueError:
-            pass
-    
-    if status:
-        query = query.filter(Bill.status == status)
-    
-    bills = query.order_by(Bill.created_at.desc()).all()
-    
-    # Create Excel workbook
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Bills Export"
-    
-    # Define styles
-    header_font = Font(bold=True, color='FFFFFF')
-    header_fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
-    header_alignment = Alignment(horizontal='center', vertical='center')
-    
-    # Header row
-    headers = ['Bill Number', 'Customer Name', 'Bill Date', 'Due Date', 'Status', 
-               'Subtotal', 'CGST', 'SGST', 'IGST', 'Total Amount']
-    
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-    
-    # Data rows
-    for row, bill in enumerate(bills, 2):
-        ws.cell(row=row, column=1, value=bill.bill_number)
-        ws.cell(row=row, column=2, value=bill.customer.name)
-        ws.cell(row=row, column=3, value=bill.bill_date.strftime('%d/%m/%Y'))
-        ws.cell(row=row, column=4, value=bill.due_date.strftime('%d/%m/%Y') if bill.due_date else '')
-        ws.cell(row=row, column=5, value=bill.status)
-        ws.cell(row=row, column=6, value=float(bill.subtotal))
-        ws.cell(row=row, column=7, value=float(bill.cgst_amount))
-        ws.cell(row=row, column=8, value=float(bill.sgst_amount))
-        ws.cell(row=row, column=9, value=float(bill.igst_amount))
-        ws.cell(row=row, column=10, value=float(bill.total_amount))
-    
-    # Auto-adjust column widths
-    for col in range(1, len(headers) + 1):
-        ws.column_dimensions[get_column_letter(col)].width = 15
-    
-    # Save to BytesIO
     output = io.BytesIO()
-    wb.save(output)
+    write_bills_excel(output, filters)
     output.seek(0)
     
-    # Generate filename
-    date_range = ""
-    if start_date and end_date:
-        date_range = f"_{start_date}_to_{end_date}"
-    elif start_date:
-        date_range = f"_from_{start_date}"
-    elif end_date:
-        date_range = f"_until_{end_date}"
-    
-    filename = f"bills_export{date_range}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    
     return send_file(
         output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        mimetype=EXCEL_MIMETYPE,
         as_attachment=True,
-        download_name=filename
+        download_name=export_filename('bills_export', 'xlsx', filters)
     )
 
 @app.route('/bills/export/pdf')
 @login_required
 def export_bills_pdf():
     """Export filtered bills to PDF"""
-    search = request.args.get('search', '')
-    start_date = request.args.get('start_date', '')
-    end_date = request.args.get('end_date', '')
-    status = request.args.get('status', '')
-    
-    # Build query with same filters as bills view
-    query = Bill.query.join(Customer)
-    
-    if search:
-        query = query.filter(Bill.bill_number.contains(search) |
-                           Customer.name.contains(search))
-    
-    if start_date:
-        try:
-            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-            query = query.filter(Bill.bill_date >= start_date_obj)
-        except ValueError:
-            pass
-    
-    if end_date:
-        try:
-            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-            query = query.filter(Bill.bill_date <= end_date_obj)
-        except ValueError:
-            pass
-    
-    if status:
-        query = query.filter(Bill.status == status)
+    filters = export_filters(request.args)
+    if export_in_background(filters):
+        return queue_bill_export('bills_pdf_export', filters)
     
-    bills = query.order_by(Bill.created_at.desc()).all()
-    company = Company.query.first()
-    
-    # Create PDF
     buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
-    
-    # Container for the 'Flowable' objects
-    elements = []
-    
-    # Define styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-    
-    # Title
-    title = f"Bills Export Report"
-    if start_date and end_date:
-        title += f" ({start_date} to {end_date})"
-    elif start_date:
-        title += f" (from {start_date})"
-    elif end_date:
-        title += f" (until {end_date})"
-    
-    elements.append(Paragraph(title, title_style))
-    elements.append(Spacer(1, 12))
-    
-    # Company info
-    if company:
-        elements.append(Paragraph(f"<b>{company.name}</b>", styles['Normal']))
-        elements.append(Paragraph(f"GST No: {company.gst_number}", styles['Normal']))
-        elements.append(Spacer(1, 12))
-    
-    # Summary
-    total_amount = sum(float(bill.total_amount) for bill in bills)
-    elements.append(Paragraph(f"<b>Total Bills:</b> {len(bills)}", styles['Normal']))
-    elements.append(Paragraph(f"<b>Total Amount:</b> ₹{total_amount:,.2f}", styles['Normal']))
-    elements.append(Spacer(1, 20))
-    
-    # Table data
-    data = [['Bill Number', 'Customer', 'Date', 'Status', 'Amount']]
-    
-    for bill in bills:
-        data.append([
-            bill.bill_number,
-            bill.customer.name,
-            bill.bill_date.strftime('%d/%m/%Y'),
-            bill.status,
-            f"₹{float(bill.total_amount):,.2f}"
-        ])
-    
-    # Create table
-    table = Table(data, colWidths=[100, 150, 80, 80, 100])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('ALIGN', (4, 1), (4, -1), 'RIGHT'),  # Right align amount column
-    ]))
-    
-    elements.append(table)
-    
-    # Build PDF
-    doc.build(elements)
-    
-    # Generate filename
-    date_range = ""
-    if start_date and end_date:
-        date_range = f"_{start_date}_to_{end_date}"
-    elif start_date:
-        date_range = f"_from_{start_date}"
-    elif end_date:
-        date_range = f"_until_{end_date}"
-    
-    filename = f"bills_export{date_range}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    
+    write_bills_pdf(buffer, filters)
     buffer.seek(0)
+    
     return send_file(
         buffer,
         mimetype='application/pdf',
         as_attachment=True,
-        download_name=filename
+        download_name=export_filename('bills_export', 'pdf', filters)
     )
 
+@app.route('/bills/export/invoices')
+@login_required
+def export_invoice_pdfs():
+    """Render the invoice PDFs of the filtered bills into a ZIP, as a background job"""
+    if not Company.query.first():
+        flash('Please configure company details first!', 'warning')
+        return redirect(url_for('company_config'))
+    return queue_bill_export('invoice_pdf_batch', export_filters(request.args))
+
 @app.route('/bills/create', methods=['GET', 'POST'])
 @login_required
 def create_bill():
@@ -823,109 +550,8 @@ def create_bill():
             item_form.product_id.choices = product_choices
     
     if form.validate_on_submit():
-        # Generate bill number
-        current_year = datetime.now().year
-        sequence = BillSequence.query.filter_by(year=current_year).first()
-        if not sequence:
-            sequence = BillSequence(year=current_year, sequence_number=0)
-            db.session.add(sequence)
-        
-        sequence.sequence_number += 1
-        bill_number = f"INV-{current_year}-{sequence.sequence_number:04d}"
-        
-        # Create bill
-        bill = Bill(
-            bill_number=bill_number,
-            customer_id=form.customer_id.data,
-            bill_date=form.bill_date.data,
-            due_date=form.due_date.data,
-            discount_type=form.discount_type.data or 'none',
-            discount_value=form.discount_value.data or 0,
-            notes=form.notes.data
-        )
-        
-        # Get customer and company for GST calculations
-        customer = Customer.query.get(form.customer_id.data)
-        company = Company.query.first()
-        
-        # Calculate totals
-        from decimal import Decimal
-        subtotal = Decimal('0')
-        total_cgst = Decimal('0')
-        total_sgst = Decimal('0')
-        total_igst = Decimal('0')
-        
-        # Process items
-        for item_form in form.items:
-            if item_form.product_name.data:
-                # Handle the case where form fields might be strings or field objects
-                def get_field_value(field):
-                    if hasattr(field, 'data'):
-                        return field.data
-                    return field
-                
-                # Get values and ensure they're proper Decimal types
-                quantity_val = get_field_value(item_form.quantity)
-                rate_val = get_field_value(item_form.rate)
-                gst_rate_val = get_field_value(item_form.gst_rate)
-                
-                item = BillItem(
-                    product_name=get_field_value(item_form.product_name),
-                    description=get_field_value(item_form.description) or '',
-                    hsn_code=get_field_value(item_form.hsn_code),
-                    quantity=safe_decimal(quantity_val, '1'),
-                    unit=get_field_value(item_form.unit),
-                    rate=safe_decimal(rate_val, '0'),
-                    unit_price=safe_decimal(rate_val, '0'),  # Set unit_price same as rate
-                    gst_rate=safe_decimal(gst_rate_val, '18')
-                )
-                
-                # Calculate amounts
-                item.amount = item.quantity * item.rate
-                item.taxable_amount = item.amount  # Set taxable_amount same as amount for legacy support
-                subtotal += item.amount
-                
-                # Calculate GST
-                gst_amounts = calculate_gst(
-                    item.amount, 
-                    item.gst_rate, 
-                    company.state_code if company else '27',
-                    customer.state_code if customer and customer.state_code else company.state_code if company else '27'
-                )
-                
-                item.cgst_amount = gst_amounts['cgst']
-                item.sgst_amount = gst_amounts['sgst']
-                item.igst_amount = gst_amounts['igst']
-
-                # Set legacy fields
-                item.gst_amount = item.cgst_amount + item.sgst_amount + item.igst_amount
-                item.total_amount = item.amount + item.gst_amount
-
-                
-                total_cgst += item.cgst_amount
-                total_sgst += item.sgst_amount
-                total_igst += item.igst_amount
-                
-                bill.items.append(item)
-        
-        # Calculate discount
-        discount_amount = Decimal('0')
-        if bill.discount_type == 'percentage' and bill.discount_value > 0:
-            discount_amount = (subtotal * bill.discount_value) / 100
-        elif bill.discount_type == 'amount' and bill.discount_value > 0:
-            discount_amount = min(bill.discount_value, subtotal)
-        
-        # Set bill totals
-        bill.subtotal = subtotal
-        bill.discount_amount = discount_amount
-        bill.cgst_amount = total_cgst
-        bill.sgst_amount = total_sgst
-        bill.igst_amount = total_igst
-        bill.gst_amount = total_cgst + total_sgst + total_igst  # Calculate total GST amount
-        bill.total_amount = subtotal - discount_amount + total_cgst + total_sgst + total_igst
-        bill.final_amount = bill.total_amount  # Set final_amount same as total_amount for legacy support
-        
-        db.session.add(bill)
+        lines = [line_from_form(item_form) for item_form in form.items]
+        bill = create_bill_from_lines(header_from_form(form), lines)
         db.session.commit()
         
         flash('Bill created successfully!', 'success')
@@ -973,8 +599,10 @@ def view_bill(id):
         return redirect(url_for('view_bill', id=id))
     
     current_time = datetime.now().strftime('%d/%m/%Y %I:%M %p')
+    rate_summary = get_rate_summary(get_tax_breakup(bill))
     
-    return render_template('view_bill.html', bill=bill, company=company, current_time=current_time)
+    return render_template('view_bill.html', bill=bill, company=company, current_time=current_time,
+                           rate_summary=rate_summary)
 
 @app.route('/bills/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -991,123 +619,16 @@ def edit_bill(id):
     products = Product.query.all()
     product_choices = [(0, 'Select Product')] + [(p.id, f"{p.name} - ₹{p.price}") for p in products]
     
-    # Clear existing items and populate with current bill items
-    form.items.entries.clear()
-    for item in bill.items:
-        item_form = BillItemForm()
-        item_form.product_id.choices = product_choices
-        item_form.product_id.data = item.product_id if item.product_id else 0
-        item_form.product_name.data = item.product_name
-        item_form.description.data = item.description
-        item_form.hsn_code.data = item.hsn_code
-        item_form.quantity.data = item.quantity
-        item_form.unit.data = item.unit
-        item_form.rate.data = item.rate
-        item_form.gst_rate.data = item.gst_rate
-        form.items.append_entry(item_form)
+    # Item entries come from the submitted form on POST and from bill.items on GET
     
     # Populate product choices for each item in the form
     for item_form in form.items:
         item_form.product_id.choices = product_choices
     
     if form.validate_on_submit():
-        # Update bill details
-        bill.customer_id = form.customer_id.data
-        bill.bill_date = form.bill_date.data
-        bill.due_date = form.due_date.data
-        bill.status = form.status.data
-        bill.discount_type = form.discount_type.data or 'none'
-        bill.discount_value = form.discount_value.data or 0
-        bill.notes = form.notes.data
-        
-        # Clear existing items
-        for item in bill.items:
-            db.session.delete(item)
-        
-        # Get customer and company for GST calculations
-        customer = Customer.query.get(form.customer_id.data)
-        company = Company.query.first()
-        
-        # Calculate totals
-        from decimal import Decimal
-        subtotal = Decimal('0')
-        total_cgst = Decimal('0')
-        total_sgst = Decimal('0')
-        total_igst = Decimal('0')
-        
-        # Process items
-        for item_form in form.items:
-            if item_form.product_name.data:
-                # Handle the case where form fields might be strings or field objects
-                def get_field_value(field):
-                    if hasattr(field, 'data'):
-                        return field.data
-                    return field
-                
-                # Get values and ensure they're proper Decimal types
-                quantity_val = get_field_value(item_form.quantity)
-                rate_val = get_field_value(item_form.rate)
-                gst_rate_val = get_field_value(item_form.gst_rate)
-                
-                item = BillItem(
-                    product_name=get_field_value(item_form.product_name),
-                    description=get_field_value(item_form.description) or '',
-                    hsn_code=get_field_value(item_form.hsn_code),
-                    quantity=safe_decimal(quantity_val, '1'),
-                    unit=get_field_value(item_form.unit),
-                    rate=safe_decimal(rate_val, '0'),
-                    unit_price=safe_decimal(rate_val, '0'),  # Set unit_price same as rate
-                    gst_rate=safe_decimal(gst_rate_val, '18')
-                )
-                
-                # Calculate amounts
-                item.amount = item.quantity * item.rate
-                item.taxable_amount = item.amount  # Set taxable_amount same as amount for legacy support
-                subtotal += item.amount
-                
-                # Calculate GST
-                gst_amounts = calculate_gst(
-                    item.amount, 
-                    item.gst_rate, 
-                    company.state_code if company else '27',
-                    customer.state_code if customer and customer.state_code else company.state_code if company else '27'
-                )
-                
-                item.cgst_amount = gst_amounts['cgst']
-                item.sgst_amount = gst_amounts['sgst']
-                item.igst_amount = gst_amounts['igst']
-
-                # Set legacy fields
-                item.gst_amount = item.cgst_amount + item.sgst_amount + item.igst_amount
-                item.total_amount = item.amount + item.gst_amount
-
-                
-                total_cgst += item.cgst_amount
-                total_sgst += item.sgst_amount
-                total_igst += item.igst_amount
-                
-                bill.items.append(item)
-        
-        # Calculate discount for edit bill
-        discount_amount = Decimal('0')
-        if bill.discount_type == 'percentage' and bill.discount_value > 0:
-            discount_amount = (subtotal * bill.discount_value) / 100
-        elif bill.discount_type == 'amount' and bill.discount_value > 0:
-            discount_amount = min(bill.discount_value, subtotal)
-        
-        # Set bill totals
-        bill.subtotal = subtotal
-        bill.discount_amount = discount_amount
-        bill.cgst_amount = total_cgst
-        bill.sgst_amount = total_sgst
-        bill.igst_amount = total_igst
-        bill.gst_amount = total_cgst + total_sgst + total_igst  # Calculate total GST amount
-        bill.total_amount = subtotal - discount_amount + total_cgst + total_sgst + total_igst
-        bill.final_amount = bill.total_amount  # Set final_amount same as total_amount for legacy support
-        
-        # Update modified timestamp
-        bill.updated_at = datetime.now()
-        
+        # Only write the item rows that changed and adjust the totals by their deltas
+        lines = [line_from_form(item_form) for item_form in form.items]
+        update_bill_from_lines(bill, header_from_form(form), lines)
         db.session.commit()
         
         flash('Bill updated successfully!', 'success')
@@ -1146,42 +667,131 @@ def edit_bill(id):
     
     return render_template('create_bill.html', form=form, products=products_data, edit_mode=True, bill=bill)
 
+def bill_from_payload(bill=None):
+    """Create (or, given a bill, update) a bill from a JSON payload with parallel item arrays"""
+    try:
+        header, lines = validate_bill_payload(request.get_json(silent=True))
+        check_bill_references(header, lines)
+    except BillPayloadError as e:
+        return jsonify({'success': False, 'errors': e.errors}), 400
+
+    if bill is None:
+        bill = create_bill_from_lines(header, lines)
+        status = 201
+    else:
+        update_bill_from_lines(bill, header, lines)
+        status = 200
+    db.session.commit()
+    return jsonify({
+        'success': True,
+        'bill': {
+            'id': bill.id,
+            'bill_number': bill.bill_number,
+            'lines': len(lines),
+            'subtotal': float(bill.subtotal),
+            'total_amount': float(bill.total_amount),
+            'url': url_for('view_bill', id=bill.id)
+        }
+    }), status
+
+@app.route('/api/bills', methods=['POST'])
+@login_required
+def create_bill_api():
+    """Create a bill from JSON, for large invoices (see bill_payload.py for the format)"""
+    return bill_from_payload()
+
+@app.route('/api/bills/<int:id>', methods=['PUT'])
+@login_required
+def update_bill_api(id):
+    """Replace a bill's header and lines from JSON; unchanged item rows are kept"""
+    return bill_from_payload(Bill.query.get_or_404(id))
+
 @app.route('/bills/<int:id>/pdf')
 def download_bill_pdf(id):
-    """Download bill as PDF"""
-    bill = Bill.query.get_or_404(id)
+    """Download bill as PDF (a 304 when the client's copy is current, see http_cache.py)"""
     company = Company.query.first()
     
     if not company:
         flash('Please configure company details first!', 'warning')
         return redirect(url_for('company_config'))
     
-    pdf_file = generate_invoice_pdf(bill, company)
+    validator = bill_pdf_version(id)
+    if validator is None:
+        abort(404)
+    
+    def build():
+        bill = Bill.query.get_or_404(id)
+        pdf_file = generate_invoice_pdf(bill, company)
+        return send_file(
+            pdf_file,
+            as_attachment=True,
+            download_name=f"Invoice_{bill.bill_number}.pdf",
+            mimetype='application/pdf'
+        )
     
-    return send_file(
-        pdf_file,
-        as_attachment=True,
-        download_name=f"Invoice_{bill.bill_number}.pdf",
-        mimetype='application/pdf'
-    )
+    return conditional_response(*validator, build, negotiated=False)
 
 @app.route('/api/products/<int:id>')
 def get_product_api(id):
     """API endpoint to get product details"""
-    product = Product.query.get_or_404(id)
-    return jsonify({
-        'product': {
-            'id': product.id,
-            'name': product.name,
-            'description': product.description,
-            'price': float(product.price),
-            'hsn_code': product.hsn_code,
-            'gst_rate': float(product.gst_rate),
-            'unit': product.unit,
-            'category': product.category.name if product.category else 'General'
-        }
-    })
-    
+    validator = product_version(id)
+    if validator is None:
+        abort(404)
+
+    def build():
+        row = db.session.execute(product_detail_query(id)).first()
+        if row is None:
+            abort(404)
+        return api_response({'product': product_api_payload(row)})
+
+    return conditional_response(*validator, build)
+
+def parse_product_ids(values):
+    """Distinct product ids, in order, from the batch endpoint's ids; None if any is invalid"""
+    if not isinstance(values, list):
+        return None
+    ids = []
+    for value in values:
+        if isinstance(value, str) and value.strip().isdigit():
+            value = int(value)
+        if type(value) is not int or value <= 0:
+            return None
+        ids.append(value)
+    ids = list(dict.fromkeys(ids))
+    return ids if 0 < len(ids) <= PRODUCT_BATCH_LIMIT else None
+
+def products_batch_payload(product_ids):
+    """The products of a batch request, in the requested order, with the ids not found"""
+    rows = {row.id: row for row in db.session.execute(products_by_ids_query(product_ids))}
+    searchable_fields = db.session.execute(searchable_fields_query('product')).all()
+    return {
+        'products': [product_api_payload(rows[i], searchable_fields) for i in product_ids if i in rows],
+        'missing': [i for i in product_ids if i not in rows],
+    }
+
+@app.route('/api/products/batch', methods=['GET', 'POST'])
+@login_required
+def products_batch_api():
+    """
+    Several products in one request: GET ?ids=1,2,3, or POST {"ids": [1, 2, 3]}
+    for lists too long for a URL. Two queries whatever the number of ids.
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        values = data.get('ids') if isinstance(data, dict) else None
+    else:
+        values = [value for param in request.args.getlist('ids') for value in param.split(',') if value]
+    product_ids = parse_product_ids(values)
+    if product_ids is None:
+        return jsonify({'error': f"ids must be 1 to {PRODUCT_BATCH_LIMIT} product ids"}), 400
+
+    def build():
+        return api_response(products_batch_payload(product_ids))
+
+    if request.method == 'GET':
+        return conditional_response(*catalogue_version(), build)
+    return build()
+
 @app.route('/api/products/search')
 @login_required
 def search_products_api():
@@ -1189,145 +799,24 @@ def search_products_api():
     try:
         term = request.args.get('term', '').strip()
         category = request.args.get('category', '')
-        
-        # Base query for products matching standard fields
-        standard_query = Product.query
-        
-        # Apply search term filter to standard fields
-        if term:
-            standard_query = standard_query.filter(
-                or_(
-                    Product.name.ilike(f"%{term}%"),
-                    Product.description.ilike(f"%{term}%"),
-                    Product.hsn_code.ilike(f"%{term}%")
-                )
-            )
-        
-        # Apply category filter
-        if category:
-            standard_query = standard_query.join(Category).filter(Category.category_name == category)
-        
-        # Get results from standard fields (limit to 100 for performance)
-        standard_products = standard_query.order_by(Product.name).limit(100).all()
-        
-        # If term is provided, also search by all searchable custom fields
-        if term:
-            from models import FieldDefinition, FieldData
-            
-            # Get IDs of products that were found through standard search
-            found_product_ids = {p.id for p in standard_products}
-            
-            # Find all searchable fields for products
-            searchable_fields = FieldDefinition.query.filter_by(
-                entity_type='product',
-                enabled=True,
-                searchable=True
-            ).all()
-            
-            # Create a mapping of field_ids to field objects for later use
-            field_id_to_field = {field.id: field for field in searchable_fields}
-            
-            # If there are searchable fields, search for matching values
-            additional_products = []
-            if searchable_fields:
-                field_ids = [field.id for field in searchable_fields]
-                
-                # Search in FieldData for matching values
-                try:
-                    # First try to search with value_text which is the most common type
-                    matching_field_data = FieldData.query.filter(
-                        FieldData.field_definition_id.in_(field_ids),
-                        FieldData.value_text.ilike(f"%{term}%")
-                    ).all()
-                    
-                    # Get unique product IDs from matching field data that aren't already found
-                    additional_product_ids = {fd.entity_id for fd in matching_field_data} - found_product_ids
-                    
-                    # Get additional products
-                    if additional_product_ids:
-                        add_products = Product.query.filter(
-                            Product.id.in_(additional_product_ids)
-                        ).all()
-                        
-                        additional_products.extend(add_products)
-                        # Update found_product_ids to prevent duplicates
-                        found_product_ids.update({p.id for p in add_products})
-                except Exception as e:
-                    app.logger.error(f"Error searching text field data: {str(e)}")
-                
-                # Now try with the custom_fields JSON column (newer approach)
-                try:
-                    for field in searchable_fields:
-                        # Skip fields we've already found products for
-                        if field.field_name in ['serial_number', 'color', 'material']:  # Common searchable fields
-                                            # This approach may vary depending on the database engine
-                            # We'll use string comparison since we don't know if the database supports JSON_EXTRACT
-                            # Filter products where the custom_fields column contains the search term
-                            try:
-                                # Try a simpler approach that should work with SQLite
-                                json_products = Product.query.filter(
-                                    cast(Product.custom_fields, String).ilike(f"%{term}%"),
-                                    ~Product.id.in_(found_product_ids)  # Exclude already found products
-                                ).all()
-                            except Exception as json_err:
-                                app.logger.error(f"JSON search error: {str(json_err)}")
-                                json_products = []
-                            
-                            if json_products:
-                                additional_products.extend(json_products)
-                                # Update found_product_ids
-                                found_product_ids.update({p.id for p in json_products})
-                except Exception as e:
-                    app.logger.error(f"Error searching JSON custom fields: {str(e)}")
-                
-                # Combine results
-                if additional_products:
-                    products = standard_products + additional_products
-                else:
-                    products = standard_products
-            else:
-                products = standard_products
-        else:
-            products = standard_products
-    
-        # Format results with custom field values
-        from field_utils import get_entity_field_value
-        
-        result = {
-            'products': []
-        }
-        
-        for p in products:
-            # Create base product data
-            product_data = {
-                'id': p.id,
-                'name': p.name,
-                'description': p.description,
-                'price': float(p.price),
-                'hsn_code': p.hsn_code,
-                'gst_rate': float(p.gst_rate),
-                'unit': p.unit,
-                'category': p.category.category_name if p.category else 'General',
-                'custom_fields': {}  # Add custom fields here
-            }
-            
-            # Add all searchable custom fields to the result
-            if 'searchable_fields' in locals() and searchable_fields:
-                for field in searchable_fields:
-                    try:
-                        field_value = get_entity_field_value('product', p.id, field.field_name)
-                        if field_value:
-                            product_data['custom_fields'][field.field_name] = {
-                                'value': field_value,
-                                'display_name': field.display_name
-                            }
-                    except Exception as e:
-                        app.logger.error(f"Error getting field value for {field.field_name}: {str(e)}")
-            
-            result['products'].append(product_data)
-        
-        return jsonify(result)
-        
+
+        def build():
+            # Products matching standard fields (limited to 100 for performance)
+            products = db.session.execute(product_search_query(term, category)).all()
+
+            # Searchable custom fields are returned with every product and, when
+            # there is a term, searched for products the standard fields missed
+            searchable_fields = db.session.execute(searchable_fields_query('product')).all()
+            if term and searchable_fields:
+                found_ids = {p.id for p in products}
+                products += db.session.execute(product_custom_field_search_query(
+                    term, [field.id for field in searchable_fields], found_ids)).all()
+
+            return api_response({'products': [product_api_payload(p, searchable_fields) for p in products]})
+
+        # Every search result changes with the catalogue version; caches key it by URL
+        return conditional_response(*catalogue_version(), build)
+
     except Exception as e:
         app.logger.error(f"Error in search_products_api: {str(e)}")
         return jsonify({
@@ -1339,53 +828,12 @@ def search_products_api():
 @login_required
 def recent_products_api():
     """API endpoint to get recent/popular products"""
-    # Get recently created products
-    recent_products = Product.query.order_by(Product.created_at.desc()).limit(20).all()
-    
-    # Get all searchable fields for products
-    from models import FieldDefinition
-    searchable_fields = FieldDefinition.query.filter_by(
-        entity_type='product',
-        enabled=True,
-        searchable=True
-    ).all()
-    
-    # Format results with custom field values
-    from field_utils import get_entity_field_value
-    
-    result = {
-        'products': []
-    }
-    
-    for p in recent_products:
-        # Create base product data
-        product_data = {
-            'id': p.id,
-            'name': p.name,
-            'description': p.description,
-            'price': float(p.price),
-            'hsn_code': p.hsn_code,
-            'gst_rate': float(p.gst_rate),
-            'unit': p.unit,
-            'category': p.category.category_name if p.category else 'General',
-            'custom_fields': {}  # Add custom fields here
-        }
-        
-        # Add all searchable custom fields to the result
-        if searchable_fields:
-            for field in searchable_fields:
-                field_value = get_entity_field_value('product', p.id, field.field_name)
-                if field_value:
-                    product_data['custom_fields'][field.field_name] = {
-                        'value': field_value,
-                        'display_name': field.display_name
-                    }
-        
-        result['products'].append(product_data)
-    
-    return jsonify(result)
-    
-    return jsonify(result)
+    def build():
+        recent_products = db.session.execute(recent_products_query()).all()
+        searchable_fields = db.session.execute(searchable_fields_query('product')).all()
+        return api_response({'products': [product_api_payload(p, searchable_fields) for p in recent_products]})
+
+    return conditional_response(*catalogue_version(), build)
 
 @app.route('/api/customers/quick-add', methods=['POST'])
 def quick_add_customer():
@@ -0,0 +1,405 @@
+"""
+Synthetic GST billing data at production scale, for load and capacity testing.
+
+``seed_database`` adds customers, products and bills shaped like real
+billing data:
+
+- customers across several states (most in the company's state, so bills
+  mix intra-state CGST/SGST and inter-state IGST supplies), most of them
+  registered businesses with valid GSTINs, a few guests;
+- products drawn from common HSN headings with their usual GST slab;
+- bills spread over the last two years in date order, numbered
+  INV-<year>-NNNN after any existing bills (BillSequence is moved on), with
+  a skewed line count: mostly a handful of lines, occasionally thirty.
+
+Line amounts are computed in integer paise with the same rounding as
+gst_calculator.calculate_gst, and header totals and the tax summary rows
+are consistent with the items, so ``db_manage.py check-totals`` passes on
+seeded data. The daily GST aggregates are rebuilt at the end.
+
+Rows are streamed in batches of bills and written with COPY on PostgreSQL
+and executemany on SQLite, with ids assigned up front; the tax summary
+rows and the mobile sync feed rows are built in the database with
+INSERT ... SELECT. Seed into a database nothing else is writing to.
+"""
+
+import io
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import select, insert, func, literal
+from extensions import db
+from models import (Company, Customer, Product, Category, Bill, BillItem, BillTaxSummary, BillSequence,
+                    FieldDefinition, FieldData)
+from gstin import checksum_char
+from bill_utils import calculate_discount
+from sync_feed import record_bulk_changes
+
+DEFAULT_BATCH_BILLS = 20000
+
+COMPANY_STATE = '29'
+
+# (line count, weight): most invoices are short, a few are long
+ITEM_COUNT_WEIGHTS = ((1, 18), (2, 16), (3, 14), (4, 11), (5, 9), (6, 7), (8, 7), (10, 6), (15, 6),
+                      (20, 4), (30, 2))
+
+# (state code, weight): most customers in the company's state
+CUSTOMER_STATES = (('29', 55), ('27', 12), ('33', 10), ('07', 8), ('24', 6), ('36', 5), ('09', 4))
+
+# (HSN code, product noun, GST rate, unit)
+HSN_CATALOGUE = (
+    ('7318', 'Bolt', 18, 'Nos'), ('7318', 'Screw', 18, 'Box'), ('8481', 'Valve', 18, 'Nos'),
+    ('8413', 'Pump', 18, 'Nos'), ('8536', 'Switch', 18, 'Nos'), ('8544', 'Cable', 18, 'Mtr'),
+    ('3923', 'Container', 18, 'Nos'), ('4016', 'Gasket', 18, 'Nos'), ('8302', 'Hinge', 18, 'Nos'),
+    ('9403', 'Cabinet', 18, 'Nos'), ('8517', 'Router', 18, 'Nos'), ('3917', 'Pipe', 18, 'Mtr'),
+    ('6109', 'T-Shirt', 5, 'Nos'), ('6302', 'Towel', 5, 'Nos'), ('1006', 'Basmati Rice', 5, 'Kg'),
+    ('0902', 'Tea', 5, 'Kg'), ('3004', 'Tablet Strip', 12, 'Box'), ('4820', 'Notebook', 12, 'Nos'),
+    ('6403', 'Leather Shoe', 12, 'Set'), ('8708', 'Brake Pad', 28, 'Set'), ('2202', 'Soft Drink', 28, 'Ltr'),
+    ('8415', 'Air Conditioner', 28, 'Nos'), ('0401', 'Milk', 0, 'Ltr'), ('1101', 'Wheat Flour', 0, 'Kg'),
+)
+
+ADJECTIVES = ('Steel', 'Premium', 'Classic', 'Industrial', 'Compact', 'Heavy Duty', 'Eco', 'Pro', 'Deluxe',
+              'Standard', 'Mini', 'Smart', 'Organic', 'Brass', 'Cotton')
+BUSINESS_WORDS = ('Traders', 'Enterprises', 'Industries', 'Agencies', 'Distributors', 'Retail', 'Stores')
+COLORS = ('Red', 'Blue', 'Black', 'White', 'Green', 'Silver', 'Grey')
+MATERIALS = ('Steel', 'Cotton', 'Plastic', 'Brass', 'Aluminium', 'Rubber', 'Wood')
+
+STATUSES = (('Paid', 55), ('Sent', 25), ('Draft', 15), ('Cancelled', 5))
+DISCOUNTS = ((('none', Decimal('0')), 80), (('percentage', Decimal('5')), 10), (('amount', Decimal('100')), 10))
+QUANTITIES = (1, 1, 1, 2, 2, 3, 5, 10, 12, 24, 50)
+
+# Days of bills generated back from today
+BILL_HISTORY_DAYS = 730
+
+_LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+_CENT = Decimal('0.01')
+
+
+def make_gstin(rng, state_code, number=None):
+    """
+    A GSTIN for a state, with a valid check character.
+
+    The PAN part is random, or encodes ``number`` (below 26^5 * 10^4) when
+    given, so that distinct numbers always give distinct GSTINs.
+    """
+    if number is None:
+        letters, digits = ''.join(rng.choices(_LETTERS, k=5)), rng.randint(0, 9999)
+    else:
+        rest, digits = divmod(number, 10000)
+        letters = ''
+        for _ in range(5):
+            rest, index = divmod(rest, len(_LETTERS))
+            letters = _LETTERS[index] + letters
+    body = state_code + letters + f"{digits:04d}" + rng.choice(_LETTERS) + rng.choice('123456789') + 'Z'
+    return body + checksum_char(body)
+
+
+def _money(paise):
+    return f"{paise // 100}.{paise % 100:02d}"
+
+
+def _timestamp(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def _weighted_choices(rng, choices, k):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights, k=k)
+
+
+class BulkLoader:
+    """Writes rows through the connection's DBAPI cursor: COPY on PostgreSQL, executemany elsewhere"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.copy = connection.dialect.name == 'postgresql'
+        self.cursor = connection.connection.dbapi_connection.cursor()
+        self.placeholder = '%s' if connection.dialect.paramstyle in ('format', 'pyformat') else '?'
+
+    def load(self, model, columns, rows, nulls=True):
+        """
+        Write rows of column values (str, int or None).
+
+        Args:
+            model: Model whose table is loaded
+            columns (tuple): Column names, in row order
+            rows (list): Row tuples; text values must not contain tabs, newlines or backslashes
+            nulls (bool): Rows may contain None (a slower COPY formatting path)
+        """
+        if not rows:
+            return
+        table = model.__table__.name
+        if not self.copy:
+            placeholders = ', '.join([self.placeholder] * len(columns))
+            self.cursor.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+            return
+
+        buffer = io.StringIO()
+        if nulls:
+            buffer.writelines('\t'.join(['\\N' if value is None else str(value) for value in row]) + '\n'
+                              for row in rows)
+        else:
+            buffer.writelines('\t'.join(map(str, row)) + '\n' for row in rows)
+        buffer.seek(0)
+        self.cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+    def reset_sequences(self, models):
+        """Move PostgreSQL id sequences past the ids assigned by the seeder"""
+        if not self.copy:
+            return
+        for model in models:
+            table = model.__table__.name
+            self.cursor.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                                f"COALESCE((SELECT MAX(id) FROM {table}), 1))")
+
+
+def _next_id(connection, model):
+    return (connection.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def _ensure_company_and_categories(rng):
+    company = Company.query.first()
+    if not company:
+        company = Company(name="Synthetic Traders Pvt Ltd", address="12 MG Road, Bengaluru",
+                          gst_number=make_gstin(rng, COMPANY_STATE), state_code=COMPANY_STATE)
+        db.session.add(company)
+
+    names = sorted({f"{noun}s" for _, noun, _, _ in HSN_CATALOGUE})
+    existing = dict(db.session.execute(select(Category.category_name, Category.id)
+                                       .where(Category.category_name.in_(names))).all())
+    for name in names:
+        if name not in existing:
+            category = Category(category_name=name, custom_fields={})
+            db.session.add(category)
+            db.session.flush()
+            existing[name] = category.id
+    db.session.commit()
+    return company.state_code or COMPANY_STATE, existing
+
+
+def _seed_customers(loader, rng, count, now):
+    """Returns [(id, state_code), ...] of the new customers"""
+    first_id = _next_id(loader.connection, Customer)
+    stamp = _timestamp(now)
+    states = _weighted_choices(rng, CUSTOMER_STATES, count)
+    rows = []
+    for n, state in enumerate(states):
+        customer_id = first_id + n
+        guest = rng.random() < 0.05
+        # GSTIN and phone are derived from the id: both have unique indexes,
+        # and seeding again into the same database must not repeat them
+        gstin = None if guest or rng.random() < 0.25 else make_gstin(rng, state, customer_id)
+        rows.append((customer_id, f"{rng.choice(ADJECTIVES)} {rng.choice(BUSINESS_WORDS)} {customer_id}",
+                     f"accounts{customer_id}@example.com", f"9{customer_id:09d}",
+                     f"{rng.randint(1, 999)} Industrial Area, Phase {rng.randint(1, 4)}", gstin, state,
+                     int(guest), '{}', stamp, stamp))
+    loader.load(Customer, ('id', 'name', 'email', 'phone', 'address', 'gst_number', 'state_code', 'is_guest',
+                           'custom_fields', 'created_at', 'updated_at'), rows)
+    record_bulk_changes(Customer, Customer.id >= first_id, connection=loader.connection)
+    return list(zip(range(first_id, first_id + count), states))
+
+
+def _seed_products(loader, rng, count, now, category_ids, with_field_data):
+    """Returns the per-line values of each new product"""
+    first_id = _next_id(loader.connection, Product)
+    stamp = _timestamp(now)
+    rows, products, custom_values = [], [], []
+    for n in range(count):
+        product_id = first_id + n
+        hsn_code, noun, gst_rate, unit = rng.choice(HSN_CATALOGUE)
+        price_paise = rng.randint(500, 500000)
+        half = Decimal(gst_rate) / 2
+        name = f"{rng.choice(ADJECTIVES)} {noun} {product_id}"
+        description = f"{rng.choice(MATERIALS)} {noun.lower()}, grade {rng.choice('ABC')}"
+        custom_fields = {'serial_number': f"SN-{rng.randint(10 ** 7, 10 ** 8 - 1)}",
+                         'color': rng.choice(COLORS), 'material': rng.choice(MATERIALS)}
+        rows.append((product_id, name, description, _money(price_paise), hsn_code, str(gst_rate), str(half),
+                     str(half), unit, category_ids[f"{noun}s"], json.dumps(custom_fields), stamp, stamp))
+        # id, name, description, hsn, unit, rate, gst rate, price in paise, GST rate in basis points
+        products.append((product_id, name, description, hsn_code, unit, _money(price_paise),
+                         f"{gst_rate}.00", price_paise, gst_rate * 100))
+        custom_values.append(custom_fields)
+    loader.load(Product, ('id', 'name', 'description', 'price', 'hsn_code', 'gst_rate', 'cgst_rate', 'sgst_rate',
+                          'unit', 'category_id', 'custom_fields', 'created_at', 'updated_at'), rows, nulls=False)
+    record_bulk_changes(Product, Product.id >= first_id, connection=loader.connection)
+
+    if with_field_data:
+        # The same values as legacy FieldData rows, for migrate_field_data_to_json
+        fields = dict(loader.connection.execute(
+            select(FieldDefinition.field_name, FieldDefinition.id)
+            .where(FieldDefinition.entity_type == 'product', FieldDefinition.field_name.in_(custom_values[0]))
+        ).all()) if custom_values else {}
+        next_id = _next_id(loader.connection, FieldData)
+        field_rows = []
+        for product, values in zip(products, custom_values):
+            for name, value in values.items():
+                if name in fields:
+                    field_rows.append((next_id, fields[name], product[0], value, stamp, stamp))
+                    next_id += 1
+        loader.load(FieldData, ('id', 'field_definition_id', 'entity_id', 'value_text', 'created_at',
+                                'updated_at'), field_rows, nulls=False)
+    return products
+
+
+BILL_COLUMNS = ('id', 'bill_number', 'customer_id', 'bill_date', 'due_date', 'subtotal', 'discount_type',
+                'discount_value', 'discount_amount', 'gst_amount', 'cgst_amount', 'sgst_amount', 'igst_amount',
+                'final_amount', 'total_amount', 'status', 'custom_fields', 'created_at', 'updated_at')
+ITEM_COLUMNS = ('id', 'bill_id', 'product_id', 'product_name', 'description', 'hsn_code', 'quantity', 'unit',
+                'unit_price', 'rate', 'amount', 'taxable_amount', 'gst_rate', 'cgst_rate', 'sgst_rate',
+                'gst_amount', 'cgst_amount', 'sgst_amount', 'igst_amount', 'total_amount', 'custom_fields',
+                'created_at', 'updated_at')
+
+
+def _insert_tax_summaries(connection, first_bill_id, last_bill_id, stamp):
+    """Build the BillTaxSummary rows of a range of bills from their items"""
+    source = select(
+        BillItem.bill_id, BillItem.hsn_code, BillItem.gst_rate, BillItem.unit,
+        func.sum(BillItem.quantity), func.sum(BillItem.amount), func.sum(BillItem.cgst_amount),
+        func.sum(BillItem.sgst_amount), func.sum(BillItem.igst_amount), literal(stamp), literal(stamp),
+    ).where(BillItem.bill_id.between(first_bill_id, last_bill_id)) \
+        .group_by(BillItem.bill_id, BillItem.hsn_code, BillItem.gst_rate, BillItem.unit)
+    connection.execute(insert(BillTaxSummary).from_select(
+        ['bill_id', 'hsn_code', 'gst_rate', 'unit', 'quantity', 'taxable_amount', 'cgst_amount', 'sgst_amount',
+         'igst_amount', 'created_at', 'updated_at'], source))
+
+
+def _seed_bills(loader, rng, count, start_index, bill_total, customers, products, seller_state, sequences, now):
+    """Write one batch of bills with their items; returns the number of items"""
+    connection = loader.connection
+    first_bill_id = _next_id(connection, Bill)
+    item_id = _next_id(connection, BillItem)
+    today = now.date()
+    first_day = today - timedelta(days=BILL_HISTORY_DAYS)
+    line_counts = _weighted_choices(rng, ITEM_COUNT_WEIGHTS, count)
+    statuses = _weighted_choices(rng, STATUSES, count)
+    discounts = _weighted_choices(rng, DISCOUNTS, count)
+    product_count = len(products)
+
+    bill_rows, item_rows = [], []
+    for n in range(count):
+        bill_id = first_bill_id + n
+        customer_id, buyer_state = rng.choice(customers)
+        intra = buyer_state == seller_state
+        # Bills are generated in date order over the history window
+        bill_date = first_day + timedelta(days=(start_index + n) * BILL_HISTORY_DAYS // bill_total)
+        created = datetime.combine(bill_date, datetime.min.time()) + timedelta(seconds=rng.randint(32400, 68400))
+        stamp = _timestamp(created)
+
+        subtotal = cgst_total = sgst_total = igst_total = 0
+        lines = line_counts[n]
+        picks = rng.sample(range(product_count), lines) if lines <= product_count \
+            else rng.choices(range(product_count), k=lines)
+        for index in picks:
+            product_id, name, description, hsn_code, unit, rate, gst_rate, price, rate_bp = products[index]
+            quantity = rng.choice(QUANTITIES)
+            amount = price * quantity
+            # calculate_gst: total rounded half-up to paise; an odd paisa goes to SGST
+            gst = (amount * rate_bp + 5000) // 10000
+            if intra:
+                cgst, sgst, igst = gst // 2, gst - gst // 2, 0
+            else:
+                cgst, sgst, igst = 0, 0, gst
+            amount_text = _money(amount)
+            item_rows.append((item_id, bill_id, product_id, name, description, hsn_code, quantity, unit, rate,
+                              rate, amount_text, amount_text, gst_rate, '0', '0', _money(gst), _money(cgst),
+                              _money(sgst), _money(igst), _money(amount + gst), '{}', stamp, stamp))
+            item_id += 1
+            subtotal += amount
+            cgst_total += cgst
+            sgst_total += sgst
+            igst_total += igst
+
+        discount_type, discount_value = discounts[n]
+        subtotal_amount = Decimal(subtotal).scaleb(-2)
+        discount = calculate_discount(subtotal_amount, discount_type, discount_value)
+        gst_total = cgst_total + sgst_total + igst_total
+        total = str((subtotal_amount - discount + Decimal(gst_total).scaleb(-2)).quantize(_CENT))
+        sequences[bill_date.year] = sequences.get(bill_date.year, 0) + 1
+        bill_rows.append((bill_id, f"INV-{bill_date.year}-{sequences[bill_date.year]:04d}", customer_id,
+                          bill_date.isoformat(), (bill_date + timedelta(days=30)).isoformat(),
+                          _money(subtotal), discount_type, str(discount_value), str(discount.quantize(_CENT)), _money(gst_total),
+                          _money(cgst_total), _money(sgst_total), _money(igst_total), total, total,
+                          statuses[n], '{}', stamp, stamp))
+
+    loader.load(Bill, BILL_COLUMNS, bill_rows, nulls=False)
+    loader.load(BillItem, ITEM_COLUMNS, item_rows, nulls=False)
+    _insert_tax_summaries(connection, first_bill_id, first_bill_id + count - 1, now)
+    record_bulk_changes(Bill, Bill.id >= first_bill_id, connection=connection)
+    record_bulk_changes(BillItem, BillItem.id >= item_rows[0][0], connection=connection)
+    return len(item_rows)
+
+
+def _save_sequences(sequences):
+    existing = {row.year: row for row in BillSequence.query.filter(BillSequence.year.in_(sequences)).all()}
+    for year, number in sequences.items():
+        row = existing.get(year)
+        if row is None:
+            db.session.add(BillSequence(year=year, sequence_number=number))
+        elif row.sequence_number < number:
+            row.sequence_number = number
+
+
+def seed_database(customers=1000, products=2000, bills=10000, seed=42, batch_bills=DEFAULT_BATCH_BILLS,
+                  with_field_data=False, progress=None):
+    """
+    Add a synthetic data set to the database.
+
+    Args:
+        customers (int): Customers to add
+        products (int): Products to add
+        bills (int): Bills to add (1-30 lines each, about 6.5 on average)
+        seed (int): Random seed, for reproducible data sets
+        batch_bills (int): Bills written (and committed) per batch
+        with_field_data (bool): Also write the product custom fields as FieldData rows
+        progress (callable): Called with a status line after each step
+
+    Returns:
+        dict: Counts of the rows added and the seconds taken
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    started = time.perf_counter()
+    report = progress or (lambda message: None)
+    seller_state, category_ids = _ensure_company_and_categories(rng)
+    if bills and not (customers or Customer.query.count()) or bills and not (products or Product.query.count()):
+        raise ValueError('Bills need customers and products; add some with --customers and --products')
+
+    with db.engine.begin() as connection:
+        loader = BulkLoader(connection)
+        customer_list = _seed_customers(loader, rng, customers, now) if customers else []
+        product_list = _seed_products(loader, rng, products, now, category_ids, with_field_data) if products else []
+        loader.reset_sequences((Customer, Product, FieldData))
+    report(f"Added {customers} customers and {products} products ({time.perf_counter() - started:.1f}s)")
+
+    if bills and not customer_list:
+        customer_list = [tuple(row) for row in db.session.execute(select(Customer.id, Customer.state_code))]
+        customer_list = [(cid, state or seller_state) for cid, state in customer_list]
+    if bills and not product_list:
+        product_list = [(p.id, p.name, p.description or '', p.hsn_code, p.unit or 'Nos', _money(int(p.price * 100)),
+                         f"{p.gst_rate:.2f}", int(p.price * 100), int(p.gst_rate * 100))
+                        for p in Product.query.all()]
+
+    sequences = dict(db.session.execute(select(BillSequence.year, BillSequence.sequence_number)).all())
+    items = 0
+    for start in range(0, bills, batch_bills):
+        count = min(batch_bills, bills - start)
+        with db.engine.begin() as connection:
+            loader = BulkLoader(connection)
+            items += _seed_bills(loader, rng, count, start, bills, customer_list, product_list, seller_state,
+                                 sequences, now)
+            loader.reset_sequences((Bill, BillItem))
+        report(f"Added {start + count}/{bills} bills, {items} items ({time.perf_counter() - started:.1f}s)")
+
+    if bills:
+        _save_sequences(sequences)
+        db.session.commit()
+
+        from tax_reports import rebuild_tax_aggregates
+        rebuild_tax_aggregates(now.date() - timedelta(days=BILL_HISTORY_DAYS), now.date())
+        db.session.commit()
+        report(f"Rebuilt the GST report aggregates ({time.perf_counter() - started:.1f}s)")
+
+    return {'customers': customers, 'products': products, 'bills': bills, 'items': items,
+            'seconds': round(time.perf_counter() - started, 1)}
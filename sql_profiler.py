@@ -0,0 +1,208 @@
+"""
+Per-request SQL profiling.
+
+Every statement executed while serving a request is timed with the
+engine's before/after_cursor_execute events and counted against the
+request. When the request finishes:
+
+- in debug mode (or with SQL_PROFILER_HEADERS set) the response carries
+  X-DB-Query-Count, X-DB-Time-Ms and X-DB-Slowest-Ms headers;
+- one JSON line with the endpoint, status, query count and timings is
+  logged to the 'perf' logger (level PERF_LOG_LEVEL, default INFO);
+- the figures are added to per-endpoint totals, shown on /admin/perf.
+
+The text (never the parameters) of the slowest few statements is kept per
+request and per endpoint; those slower than SQL_SLOW_QUERY_MS are included
+in the request's log line. Totals are per process.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from flask import g, request, has_request_context
+from sqlalchemy import event
+
+DEFAULT_PROFILER_CONFIG = {
+    'SQL_PROFILER_ENABLED': True,
+    'SQL_PROFILER_HEADERS': None,   # None: only in debug mode
+    'SQL_SLOW_QUERY_MS': 100,       # Statements at least this slow are logged with the request
+    'SQL_SLOWEST_KEPT': 5,          # Slowest statements kept per request and per endpoint
+}
+
+perf_logger = logging.getLogger('perf')
+
+# Longest statement text kept for display
+STATEMENT_TEXT_LIMIT = 500
+
+
+def _statement_text(statement):
+    text = ' '.join(statement.split())
+    return text if len(text) <= STATEMENT_TEXT_LIMIT else text[:STATEMENT_TEXT_LIMIT] + '...'
+
+
+def _keep_slowest(slowest, ms, statement, limit):
+    """Add (ms, statement) to a list of the slowest statements, longest first"""
+    if len(slowest) < limit or ms > slowest[-1][0]:
+        slowest.append((ms, statement))
+        slowest.sort(key=lambda item: item[0], reverse=True)
+        del slowest[limit:]
+
+
+class RequestProfile:
+    """SQL statements executed while serving one request"""
+
+    def __init__(self, slowest_kept):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_ms = 0.0
+        self.slowest = []
+        self.slowest_kept = slowest_kept
+
+    def add(self, statement, ms):
+        self.queries += 1
+        self.db_ms += ms
+        _keep_slowest(self.slowest, ms, statement, self.slowest_kept)
+
+
+class EndpointStats:
+    """Running totals of the requests served by one endpoint"""
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_ms = 0.0
+        self.max_db_ms = 0.0
+        self.request_ms = 0.0
+        self.max_request_ms = 0.0
+        self.slowest = []
+
+    def to_dict(self, endpoint):
+        requests = self.requests or 1
+        return {
+            'endpoint': endpoint,
+            'requests': self.requests,
+            'queries': self.queries,
+            'avg_queries': round(self.queries / requests, 1),
+            'max_queries': self.max_queries,
+            'db_ms': round(self.db_ms, 1),
+            'avg_db_ms': round(self.db_ms / requests, 2),
+            'max_db_ms': round(self.max_db_ms, 2),
+            'avg_request_ms': round(self.request_ms / requests, 2),
+            'max_request_ms': round(self.max_request_ms, 2),
+            'db_share': round(self.db_ms / self.request_ms * 100, 1) if self.request_ms else 0,
+            'slowest': [{'ms': round(ms, 2), 'statement': statement} for ms, statement in self.slowest],
+        }
+
+
+class PerfStats:
+    """Per-endpoint SQL totals of this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.endpoints = {}
+            self.since = datetime.utcnow()
+
+    def record(self, endpoint, profile, request_ms):
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats()
+            stats.requests += 1
+            stats.queries += profile.queries
+            stats.max_queries = max(stats.max_queries, profile.queries)
+            stats.db_ms += profile.db_ms
+            stats.max_db_ms = max(stats.max_db_ms, profile.db_ms)
+            stats.request_ms += request_ms
+            stats.max_request_ms = max(stats.max_request_ms, request_ms)
+            for ms, statement in profile.slowest:
+                _keep_slowest(stats.slowest, ms, statement, profile.slowest_kept)
+
+    def snapshot(self):
+        """
+        Per-endpoint totals, the endpoints spending the most time in the database first.
+
+        Returns:
+            dict: {'since': ISO timestamp, 'pid': ..., 'endpoints': [EndpointStats.to_dict(), ...]}
+        """
+        with self._lock:
+            endpoints = [stats.to_dict(endpoint) for endpoint, stats in self.endpoints.items()]
+            since = self.since
+        endpoints.sort(key=lambda row: row['db_ms'], reverse=True)
+        return {'since': since.isoformat(), 'pid': os.getpid(), 'endpoints': endpoints}
+
+
+perf_stats = PerfStats()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the execution context, which is discarded when the statement raises
+    if context is not None:
+        context._profiler_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_profiler_start', None)
+    if started is None or not has_request_context():
+        return
+    profile = g.get('sql_profile')
+    if profile is not None:
+        profile.add(_statement_text(statement), (time.perf_counter() - started) * 1000)
+
+
+def init_sql_profiler(app, engine):
+    """
+    Profile the SQL of every request the app serves.
+
+    Args:
+        app (Flask): The application
+        engine: The engine whose statements are timed
+    """
+    config = {key: app.config.get(key, default) for key, default in DEFAULT_PROFILER_CONFIG.items()}
+    if not config['SQL_PROFILER_ENABLED']:
+        return
+    perf_logger.setLevel(os.environ.get('PERF_LOG_LEVEL', 'INFO').upper())
+
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_sql_profile():
+        g.sql_profile = RequestProfile(config['SQL_SLOWEST_KEPT'])
+
+    @app.after_request
+    def finish_sql_profile(response):
+        profile = g.pop('sql_profile', None)
+        if profile is None or request.endpoint == 'static':
+            return response
+        request_ms = (time.perf_counter() - profile.started) * 1000
+        endpoint = request.endpoint or 'unmatched'
+        perf_stats.record(endpoint, profile, request_ms)
+
+        show_headers = config['SQL_PROFILER_HEADERS']
+        if show_headers or (show_headers is None and app.debug):
+            response.headers['X-DB-Query-Count'] = str(profile.queries)
+            response.headers['X-DB-Time-Ms'] = f"{profile.db_ms:.2f}"
+            response.headers['X-DB-Slowest-Ms'] = f"{profile.slowest[0][0]:.2f}" if profile.slowest else '0'
+
+        if perf_logger.isEnabledFor(logging.INFO):
+            slow = [{'ms': round(ms, 2), 'statement': statement} for ms, statement in profile.slowest
+                    if ms >= config['SQL_SLOW_QUERY_MS']]
+            perf_logger.info(json.dumps({
+                'endpoint': endpoint,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'queries': profile.queries,
+                'db_ms': round(profile.db_ms, 2),
+                'request_ms': round(request_ms, 2),
+                'slow_queries': slow,
+            }))
+        return response
@@ -0,0 +1,243 @@
+"""
+Change feed for syncing the mobile app's local database.
+
+Every committed insert, update or delete of a company, customer, product,
+bill or bill item adds a SyncChange row. The row id is the sync watermark:
+a device asks for the changes after the last id it applied and gets the
+current values of the records changed since, in the column layout of the
+mobile app's tables (DatabaseService.createTables), page by page.
+
+ORM writes are recorded by mapper events and written just before commit.
+Bulk statements skip those events, so code that writes with them (the
+imports, seed_data) calls ``record_bulk_changes``. On PostgreSQL the feed
+rows are written under a transaction-level advisory lock, so ids become
+visible in commit order and a device never skips a change committed late
+with a lower id.
+"""
+
+from datetime import datetime
+from sqlalchemy import select, insert, delete, func, literal, text, event
+from sqlalchemy.orm import aliased, object_session
+from extensions import db
+from models import Company, Customer, Product, Category, Bill, BillItem, SyncChange
+
+# session.info key holding {(entity, id): operation} for the current transaction
+PENDING_KEY = 'sync_pending_changes'
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+# Key of the PostgreSQL advisory lock taken while writing feed rows
+SYNC_LOCK_KEY = 7305001
+
+SYNC_ENTITIES = {
+    'company': Company,
+    'customer': Customer,
+    'product': Product,
+    'bill': Bill,
+    'bill_item': BillItem,
+}
+_ENTITY_NAMES = {model: name for name, model in SYNC_ENTITIES.items()}
+# Category changes are expanded to changes of its products at commit
+_ENTITY_NAMES[Category] = 'category'
+
+# Entity -> mobile app table, in the order changes are applied (parents first)
+MOBILE_TABLES = {
+    'company': 'company',
+    'customer': 'customers',
+    'product': 'products',
+    'bill': 'bills',
+    'bill_item': 'bill_items',
+}
+
+
+def mobile_statement(entity):
+    """
+    SELECT of an entity's rows labelled with the mobile app's column names.
+
+    Args:
+        entity (str): Key of SYNC_ENTITIES
+
+    Returns:
+        Select: Statement to filter further (by id, for a page of changes)
+    """
+    if entity == 'company':
+        return select(Company.id, Company.name, Company.address, Company.gst_number, Company.state_code,
+                      Company.logo_path, Company.created_at)
+    if entity == 'customer':
+        return select(Customer.id, Customer.name, Customer.address, Customer.phone, Customer.email,
+                      Customer.gst_number, Customer.state_code, Customer.is_guest, Customer.created_at)
+    if entity == 'product':
+        return select(Product.id, Product.name, Product.description, Product.hsn_code, Product.unit,
+                      Product.price, Product.gst_rate, Category.category_name.label('category'),
+                      Product.created_at).outerjoin(Category, Product.category_id == Category.id)
+    if entity == 'bill':
+        return select(Bill.id, Bill.bill_number, Bill.customer_id, Bill.bill_date, Bill.due_date, Bill.status,
+                      Bill.subtotal, Bill.discount_type, Bill.discount_value, Bill.discount_amount,
+                      Bill.cgst_amount, Bill.sgst_amount, Bill.igst_amount, Bill.total_amount, Bill.notes,
+                      Bill.created_at, Bill.updated_at)
+    if entity == 'bill_item':
+        return select(BillItem.id, BillItem.bill_id, BillItem.product_id, BillItem.product_name,
+                      BillItem.description, BillItem.hsn_code, BillItem.quantity, BillItem.unit, BillItem.rate,
+                      BillItem.amount, BillItem.gst_rate, BillItem.cgst_amount, BillItem.sgst_amount,
+                      BillItem.igst_amount)
+    raise ValueError(f"Unknown sync entity: {entity}")
+
+
+def mobile_value(value):
+    """Convert a column value to what the mobile SQLite column stores"""
+    if value is None or isinstance(value, (str, int, float)):
+        return int(value) if isinstance(value, bool) else value
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    # Decimal amounts go into REAL columns
+    return float(value)
+
+
+def _lock_feed(bind, executor):
+    if bind.dialect.name == 'postgresql':
+        executor.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': SYNC_LOCK_KEY})
+
+
+def record_bulk_changes(model, whereclause, operation='upsert', connection=None):
+    """
+    Add feed rows for records written with bulk statements, which skip the ORM events.
+
+    Args:
+        model: One of the SYNC_ENTITIES models, or Category (its products change)
+        whereclause: Selects the changed rows of the model's table
+        operation (str): 'upsert' or 'delete'
+        connection: Connection to write on (defaults to db.session)
+    """
+    executor = connection if connection is not None else db.session
+    bind = connection if connection is not None else db.session.get_bind()
+    if model is Category:
+        model, whereclause = Product, Product.category_id.in_(select(Category.id).where(whereclause))
+    _lock_feed(bind, executor)
+    executor.execute(insert(SyncChange).from_select(
+        ['entity', 'entity_id', 'operation', 'changed_at'],
+        select(literal(_ENTITY_NAMES[model]), model.id, literal(operation), literal(datetime.utcnow()))
+        .where(whereclause).order_by(model.id)))
+
+
+def changes_since(watermark, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of the change feed after a watermark.
+
+    A record changed several times within the page is sent once, with its
+    current values. Apply upserts table by table in MOBILE_TABLES order and
+    deletes in reverse order, then store the returned watermark.
+
+    Args:
+        watermark (int): Last SyncChange id the device applied (0 for everything)
+        limit (int): Feed rows read for the page
+
+    Returns:
+        dict: {'watermark': id, 'has_more': bool, 'changes': {table: {'upserts': [row, ...], 'deletes': [id, ...]}}}
+    """
+    rows = db.session.execute(
+        select(SyncChange.id, SyncChange.entity, SyncChange.entity_id, SyncChange.operation)
+        .where(SyncChange.id > watermark).order_by(SyncChange.id).limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest = {}
+    for row in rows:
+        latest[(row.entity, row.entity_id)] = row.operation
+
+    changes = {}
+    for entity, table in MOBILE_TABLES.items():
+        upserts = [entity_id for (name, entity_id), operation in latest.items()
+                   if name == entity and operation == 'upsert']
+        deletes = {entity_id for (name, entity_id), operation in latest.items()
+                   if name == entity and operation == 'delete'}
+        found = []
+        if upserts:
+            model = SYNC_ENTITIES[entity]
+            result = db.session.execute(mobile_statement(entity).where(model.id.in_(upserts)).order_by(model.id))
+            columns = list(result.keys())
+            found = [dict(zip(columns, map(mobile_value, row))) for row in result]
+            # Records deleted since the change was recorded
+            deletes.update(set(upserts) - {row['id'] for row in found})
+        if found or deletes:
+            changes[table] = {'upserts': found, 'deletes': sorted(deletes)}
+
+    return {
+        'watermark': rows[-1].id if rows else watermark,
+        'has_more': has_more,
+        'changes': changes,
+    }
+
+
+def latest_watermark():
+    """Id of the newest feed row (0 when the feed is empty)"""
+    return db.session.execute(select(func.max(SyncChange.id))).scalar() or 0
+
+
+def compact_sync_changes():
+    """
+    Delete feed rows superseded by a later row for the same record.
+
+    A device at any watermark still receives the latest change of every
+    record changed after it, so compaction is safe while devices sync.
+
+    Returns:
+        int: Rows deleted
+    """
+    later = aliased(SyncChange)
+    superseded = select(later.id).where(later.entity == SyncChange.entity,
+                                        later.entity_id == SyncChange.entity_id,
+                                        later.id > SyncChange.id).exists()
+    result = db.session.execute(delete(SyncChange).where(superseded))
+    db.session.commit()
+    return result.rowcount
+
+
+def _note_change(target, operation):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(PENDING_KEY, {})[(_ENTITY_NAMES[type(target)], target.id)] = operation
+
+
+def _after_write(mapper, connection, target):
+    _note_change(target, 'upsert')
+
+
+def _after_delete(mapper, connection, target):
+    _note_change(target, 'delete')
+
+
+def _write_pending_changes(session):
+    """before_commit: write the feed rows of the records changed in this transaction"""
+    # Commit runs this hook before its own flush, so flush now to collect pending changes
+    session.flush()
+    pending = session.info.pop(PENDING_KEY, None)
+    if not pending:
+        return
+    now = datetime.utcnow()
+    rows = [{'entity': entity, 'entity_id': entity_id, 'operation': operation, 'changed_at': now}
+            for (entity, entity_id), operation in sorted(pending.items()) if entity != 'category']
+    categories = [entity_id for (entity, entity_id), operation in pending.items()
+                  if entity == 'category' and operation == 'upsert']
+    if rows:
+        _lock_feed(session.get_bind(), session)
+        session.execute(insert(SyncChange), rows)
+    if categories:
+        # A renamed category changes the category column of its products
+        record_bulk_changes(Category, Category.id.in_(categories))
+
+
+def _discard_pending_changes(session, previous_transaction):
+    session.info.pop(PENDING_KEY, None)
+
+
+for _model in list(SYNC_ENTITIES.values()):
+    event.listen(_model, 'after_insert', _after_write)
+    event.listen(_model, 'after_update', _after_write)
+    event.listen(_model, 'after_delete', _after_delete)
+event.listen(Category, 'after_update', _after_write)
+event.listen(db.session, 'before_commit', _write_pending_changes)
+event.listen(db.session, 'after_soft_rollback', _discard_pending_changes)
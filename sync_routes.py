@@ -0,0 +1,134 @@
+"""
+Sync API for the mobile app: paged deltas from the change feed (sync_feed.py),
+the bootstrap snapshot for new devices (sync_snapshot.py), and device
+registration, invoice number blocks and offline bill uploads (offline_bills.py).
+"""
+
+from flask import Blueprint, request, jsonify, send_file, abort
+from flask_login import login_required, current_user
+from app import app
+from extensions import db
+from api_format import api_response
+from models import Device
+from offline_bills import (register_device, lease_number_block, upload_offline_bills, block_to_dict,
+                           OfflineBillError, UploadConflictError, DEFAULT_BLOCK_SIZE)
+from sync_feed import changes_since, latest_watermark, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from sync_snapshot import current_snapshot
+
+sync_bp = Blueprint('sync', __name__, url_prefix='/api/v1')
+
+
+@sync_bp.route('/sync')
+@login_required
+def sync_changes():
+    """
+    Changes since a watermark: GET /api/v1/sync?since=<watermark>&limit=<n>
+
+    Devices start from since=0 (or a snapshot's watermark), apply each page
+    and repeat with the returned watermark while has_more is true.
+    """
+    since = request.args.get('since', '0')
+    limit = request.args.get('limit', str(DEFAULT_PAGE_SIZE))
+    if not since.isdigit() or not limit.isdigit() or not 0 < int(limit) <= MAX_PAGE_SIZE:
+        return jsonify({'error': f"since must be a watermark and limit between 1 and {MAX_PAGE_SIZE}"}), 400
+
+    since = int(since)
+    latest = latest_watermark()
+    if since > latest:
+        # The server's feed was reset (a restored database); the device has to start over
+        return jsonify({'error': 'Watermark is ahead of the server', 'reset': True, 'latest': latest}), 409
+
+    page = changes_since(since, int(limit))
+    page['latest'] = latest
+    return api_response(page, compress=True)
+
+
+@sync_bp.route('/sync/snapshot')
+@login_required
+def sync_snapshot():
+    """
+    The gzip-compressed SQLite bootstrap file for a new device.
+
+    Its sync_state table holds the watermark to sync deltas from, which is
+    also sent in the X-Sync-Watermark header. Answers 503 with Retry-After
+    while the first snapshot is built.
+    """
+    snapshot = current_snapshot()
+    if snapshot is None:
+        # The first snapshot is being built in the background
+        response = jsonify({'error': 'The snapshot is being built; retry shortly'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+    path, watermark = snapshot
+    response = send_file(path, mimetype='application/gzip', as_attachment=True,
+                         download_name=f"gst-billing-snapshot-{watermark}.sqlite.gz",
+                         etag=f"snapshot-{watermark}", conditional=True)
+    response.headers['X-Sync-Watermark'] = str(watermark)
+    return response
+
+
+def _current_device(device_uid):
+    """The signed-in user's device, or 404"""
+    device = Device.query.filter_by(device_uid=device_uid, user_id=current_user.id).first()
+    if device is None:
+        abort(404)
+    return device
+
+
+@sync_bp.route('/devices', methods=['POST'])
+@login_required
+def register_device_api():
+    """Register a device: POST {"device_uid": "...", "name": "..."} (repeating it is harmless)"""
+    data = request.get_json(silent=True) or {}
+    try:
+        device = register_device(data.get('device_uid'), current_user, data.get('name'))
+    except OfflineBillError as e:
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+    return jsonify({
+        'device_uid': device.device_uid,
+        'name': device.name,
+        'blocks': [block_to_dict(block) for block in device.number_blocks],
+    })
+
+
+@sync_bp.route('/devices/<device_uid>/blocks', methods=['POST'])
+@login_required
+def lease_number_block_api(device_uid):
+    """Lease a block of invoice numbers: POST {"size": 100, "year": 2026} (both optional)"""
+    device = _current_device(device_uid)
+    data = request.get_json(silent=True) or {}
+    year = data.get('year')
+    if year is not None and (not isinstance(year, int) or not 2000 <= year <= 9999):
+        return jsonify({'error': 'year must be a four-digit year'}), 400
+    try:
+        block = lease_number_block(device, data.get('size', DEFAULT_BLOCK_SIZE), year)
+    except OfflineBillError as e:
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+    return jsonify(block_to_dict(block)), 201
+
+
+@sync_bp.route('/devices/<device_uid>/bills', methods=['POST'])
+@login_required
+def upload_offline_bills_api(device_uid):
+    """
+    Upload a batch of offline bills: POST {"bills": [...]} (format in offline_bills.py).
+
+    Responds with a result per bill, in order: created, duplicate (uploaded
+    before) or error. A 409 means nothing was saved and the batch can be
+    sent again as is.
+    """
+    device = _current_device(device_uid)
+    data = request.get_json(silent=True) or {}
+    try:
+        outcome = upload_offline_bills(device, data.get('bills'))
+    except UploadConflictError as e:
+        return jsonify({'error': str(e)}), 409
+    except OfflineBillError as e:
+        return jsonify({'error': str(e)}), 400
+    return api_response(outcome, compress=True)
+
+
+app.register_blueprint(sync_bp)
@@ -0,0 +1,272 @@
+"""
+Prebuilt SQLite snapshot for bootstrapping a new mobile device.
+
+Instead of paging through the whole change feed, a new device downloads
+one gzip-compressed SQLite file with the mobile app's tables
+(DatabaseService.createTables) holding the company, customers, products
+and the bills of the last SYNC_SNAPSHOT_BILL_DAYS days with their items,
+then syncs deltas from the watermark stored in its sync_state table. Older
+bill history is not sent to devices; a later change to an older bill
+reaches them through the feed like any other change.
+
+Rows are streamed from the database in batches and bulk inserted into the
+file. The snapshot is cached on disk. Once a company, customer or product
+change is recorded after its watermark, a rebuild is queued as a
+background job (jobs.py) and the previous file is served until the new one
+is ready: it is still correct, the device just replays more changes from
+the feed. Run ``db_manage.py build-snapshot`` periodically to have it ready
+before a device asks for it.
+"""
+
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select
+from extensions import db
+from models import SyncChange, Bill, BillItem, Job
+from sync_feed import SYNC_ENTITIES, MOBILE_TABLES, mobile_statement, mobile_value, latest_watermark
+from jobs import job_handler, enqueue_job
+
+# Entities copied into the snapshot, parents first
+SNAPSHOT_ENTITIES = ('company', 'customer', 'product', 'bill', 'bill_item')
+# Changes to these make the cached snapshot stale; bill changes are left to the feed
+REBUILD_ENTITIES = ('company', 'customer', 'product')
+SNAPSHOT_BATCH_SIZE = 5000
+# Days of bills copied into the snapshot (SYNC_SNAPSHOT_BILL_DAYS)
+DEFAULT_SNAPSHOT_BILL_DAYS = 90
+SNAPSHOT_JOB = 'sync_snapshot'
+SNAPSHOT_SCHEMA_VERSION = 1
+
+_SNAPSHOT_NAME = re.compile(r'^snapshot-(\d+)\.sqlite\.gz$')
+
+# The tables of DatabaseService.createTables, plus sync_state
+MOBILE_SCHEMA = """
+CREATE TABLE company (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  name TEXT NOT NULL,
+  address TEXT,
+  phone TEXT,
+  email TEXT,
+  gst_number TEXT,
+  state_code TEXT DEFAULT '27',
+  logo_path TEXT,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE customers (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  name TEXT NOT NULL,
+  address TEXT,
+  phone TEXT,
+  email TEXT,
+  gst_number TEXT,
+  state_code TEXT,
+  is_guest BOOLEAN DEFAULT 0,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE products (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  name TEXT NOT NULL,
+  description TEXT,
+  hsn_code TEXT,
+  unit TEXT DEFAULT 'Nos',
+  price REAL DEFAULT 0,
+  gst_rate REAL DEFAULT 18,
+  category TEXT,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE bills (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  bill_number TEXT NOT NULL UNIQUE,
+  customer_id INTEGER,
+  bill_date DATE NOT NULL,
+  due_date DATE,
+  status TEXT DEFAULT 'Draft',
+  subtotal REAL DEFAULT 0,
+  discount_type TEXT DEFAULT 'none',
+  discount_value REAL DEFAULT 0,
+  discount_amount REAL DEFAULT 0,
+  cgst_amount REAL DEFAULT 0,
+  sgst_amount REAL DEFAULT 0,
+  igst_amount REAL DEFAULT 0,
+  total_amount REAL DEFAULT 0,
+  notes TEXT,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  FOREIGN KEY (customer_id) REFERENCES customers (id)
+);
+CREATE TABLE bill_items (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  bill_id INTEGER,
+  product_id INTEGER,
+  product_name TEXT NOT NULL,
+  description TEXT,
+  hsn_code TEXT,
+  quantity REAL DEFAULT 1,
+  unit TEXT DEFAULT 'Nos',
+  rate REAL DEFAULT 0,
+  amount REAL DEFAULT 0,
+  gst_rate REAL DEFAULT 18,
+  cgst_amount REAL DEFAULT 0,
+  sgst_amount REAL DEFAULT 0,
+  igst_amount REAL DEFAULT 0,
+  FOREIGN KEY (bill_id) REFERENCES bills (id) ON DELETE CASCADE,
+  FOREIGN KEY (product_id) REFERENCES products (id)
+);
+CREATE TABLE bill_sequence (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  year INTEGER NOT NULL,
+  sequence_number INTEGER DEFAULT 0,
+  UNIQUE(year)
+);
+CREATE TABLE sync_state (
+  key TEXT PRIMARY KEY,
+  value TEXT
+);
+"""
+
+
+def snapshot_folder():
+    folder = os.path.abspath(current_app.config['SYNC_SNAPSHOT_FOLDER'])
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _cached_snapshots():
+    """[(watermark, path), ...] of the snapshot files on disk, newest first"""
+    folder = snapshot_folder()
+    found = []
+    for name in os.listdir(folder):
+        match = _SNAPSHOT_NAME.match(name)
+        if match:
+            found.append((int(match.group(1)), os.path.join(folder, name)))
+    return sorted(found, reverse=True)
+
+
+def snapshot_is_current(watermark):
+    """True when no company, customer or product change was recorded after the watermark"""
+    changed = db.session.execute(
+        select(SyncChange.id).where(SyncChange.id > watermark, SyncChange.entity.in_(REBUILD_ENTITIES)).limit(1)
+    ).first()
+    return changed is None
+
+
+def _snapshot_filters(bills_since):
+    """Entity -> where clause limiting the rows copied (bills to a recent window)"""
+    recent_bills = Bill.bill_date >= bills_since
+    return {
+        'bill': recent_bills,
+        'bill_item': BillItem.bill_id.in_(select(Bill.id).where(recent_bills)),
+    }
+
+
+def _copy_entity(target, entity, whereclause=None):
+    """Stream an entity's rows into the snapshot database; returns the number copied"""
+    model = SYNC_ENTITIES[entity]
+    statement = mobile_statement(entity)
+    if whereclause is not None:
+        statement = statement.where(whereclause)
+    result = db.session.execute(statement.order_by(model.id).execution_options(yield_per=SNAPSHOT_BATCH_SIZE))
+    columns = list(result.keys())
+    statement = (f"INSERT INTO {MOBILE_TABLES[entity]} ({', '.join(columns)}) "
+                 f"VALUES ({', '.join('?' * len(columns))})")
+    copied = 0
+    for rows in result.partitions():
+        target.executemany(statement, [tuple(map(mobile_value, row)) for row in rows])
+        copied += len(rows)
+    return copied
+
+
+def build_snapshot():
+    """
+    Build a snapshot of the current company, customers, products and recent bills.
+
+    The watermark is read first: changes committed while the rows are
+    copied may already be in the file, and the device applies them again
+    from the feed, which is harmless.
+
+    Returns:
+        tuple: (path, watermark, {table: rows})
+    """
+    watermark = latest_watermark()
+    bill_days = current_app.config.get('SYNC_SNAPSHOT_BILL_DAYS', DEFAULT_SNAPSHOT_BILL_DAYS)
+    filters = _snapshot_filters(datetime.utcnow().date() - timedelta(days=bill_days))
+    folder = snapshot_folder()
+    handle, database_path = tempfile.mkstemp(dir=folder, suffix='.sqlite.tmp')
+    os.close(handle)
+    counts = {}
+    try:
+        target = sqlite3.connect(database_path)
+        try:
+            target.execute('PRAGMA journal_mode = OFF')
+            target.execute('PRAGMA synchronous = OFF')
+            target.executescript(MOBILE_SCHEMA)
+            for entity in SNAPSHOT_ENTITIES:
+                counts[MOBILE_TABLES[entity]] = _copy_entity(target, entity, filters.get(entity))
+            target.executemany("INSERT INTO sync_state (key, value) VALUES (?, ?)", [
+                ('watermark', str(watermark)),
+                ('bill_days', str(bill_days)),
+                ('built_at', datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')),
+                ('schema_version', str(SNAPSHOT_SCHEMA_VERSION)),
+            ])
+            target.commit()
+        finally:
+            target.close()
+
+        compressed_path = database_path + '.gz'
+        with open(database_path, 'rb') as source, gzip.open(compressed_path, 'wb', compresslevel=6) as output:
+            shutil.copyfileobj(source, output, 1024 * 1024)
+        path = os.path.join(folder, f"snapshot-{watermark}.sqlite.gz")
+        # Concurrent builders each rename a complete file into place
+        os.replace(compressed_path, path)
+    finally:
+        os.remove(database_path)
+
+    for old_watermark, old_path in _cached_snapshots():
+        if old_watermark < watermark:
+            try:
+                os.remove(old_path)
+            except FileNotFoundError:
+                pass  # Removed by another builder
+    return path, watermark, counts
+
+
+def latest_snapshot():
+    """(path, watermark) of the newest snapshot on disk, or None"""
+    cached = _cached_snapshots()
+    return (cached[0][1], cached[0][0]) if cached else None
+
+
+def queue_snapshot_build():
+    """
+    Queue a snapshot build unless one is already queued or running.
+
+    Returns:
+        Job: The new job, or None
+    """
+    pending = db.session.execute(select(Job.id).where(
+        Job.kind == SNAPSHOT_JOB, Job.status.in_(('queued', 'running'))).limit(1)).first()
+    return enqueue_job(SNAPSHOT_JOB) if pending is None else None
+
+
+def current_snapshot():
+    """
+    The newest snapshot, queueing a rebuild when the data changed since it was built.
+
+    Returns:
+        tuple: (path, watermark), or None when no snapshot has been built yet
+    """
+    latest = latest_snapshot()
+    if latest is None or not snapshot_is_current(latest[1]):
+        queue_snapshot_build()
+    return latest
+
+
+@job_handler(SNAPSHOT_JOB, label='Mobile sync snapshot', max_attempts=2)
+def run_snapshot_build(job):
+    path, watermark, counts = build_snapshot()
+    return {'watermark': watermark, 'counts': counts}
@@ -0,0 +1,256 @@
+"""
+GST summary reporting backed by materialized daily aggregates.
+
+TaxDailyAggregate holds one row per bill date, HSN code, GST rate, unit,
+place of supply and B2B/B2C flag, built from the stored BillTaxSummary rows.
+Reports for any period sum these rows instead of scanning bill items, so a
+yearly HSN or rate-wise summary touches at most a few thousand rows.
+
+The aggregates are kept current incrementally: session events record the
+bill dates touched by each transaction and, just before commit, only those
+days are rebuilt. A customer's GSTIN and state decide the B2B flag and place
+of supply of all its bills, so changing them marks the dates of that
+customer's bills; changing the company's state rebuilds everything. Bulk
+writes that skip the ORM events call ``mark_customers_dirty`` themselves.
+``rebuild_tax_aggregates`` recomputes a whole period (used
+for the initial backfill and by ``db_manage.py refresh-aggregates``).
+"""
+
+import io
+from datetime import timedelta
+from itertools import chain
+from sqlalchemy import select, delete, insert, func, case, and_, true, event, inspect
+from extensions import db
+from models import Bill, BillTaxSummary, Customer, Company, TaxDailyAggregate
+
+# Bills with these statuses are excluded from tax reports
+EXCLUDED_STATUSES = ('Cancelled',)
+
+# session.info key holding the bill dates touched since the last commit
+DIRTY_DATES_KEY = 'tax_aggregate_dirty_dates'
+# session.info flag set when the whole table must be rebuilt at commit
+REBUILD_ALL_KEY = 'tax_aggregate_rebuild_all'
+
+AMOUNT_COLUMNS = ('quantity', 'taxable_amount', 'cgst_amount', 'sgst_amount', 'igst_amount')
+
+# Report groupings: name -> aggregate columns to group by
+GROUPINGS = {
+    'hsn': ('hsn_code', 'unit', 'gst_rate'),
+    'rate': ('gst_rate',),
+    'state': ('state_code', 'gst_rate'),
+    'supply_type': ('is_b2b', 'gst_rate'),
+}
+
+
+def _aggregate_source(company_state):
+    """Select BillTaxSummary rows grouped into TaxDailyAggregate keys"""
+    state_code = func.coalesce(func.nullif(Customer.state_code, ''), company_state)
+    is_b2b = case((and_(Customer.gst_number.isnot(None), Customer.gst_number != ''), True), else_=False)
+    return select(
+        Bill.bill_date,
+        BillTaxSummary.hsn_code,
+        BillTaxSummary.gst_rate,
+        BillTaxSummary.unit,
+        state_code.label('state_code'),
+        is_b2b.label('is_b2b'),
+        func.sum(BillTaxSummary.quantity),
+        func.sum(BillTaxSummary.taxable_amount),
+        func.sum(BillTaxSummary.cgst_amount),
+        func.sum(BillTaxSummary.sgst_amount),
+        func.sum(BillTaxSummary.igst_amount),
+    ).select_from(BillTaxSummary) \
+        .join(Bill, BillTaxSummary.bill_id == Bill.id) \
+        .join(Customer, Bill.customer_id == Customer.id) \
+        .where(Bill.status.notin_(EXCLUDED_STATUSES)) \
+        .group_by(Bill.bill_date, BillTaxSummary.hsn_code, BillTaxSummary.gst_rate,
+                  BillTaxSummary.unit, state_code, is_b2b)
+
+
+def _rebuild(session, date_filter_aggregate, date_filter_bill):
+    company_state = session.execute(select(Company.state_code).limit(1)).scalar()
+    session.execute(delete(TaxDailyAggregate).where(date_filter_aggregate))
+    source = _aggregate_source(company_state).where(date_filter_bill)
+    session.execute(insert(TaxDailyAggregate).from_select(
+        ['bill_date', 'hsn_code', 'gst_rate', 'unit', 'state_code', 'is_b2b'] + list(AMOUNT_COLUMNS),
+        source))
+
+
+def refresh_tax_aggregates(dates, session=None):
+    """
+    Rebuild the aggregates for specific bill dates.
+
+    Args:
+        dates (iterable): Bill dates whose aggregate rows should be recomputed
+        session: Session to run in (defaults to db.session)
+    """
+    dates = sorted(set(dates))
+    if not dates:
+        return
+    session = session or db.session
+    _rebuild(session, TaxDailyAggregate.bill_date.in_(dates), Bill.bill_date.in_(dates))
+
+
+def mark_customers_dirty(customer_ids, session=None):
+    """
+    Mark the bill dates of customers whose GSTIN or state changed, to be
+    rebuilt at the next commit.
+
+    Args:
+        customer_ids (iterable): Ids of the changed customers
+        session: Session to run in (defaults to db.session)
+    """
+    customer_ids = set(customer_ids)
+    if not customer_ids:
+        return
+    session = session or db.session
+    dates = session.info.setdefault(DIRTY_DATES_KEY, set())
+    dates.update(session.execute(
+        select(Bill.bill_date).where(Bill.customer_id.in_(customer_ids)).distinct()).scalars())
+
+
+def rebuild_tax_aggregates(start_date=None, end_date=None, chunk_days=31):
+    """
+    Rebuild the aggregates for a period, one chunk of days per statement.
+
+    Args:
+        start_date (date): First day to rebuild (defaults to the earliest bill)
+        end_date (date): Last day to rebuild (defaults to the latest bill)
+        chunk_days (int): Days rebuilt per delete/insert round
+
+    Returns:
+        int: Number of aggregate rows in the rebuilt period
+    """
+    if start_date is None or end_date is None:
+        first, last = db.session.execute(select(func.min(Bill.bill_date), func.max(Bill.bill_date))).one()
+        start_date = start_date or first
+        end_date = end_date or last
+    if start_date is None or end_date is None:
+        return 0
+
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end_date)
+        _rebuild(db.session,
+                 TaxDailyAggregate.bill_date.between(chunk_start, chunk_end),
+                 Bill.bill_date.between(chunk_start, chunk_end))
+        db.session.commit()
+        chunk_start = chunk_end + timedelta(days=1)
+
+    return db.session.execute(select(func.count(TaxDailyAggregate.id)).where(
+        TaxDailyAggregate.bill_date.between(start_date, end_date))).scalar()
+
+
+def gst_summary(start_date, end_date, group_by='hsn', supply_type=None, state_code=None):
+    """
+    Summarize GST for a period from the daily aggregates.
+
+    Args:
+        start_date (date): First bill date (inclusive)
+        end_date (date): Last bill date (inclusive)
+        group_by (str): One of GROUPINGS ('hsn', 'rate', 'state', 'supply_type')
+        supply_type (str): 'b2b' or 'b2c' to restrict by customer type
+        state_code (str): Restrict to one place of supply
+
+    Returns:
+        list: Rows with the grouping columns followed by AMOUNT_COLUMNS
+    """
+    keys = [getattr(TaxDailyAggregate, name) for name in GROUPINGS[group_by]]
+    amounts = [func.sum(getattr(TaxDailyAggregate, name)).label(name) for name in AMOUNT_COLUMNS]
+
+    stmt = select(*keys, *amounts).where(TaxDailyAggregate.bill_date.between(start_date, end_date))
+    if supply_type in ('b2b', 'b2c'):
+        stmt = stmt.where(TaxDailyAggregate.is_b2b.is_(supply_type == 'b2b'))
+    if state_code:
+        stmt = stmt.where(TaxDailyAggregate.state_code == state_code)
+
+    return db.session.execute(stmt.group_by(*keys).order_by(*keys)).all()
+
+
+def export_gst_summary_excel(rows, group_by):
+    """
+    Write summary rows to an in-memory Excel workbook.
+
+    Returns:
+        BytesIO: The workbook, positioned at the start
+    """
+    import openpyxl
+    from openpyxl.styles import Font
+
+    headers = {
+        'hsn_code': 'HSN', 'unit': 'UQC', 'gst_rate': 'GST Rate (%)', 'state_code': 'Place of Supply',
+        'is_b2b': 'Supply Type', 'quantity': 'Total Quantity', 'taxable_amount': 'Taxable Value',
+        'cgst_amount': 'CGST', 'sgst_amount': 'SGST', 'igst_amount': 'IGST',
+    }
+    columns = list(GROUPINGS[group_by]) + list(AMOUNT_COLUMNS)
+
+    # Write-only mode streams rows instead of building a cell grid in memory
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title="GST Summary")
+    header_row = []
+    for column in columns + ['total_tax']:
+        cell = openpyxl.cell.WriteOnlyCell(ws, value=headers.get(column, 'Total Tax'))
+        cell.font = Font(bold=True)
+        header_row.append(cell)
+    ws.append(header_row)
+
+    for row in rows:
+        values = []
+        for column in columns:
+            value = getattr(row, column)
+            if column == 'is_b2b':
+                value = 'B2B' if value else 'B2C'
+            elif column in AMOUNT_COLUMNS or column == 'gst_rate':
+                value = float(value or 0)
+            values.append(value)
+        values.append(float((row.cgst_amount or 0) + (row.sgst_amount or 0) + (row.igst_amount or 0)))
+        ws.append(values)
+
+    output = io.BytesIO()
+    wb.save(output)
+    output.seek(0)
+    return output
+
+
+def _collect_dirty_dates(session, flush_context, instances):
+    """before_flush: remember the bill dates affected by pending changes"""
+    dates = session.info.setdefault(DIRTY_DATES_KEY, set())
+    customer_ids = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Bill):
+            if obj.bill_date:
+                dates.add(obj.bill_date)
+            # A moved bill also changes the day it was moved away from
+            dates.update(d for d in inspect(obj).attrs.bill_date.history.deleted if d)
+        elif isinstance(obj, BillTaxSummary) and obj.bill is not None and obj.bill.bill_date:
+            dates.add(obj.bill.bill_date)
+        elif isinstance(obj, Customer) and obj.id is not None and obj not in session.new:
+            attrs = inspect(obj).attrs
+            if attrs.gst_number.history.has_changes() or attrs.state_code.history.has_changes():
+                customer_ids.add(obj.id)
+        elif isinstance(obj, Company):
+            # The company's state is the place of supply of customers without one
+            if obj in session.new or obj in session.deleted or inspect(obj).attrs.state_code.history.has_changes():
+                session.info[REBUILD_ALL_KEY] = True
+    # Runs inside the flush, so the query does not autoflush
+    mark_customers_dirty(customer_ids, session)
+
+
+def _refresh_dirty_dates(session):
+    """before_commit: rebuild the aggregates of the days touched in this transaction"""
+    # Commit runs this hook before its own flush, so flush now to collect pending changes
+    session.flush()
+    dates = session.info.pop(DIRTY_DATES_KEY, None)
+    if session.info.pop(REBUILD_ALL_KEY, False):
+        _rebuild(session, true(), true())
+    elif dates:
+        refresh_tax_aggregates(dates, session)
+
+
+def _discard_dirty_dates(session, previous_transaction):
+    session.info.pop(DIRTY_DATES_KEY, None)
+    session.info.pop(REBUILD_ALL_KEY, None)
+
+
+event.listen(db.session, 'before_flush', _collect_dirty_dates)
+event.listen(db.session, 'before_commit', _refresh_dirty_dates)
+event.listen(db.session, 'after_soft_rollback', _discard_dirty_dates)
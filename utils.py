@@ -1,5 +1,8 @@
 import os
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
 from werkzeug.utils import secure_filename
+from gstin import is_valid_gstin
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
@@ -28,79 +31,102 @@ def get_state_name(state_code):
     return states.get(state_code, 'Unknown')
 
 def validate_gst_number(gst_number):
-    """Validate GST number format"""
-    if not gst_number or len(gst_number) != 15:
-        return False
-    
-    # GST format: 2 digits state code + 10 chars PAN + 1 char entity + 1 char checksum + 1 char 'Z' + 1 char
-    import re
-    pattern = r'^[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z]{1}[1-9A-Z]{1}[Z]{1}[0-9A-Z]{1}$'
-    return bool(re.match(pattern, gst_number))
+    """Validate GST number format, state code and check digit"""
+    # GST format: 2 digits state code + 10 chars PAN + 1 char entity + 'Z' + 1 check char
+    return is_valid_gstin(gst_number)
+
+# Words for 0-999, built once at import; index 0 is the empty string
+_ONES = ["", "One", "Two", "Three", "Four", "Five", "Six", "Seven", "Eight", "Nine",
+         "Ten", "Eleven", "Twelve", "Thirteen", "Fourteen", "Fifteen", "Sixteen", "Seventeen",
+         "Eighteen", "Nineteen"]
+_TENS = ["", "", "Twenty", "Thirty", "Forty", "Fifty", "Sixty", "Seventy", "Eighty", "Ninety"]
+_BELOW_HUNDRED = tuple(_ONES[n] if n < 20 else f"{_TENS[n // 10]} {_ONES[n % 10]}".strip()
+                       for n in range(100))
+_BELOW_THOUSAND = tuple(f"{_ONES[n // 100]} Hundred {_BELOW_HUNDRED[n % 100]}".strip() if n >= 100
+                        else _BELOW_HUNDRED[n]
+                        for n in range(1000))
+
+# Indian place values, largest first: (divisor, name)
+_INDIAN_SCALES = ((10000000, "Crore"), (100000, "Lakh"), (1000, "Thousand"))
+
+# Bound on each memoized formatter's cache (distinct amounts remembered)
+FORMAT_CACHE_SIZE = 4096
+
+_PAISE = Decimal('0.01')
+
+
+def _to_paise(amount):
+    """Convert an amount (Decimal, int, float or str) to integer paise, rounding half up"""
+    if amount is None:
+        return 0
+    if isinstance(amount, int):
+        return amount * 100
+    if not isinstance(amount, Decimal):
+        # str() keeps floats like 0.1 from turning into 0.1000000000000000055...
+        amount = Decimal(str(amount))
+    return int(amount.quantize(_PAISE, rounding=ROUND_HALF_UP) * 100)
+
+
+def _integer_words(number):
+    """Words for a non-negative integer using crore/lakh/thousand grouping"""
+    if number < 1000:
+        return _BELOW_THOUSAND[number]
+    parts = []
+    for divisor, name in _INDIAN_SCALES:
+        if number >= divisor:
+            count, number = divmod(number, divisor)
+            # Amounts of a thousand crore and above repeat the grouping for the crore count
+            parts.append(f"{_integer_words(count)} {name}")
+    if number:
+        parts.append(_BELOW_THOUSAND[number])
+    return " ".join(parts)
+
+
+def _indian_digits(number):
+    """Digits of a non-negative integer grouped as 12,34,567"""
+    if number < 1000:
+        return str(number)
+    head, tail = divmod(number, 1000)
+    groups = [f"{tail:03d}"]
+    while head >= 100:
+        head, pair = divmod(head, 100)
+        groups.append(f"{pair:02d}")
+    groups.append(str(head))
+    return ",".join(reversed(groups))
+
+
+# The public formatters are memoized on the amount itself, so repeated renders of
+# the same bill skip the Decimal conversion as well as the formatting.
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def format_indian_number(amount, symbol=""):
+    """Format an amount with Indian digit grouping, e.g. 12,34,567.89"""
+    paise = _to_paise(amount)
+    sign = "-" if paise < 0 else ""
+    rupees, paise = divmod(abs(paise), 100)
+    return f"{sign}{symbol}{_indian_digits(rupees)}.{paise:02d}"
+
 
 def format_currency(amount):
     """Format currency in Indian style"""
-    if amount is None:
-        return "₹0.00"
-    
-    amount = float(amount)
-    return f"₹{amount:,.2f}"
+    return format_indian_number(amount, "₹")
 
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
 def number_to_words(amount):
     """Convert number to words (Indian format)"""
-    if amount is None or amount == 0:
-        return "Zero"
-    
-    # Convert to int for whole number processing
-    amount = int(float(amount))
-    
-    # Number to words mapping
-    ones = ["", "One", "Two", "Three", "Four", "Five", "Six", "Seven", "Eight", "Nine"]
-    teens = ["Ten", "Eleven", "Twelve", "Thirteen", "Fourteen", "Fifteen", "Sixteen", "Seventeen", "Eighteen", "Nineteen"]
-    tens = ["", "", "Twenty", "Thirty", "Forty", "Fifty", "Sixty", "Seventy", "Eighty", "Ninety"]
-    
-    def convert_hundreds(num):
-        result = ""
-        if num >= 100:
-            result += ones[num // 100] + " Hundred "
-            num %= 100
-        
-        if num >= 20:
-            result += tens[num // 10] + " "
-            num %= 10
-        elif num >= 10:
-            result += teens[num - 10] + " "
-            num = 0
-        
-        if num > 0:
-            result += ones[num] + " "
-        
-        return result.strip()
-    
-    if amount == 0:
+    if amount is None:
         return "Zero"
-    
-    result = ""
-    
-    # Handle crores (10,000,000)
-    if amount >= 10000000:
-        crores = amount // 10000000
-        result += convert_hundreds(crores) + " Crore "
-        amount %= 10000000
-    
-    # Handle lakhs (100,000)
-    if amount >= 100000:
-        lakhs = amount // 100000
-        result += convert_hundreds(lakhs) + " Lakh "
-        amount %= 100000
-    
-    # Handle thousands
-    if amount >= 1000:
-        thousands = amount // 1000
-        result += convert_hundreds(thousands) + " Thousand "
-        amount %= 1000
-    
-    # Handle remaining hundreds
-    if amount > 0:
-        result += convert_hundreds(amount)
-    
-    return result.strip()
+    # Whole rupees only, truncated as before; see amount_in_words for paise
+    rupees = abs(int(amount if isinstance(amount, (int, Decimal)) else Decimal(str(amount))))
+    return _integer_words(rupees) if rupees else "Zero"
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def amount_in_words(amount):
+    """Convert an amount to words including paise, e.g. 'Ten Rupees and Fifty Paise Only'"""
+    rupees, paise = divmod(abs(_to_paise(amount)), 100)
+    if not rupees and paise:
+        return f"{_BELOW_HUNDRED[paise]} Paise Only"
+    words = f"{_integer_words(rupees) if rupees else 'Zero'} {'Rupee' if rupees == 1 else 'Rupees'}"
+    if paise:
+        words += f" and {_BELOW_HUNDRED[paise]} Paise"
+    return words + " Only"